@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+ CERN@school - Data File Reader Benchmark
+
+ Compares the throughput of the whole-file (NumPy) data file parser
+ with the original line-by-line parser. See the README.md file for
+ more information.
+
+"""
+
+# Import the code needed to manage files.
+import os, glob
+
+#...for parsing the arguments.
+import argparse
+
+#...for the timing.
+import timeit
+
+#...for processing the file format.
+from cernatschool.helpers import getFormat
+
+#...for the data file readers.
+from cernatschool.readers import ASCII_FORMATS, parseAsciiBuffer, parseAsciiLines, getPixelMap
+
+
+if __name__ == "__main__":
+
+    print("*")
+    print("*==========================================*")
+    print("* CERN@school - data file reader benchmark *")
+    print("*==========================================*")
+
+    # Get the datafile path from the command line.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputPath", help="Path to the input dataset", nargs="?", default="testdata/crookes")
+    parser.add_argument("-n", "--repeats", help="The number of times to parse each file", type=int, default=20)
+    parser.add_argument("--rows", help="The number of rows in each frame", type=int, default=256)
+    parser.add_argument("--cols", help="The number of columns in each frame", type=int, default=256)
+    args = parser.parse_args()
+
+    ## The data files (i.e. everything that isn't a DSC file).
+    datafilenames = [fn for fn in sorted(glob.glob(os.path.join(args.inputPath, "*"))) if not fn.endswith(".dsc")]
+
+    print("*")
+    print("* Input path          : '%s'" % (args.inputPath))
+    print("* Number of files     : %d" % (len(datafilenames)))
+    print("* Repeats             : %d" % (args.repeats))
+    print("*")
+
+    ## The contents of each file, read up front so only the parsing is timed.
+    bufs = []
+
+    for fn in datafilenames:
+
+        fmt = getFormat(fn)
+
+        if fmt not in ASCII_FORMATS:
+            print("* Skipping '%s' (format %d)." % (os.path.basename(fn), fmt))
+            continue
+
+        with open(fn, "r") as f:
+            bufs.append((fmt, f.read()))
+
+    if len(bufs) == 0:
+        raise IOError("NO_ASCII_FILES")
+
+    ## The total size of the data [MB].
+    mb = sum(len(buf) for fmt, buf in bufs) / 1.0e6
+
+    ## The total number of lines.
+    n_lines = sum(buf.count("\n") for fmt, buf in bufs)
+
+    # Check that both parsers give the same pixel maps.
+    for fmt, buf in bufs:
+        if getPixelMap(*parseAsciiBuffer(buf, fmt, args.rows, args.cols)) != \
+           parseAsciiLines(buf.splitlines(True), fmt, args.rows, args.cols):
+            raise IOError("PIXEL_MAP_MISMATCH")
+
+    ## The time taken by each parser for all of the files [s].
+    times = {}
+
+    times["lines"] = timeit.timeit(lambda: [parseAsciiLines(buf.splitlines(True), fmt, args.rows, args.cols) \
+        for fmt, buf in bufs], number=args.repeats) / args.repeats
+
+    times["numpy"] = timeit.timeit(lambda: [parseAsciiBuffer(buf, fmt, args.rows, args.cols) \
+        for fmt, buf in bufs], number=args.repeats) / args.repeats
+
+    times["numpy + map"] = timeit.timeit(lambda: [getPixelMap(*parseAsciiBuffer(buf, fmt, args.rows, args.cols)) \
+        for fmt, buf in bufs], number=args.repeats) / args.repeats
+
+    print("* %-18s: %10s %10s %12s %8s" % ("Parser", "Time [ms]", "MB/s", "Lines/s", "Speed-up"))
+    for name in ["lines", "numpy", "numpy + map"]:
+        print("* %-18s: %10.3f %10.2f %12.0f %8.1f" % \
+            (name, times[name] * 1000.0, mb / times[name], n_lines / times[name], times["lines"] / times[name]))
+    print("*")
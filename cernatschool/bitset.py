@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bitset (packed occupancy) frames for Timepix data.
+
+A frame's hit/no-hit occupancy is packed into 64-bit words, one bit per
+pixel, with each row of the frame taking cols/64 words (so a 256x256
+frame is 8 KiB). The first pixel of each word is its most significant
+bit. Neighbour finding, dilation, erosion and flood filling are then
+done with whole-array shifts, ORs and ANDs of the words, rather than
+pixel by pixel. The counts are kept alongside in a sparse array of the
+sorted hit X values (X = y*cols + x) and their count values.
+"""
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+## The number of pixels (bits) in each word.
+WORD_BITS = 64
+
+## The word data type.
+WORD_DTYPE = np.uint64
+
+## The (dx, dy) offsets of the neighbouring pixels for each connectivity.
+BITSET_NEIGHBOURS = {
+    4 : [(-1, 0), (1, 0), (0, -1), (0, 1)],
+    8 : [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1)],
+    }
+
+def packBits(Xs, rows, cols):
+    """
+    Pack the hit pixels into a bitset.
+
+    @param [in] Xs The pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame (a multiple of WORD_BITS).
+    @returns The (rows x cols/WORD_BITS) array of words.
+    """
+
+    if cols % WORD_BITS != 0:
+        raise IOError("BAD_BITSET_WIDTH")
+
+    ## The occupancy of each pixel.
+    occupancy = np.zeros(rows * cols, dtype=np.bool_)
+    occupancy[Xs] = True
+
+    # Pack into bytes, then join each eight bytes into a (big-endian) word.
+    return np.packbits(occupancy.reshape(rows, cols), axis=1).view(">u8").astype(WORD_DTYPE)
+
+def unpackBits(bits):
+    """
+    Get the sorted X values of the pixels set in a bitset.
+
+    @param [in] bits The bitset words.
+    @returns The sorted pixel X values.
+    """
+    return np.flatnonzero(np.unpackbits(bits.astype(">u8").view(np.uint8), axis=1))
+
+def countBits(bits):
+    """ The number of pixels set in a bitset. """
+    return int(np.unpackbits(bits.astype(">u8").view(np.uint8)).sum())
+
+def shiftBits(bits, dx, dy):
+    """
+    Move the pixels of a bitset by (dx, dy).
+
+    Pixels moved beyond the edge of the sensor are lost and the pixels
+    moved in from beyond the edge are empty.
+
+    @param [in] bits The bitset words.
+    @param [in] dx The x shift [pixels] (-WORD_BITS < dx < WORD_BITS).
+    @param [in] dy The y shift [pixels].
+    @returns The shifted bitset.
+    """
+
+    shifted = np.zeros_like(bits)
+
+    # Move the rows.
+    if dy > 0:
+        shifted[dy:] = bits[:-dy]
+    elif dy < 0:
+        shifted[:dy] = bits[-dy:]
+    else:
+        shifted[:] = bits
+
+    if dx == 0:
+        return shifted
+
+    ## The number of bits to shift by, and to carry into the next word.
+    n = WORD_DTYPE(abs(dx)); carry = WORD_DTYPE(WORD_BITS - abs(dx))
+
+    # Moving in x shifts the bits within each word, carrying the bits
+    # that fall off the end into the neighbouring word.
+    moved = np.empty_like(shifted)
+    if dx > 0:
+        moved[:] = shifted >> n
+        moved[:, 1:] |= shifted[:, :-1] << carry
+    else:
+        moved[:] = shifted << n
+        moved[:, :-1] |= shifted[:, 1:] >> carry
+
+    return moved
+
+def dilateBits(bits, connectivity=8):
+    """ Add each pixel's neighbours to a bitset. """
+    dilated = bits.copy()
+    for dx, dy in BITSET_NEIGHBOURS[connectivity]:
+        dilated |= shiftBits(bits, dx, dy)
+    return dilated
+
+def erodeBits(bits, connectivity=8):
+    """ Keep only the pixels whose neighbours are all set (beyond the sensor counts as unset). """
+    eroded = bits.copy()
+    for dx, dy in BITSET_NEIGHBOURS[connectivity]:
+        eroded &= shiftBits(bits, -dx, -dy)
+    return eroded
+
+def floodFillBits(seed, bits, connectivity=8):
+    """
+    Find the pixels of a bitset connected to the seed pixel(s).
+
+    The fill is dilated and masked with the bitset until it stops
+    growing, working only on the band of rows it could have reached.
+
+    @param [in] seed The bitset of the seed pixel(s).
+    @param [in] bits The bitset to fill.
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns The bitset of the connected pixels.
+    """
+
+    fill = seed & bits
+
+    ## The rows containing the fill.
+    filled_rows = np.flatnonzero(fill.any(axis=1))
+
+    if len(filled_rows) == 0:
+        return fill
+
+    ## The band of rows being worked on.
+    r0 = filled_rows[0]; r1 = filled_rows[-1] + 1
+
+    while True:
+        r0 = max(r0 - 1, 0); r1 = min(r1 + 1, len(bits))
+
+        grown = dilateBits(fill[r0:r1], connectivity) & bits[r0:r1]
+
+        if np.array_equal(grown, fill[r0:r1]):
+            return fill
+
+        fill[r0:r1] = grown
+
+def countEdgeBits(Xs, rows, cols):
+    """
+    Count the edge pixels of a single cluster.
+
+    An edge pixel is one without all eight neighbours hit (beyond the
+    sensor counts as not hit). Only the band of rows the cluster covers,
+    plus one row either side, is packed.
+
+    @param [in] Xs The cluster's sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns The number of edge pixels.
+    """
+
+    if len(Xs) == 0:
+        return 0
+
+    ## The band of rows to pack.
+    y0 = max(Xs[0] // cols - 1, 0); y1 = min(Xs[-1] // cols + 2, rows)
+
+    bits = packBits(Xs - (y0 * cols), y1 - y0, cols)
+
+    return countBits(bits & ~erodeBits(bits))
+
+def labelBits(Xs, rows, cols, connectivity=8):
+    """
+    Label the connected clusters by flood filling a bitset of the frame.
+
+    Each cluster is filled from its first unlabelled pixel (in raster
+    order) and then removed from the bitset.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns The label (0 ... n-1) of each hit, in raster order of the clusters.
+    """
+
+    ## The pixels still to be labelled.
+    remaining = packBits(Xs, rows, cols)
+
+    ## The label of each hit.
+    labels = np.empty(len(Xs), dtype=np.int64)
+
+    ## The number of clusters found so far.
+    n = 0
+
+    ## A bitset for the seed pixels.
+    seed = np.zeros_like(remaining)
+
+    while len(Xs) > 0:
+
+        ## The first remaining pixel (the word's most significant set bit).
+        words = np.flatnonzero(remaining.ravel())
+        if len(words) == 0:
+            break
+        w = words[0]
+        word = int(remaining.ravel()[w])
+        bit = WORD_BITS - word.bit_length()
+
+        seed.ravel()[w] = WORD_DTYPE(1 << (WORD_BITS - 1 - bit))
+
+        fill = floodFillBits(seed, remaining, connectivity)
+
+        labels[np.searchsorted(Xs, unpackBits(fill))] = n
+
+        remaining &= ~fill
+
+        seed.ravel()[w] = 0
+
+        n += 1
+
+    lg.debug(" * Bitset labelling found %d clusters." % (n))
+
+    return labels
+
+class BitsetFrame:
+    """
+    A Timepix frame held as a bitset, with the counts in a sparse array.
+
+    @param [in] pixelmap The frame's pixels {X:C} (e.g. from DscFile.getPixelMap()).
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame (a multiple of WORD_BITS).
+    """
+
+    def __init__(self, pixelmap, rows=256, cols=256):
+        """ Constructor. """
+
+        ## The number of rows in the frame.
+        self.__rows = rows
+
+        ## The number of columns in the frame.
+        self.__cols = cols
+
+        ## The hit X values (unsorted).
+        Xs = np.fromiter(pixelmap.iterkeys(), dtype=np.int64, count=len(pixelmap))
+
+        ## The order that sorts the X values.
+        order = np.argsort(Xs, kind="mergesort")
+
+        ## The sorted hit X values.
+        self.__Xs = Xs[order]
+
+        ## The count of each hit (the sparse count array).
+        self.__Cs = np.fromiter(pixelmap.itervalues(), dtype=np.int64, count=len(pixelmap))[order]
+
+        ## The occupancy bitset.
+        self.__bits = packBits(self.__Xs, rows, cols)
+
+    def getRows(self):
+        return self.__rows
+
+    def getCols(self):
+        return self.__cols
+
+    def getBits(self):
+        return self.__bits
+
+    def getHitArrays(self):
+        return self.__Xs, self.__Cs
+
+    def getOccupancy(self):
+        return len(self.__Xs)
+
+    def isHit(self, X):
+        """ Is the pixel X hit? """
+        x = X % self.__cols; y = X // self.__cols
+        return bool(int(self.__bits[y, x // WORD_BITS]) >> (WORD_BITS - 1 - (x % WORD_BITS)) & 1)
+
+    def getCount(self, X):
+        """ The count value of pixel X (0 if it isn't hit). """
+        i = np.searchsorted(self.__Xs, X)
+        if i < len(self.__Xs) and self.__Xs[i] == X:
+            return self.__Cs[i]
+        return 0
+
+    def getCounts(self, Xs):
+        """ The count values of the (sorted, hit) pixels Xs. """
+        return self.__Cs[np.searchsorted(self.__Xs, Xs)]
+
+    def getNeighbours(self, X, connectivity=8):
+        """ The sorted X values of the hit neighbours of pixel X. """
+        seed = packBits([X], self.__rows, self.__cols)
+        return unpackBits(dilateBits(seed, connectivity) & ~seed & self.__bits)
+
+    def getIsolatedPixels(self, connectivity=8):
+        """ The sorted X values of the hits with no hit neighbours. """
+        neighbours = np.zeros_like(self.__bits)
+        for dx, dy in BITSET_NEIGHBOURS[connectivity]:
+            neighbours |= shiftBits(self.__bits, dx, dy)
+        return unpackBits(self.__bits & ~neighbours)
+
+    def dilate(self, connectivity=8):
+        return dilateBits(self.__bits, connectivity)
+
+    def erode(self, connectivity=8):
+        return erodeBits(self.__bits, connectivity)
+
+    def floodFill(self, X, connectivity=8):
+        """ The sorted X values of the cluster containing pixel X. """
+        return unpackBits(floodFillBits(packBits([X], self.__rows, self.__cols), self.__bits, connectivity))
+
+    def getEdgePixels(self):
+        """
+        The sorted X values of the edge pixels - the hits without all
+        eight neighbours hit (as used for the cluster inner fractions).
+        """
+        return unpackBits(self.__bits & ~erodeBits(self.__bits))
+
+    def getSensorEdgeHits(self):
+        """ The sorted X values of the hits on the edge of the sensor. """
+        border = np.zeros_like(self.__bits)
+        border[0] = ~WORD_DTYPE(0); border[-1] = ~WORD_DTYPE(0)
+        border[:, 0] |= WORD_DTYPE(1 << (WORD_BITS - 1)); border[:, -1] |= WORD_DTYPE(1)
+        return unpackBits(self.__bits & border)
+
+    def label(self, connectivity=8):
+        """ The cluster label of each hit (see labelBits). """
+        return labelBits(self.__Xs, self.__rows, self.__cols, connectivity)
@@ -11,11 +11,20 @@ import os, glob, inspect
 #...for the logging.
 import logging as lg
 
+#...for the MATH.
+import numpy as np
+
 #...for the data values.
 from datavals import *
 
 #...for processing the file format.
-from helpers import getFormat
+from helpers import getBufferFormat, getConsistentValue
+
+#...for reading each file with a single open.
+from readers import readFile, getBinaryFormat
+
+#...for the DSC headers.
+from dscheader import parseDscHeader
 
 #...for the DSC file wrapper class.
 from dsc import DscFile
@@ -23,10 +32,29 @@ from dsc import DscFile
 #...for the frames.
 from frame import Frame
 
-class Dataset:
-    """ Wrapper class for the CERN@school Timepix datasets. """
+#...for the batched clustering.
+from labelling import labelFrameStack
+
+#...for the hot pixel thresholds.
+from masks import HOT_PIXEL_FREQUENCY, HOT_PIXEL_MIN_FRAMES
 
-    def __init__(self, foldername):
+class Dataset:
+    """
+    Wrapper class for the CERN@school Timepix datasets.
+
+    @param [in] foldername The path of the dataset folder.
+    @param [in] headers A dscheader.DscHeaderCache (optional). DSC files
+                        with an up-to-date header in the cache aren't read.
+    @param [in] lazy Only read each data file when its frame is needed
+                     (see iterFrames)? Only the DSC files (named *.dsc)
+                     are read to begin with, and the data file formats
+                     are checked as the files are read. Otherwise (the
+                     default) every pixel map is read in the constructor
+                     and kept, so iterFrames can't bound the memory used -
+                     use lazy=True to stream over a large dataset.
+    """
+
+    def __init__(self, foldername, headers=None, lazy=False):
 
         # Check if the folder exists. If it doesn't, throw an exception.
         if not os.path.exists(foldername):
@@ -53,7 +81,25 @@ class Dataset:
         ## The datafile formats.
         self.datfileformats = {}
 
-        # Loop over the files found in the folder.
+        ## Are the data files only read when they're needed?
+        self.__lazy = lazy
+
+        ## The index of each data file in the list of files {filename:index}.
+        self.__dataindices = {}
+
+        ## The file system calls made to read each file {basename:{call:count}}.
+        self.__calls = {}
+
+        ## The data files waiting for their DSC files {filename:(index, contents, format)}.
+        pending = {}
+
+        ## The DSC file wrappers (unsorted).
+        dscfiles = []
+
+        # Loop over the files found in the folder. Each file is opened and
+        # read (or mapped) once, and the same contents are used to work out
+        # its format and then to process it. A data file is kept until its DSC file
+        # (which sorts straight after it) has been read.
         lg.debug("")
         lg.debug(" Files found in '%s':" % (foldername))
         lg.debug("")
@@ -64,34 +110,91 @@ class Dataset:
 
             lg.debug(" * '%s'" % (bn))
 
-            # If the "file" is a directory, raise an exception.
-            if os.path.isdir(fn):
-                raise IOError("CONTAINS_DIR")
+            if lazy and not bn.endswith(".dsc"):
+                # A data file - it's read (and its format found) when it's needed.
+                pending[fn] = (i, None, None)
+                continue
 
-            formatval = getFormat(fn)
+            ## The file system calls made reading the file.
+            calls = {}
 
-            ## If the file isn't recognised, raise an exception.
-            if formatval == 0:
-                lg.debug("'%s' is in an unrecognised format." % (bn))
-                raise IOError("BAD_FORMAT")
-            elif formatval > 0:
-                lg.debug(" *--> Adding '%s' ('%s' format) to the data files." \
-                    % (bn, DATA_FILE_TYPES[formatval]))
+            self.__calls[bn] = calls
 
-                self.datfilenames[i] = bn
+            ## The DSC header (if the file is a DSC file in the header cache).
+            header = None
 
-                self.datfileformats[i] = formatval
+            if headers is not None and headers.hasFile(fn):
+                st = os.stat(fn); calls["stat"] = 1
+                header = headers.getHeader(fn, st.st_size, st.st_mtime)
 
+            if header is not None:
+                lg.debug(" *--> Using the cached DSC header.")
+                buf = None
+                formatval = -1
             else:
-                lg.debug(" *--> Adding '%s' ('%s' format) to the DSC files." \
-                    % (bn, DATA_FILE_TYPES[formatval]))
+                # The data files are memory mapped, so that the binary
+                # formats can be parsed without copying them.
+                # (If the "file" is a directory, an exception is raised.)
+                buf, st = readFile(fn, calls, mapped=not bn.endswith(".dsc"))
+
+                lg.debug(" *--> Read %d bytes with %d file system calls (%s)." % \
+                    (len(buf), sum(calls.values()), ", ".join("%s: %d" % (k, v) for k, v in sorted(calls.iteritems()))))
+
+                formatval = getBufferFormat(buf)
+
+            if formatval != -1:
+                # A data file (or not yet recognised) - wait for the DSC file.
+                pending[fn] = (i, buf, formatval)
+                continue
+
+            lg.debug(" *--> Adding '%s' ('%s' format) to the DSC files." \
+                % (bn, DATA_FILE_TYPES[formatval]))
+
+            self.dscfilenames[i] = bn
+
+            if header is None:
+                header = parseDscHeader(buf[:])
+                if headers is not None:
+                    headers.setHeader(fn, st.st_size, st.st_mtime, header)
+
+            if fn[:-4] not in pending:
+                continue
+
+            ## The matching data file.
+            j, databuf, dataformat = pending.pop(fn[:-4])
 
-                self.dscfilenames[i] = bn
+            self.__dataindices[fn[:-4]] = j
+
+            if lazy and databuf is None:
+                self.datfilenames[j] = os.path.basename(fn[:-4])
+                dscfiles.append(DscFile(fn, buf, None, None, header, lazy=True))
+                continue
+
+            # Binary data files are recognised from the DSC file's type line.
+            if dataformat == 0:
+                try:
+                    dataformat = getBinaryFormat(len(databuf), header["typeline"])
+                except IOError:
+                    lg.debug(" Bad DSC type line!")
+
+            self.__addDataFile(j, fn[:-4], dataformat)
+
+            dscfiles.append(DscFile(fn, buf, databuf, dataformat, header))
+
+        # Any files left over are unrecognised, or data files without a DSC file.
+        for fn, (j, databuf, dataformat) in sorted(pending.iteritems()):
+            if lazy and databuf is None:
+                # Read the file after all, so that an unrecognised file
+                # gives the same error as for an eager dataset.
+                calls = {}; self.__calls[os.path.basename(fn)] = calls
+                databuf, st = readFile(fn, calls, mapped=True)
+                dataformat = getBufferFormat(databuf)
+            self.__addDataFile(j, fn, dataformat)
 
         lg.debug("")
 
-        # Check the consistency of the data file formats.
-        if not self.areFormatsConsistent():
+        # Check the consistency of the data file formats (if they're known yet).
+        if not (lazy and len(self.datfileformats) == 0) and not self.areFormatsConsistent():
             lg.debug(" The file formats are inconsistent!")
             raise IOError("FORMAT_MISMATCH")
 
@@ -100,14 +203,85 @@ class Dataset:
             lg.debug(" There are DSC files missing!")
             raise IOError("MISSING_DSC")
 
+        # Check that each DSC file has a matching data file.
+        if len(dscfiles) != len(self.dscfilenames):
+            raise IOError #("MISSING_DAT")
+
         lg.debug(" There are %d data files." % (self.getNumberOfDataFiles())); lg.debug("")
 
-        # Now process the DSC files to extract the information we need
-        # to build the data set information.
+        lg.debug(" Read %d files with %d file system calls (%.1f per file)." % \
+            (len(self.__calls), self.getNumberOfFileSystemCalls(), \
+            float(self.getNumberOfFileSystemCalls()) / max(len(self.__calls), 1)))
+        lg.debug("")
 
         ## The DSC file wrappers.
-        self.dscfiles = sorted([DscFile(foldername + "/" + fn) for fn in self.dscfilenames.values()])
+        self.dscfiles = sorted(dscfiles)
+
+    def __addDataFile(self, i, fn, formatval):
+        """ Add a data file, checking its format. """
+
+        ## The basename of the file.
+        bn = os.path.basename(fn)
+
+        ## If the file isn't recognised, raise an exception.
+        if formatval == 0:
+            lg.debug("'%s' is in an unrecognised format." % (bn))
+            raise IOError("BAD_FORMAT")
+
+        lg.debug(" *--> Adding '%s' ('%s' format) to the data files." \
+            % (bn, DATA_FILE_TYPES[formatval]))
+
+        self.datfilenames[i] = bn
+
+        self.datfileformats[i] = formatval
+
+    def __loadDataFile(self, df):
+        """ Read the data file of a lazy dataset's frame, checking its format. """
+
+        ## The file system calls made reading the file.
+        calls = self.__calls.setdefault(os.path.basename(df.getDataFilename()), {})
+
+        ## The index of the data file.
+        i = self.__dataindices[df.getDataFilename()]
+
+        try:
+            self.datfileformats[i] = df.loadDataFile(calls)
+        except IOError:
+            lg.debug("'%s' is in an unrecognised format." % (os.path.basename(df.getDataFilename())))
+            raise
+
+        if not self.areFormatsConsistent():
+            lg.debug(" The file formats are inconsistent!")
+            raise IOError("FORMAT_MISMATCH")
+
+    def __iterPixelMaps(self):
+        """
+        Iterate over the DSC files (in start time order) and their pixel maps.
+
+        For a lazy dataset, each data file is read when it's reached and
+        released again afterwards.
+        """
+
+        for df in self.dscfiles:
+
+            if self.__lazy and not df.isDataLoaded():
+                self.__loadDataFile(df)
 
+            pixelmap = df.getPixelMap()
+
+            df.releasePixelMap()
+
+            yield df, pixelmap
+
+    def isLazy(self):
+        return self.__lazy
+
+    def getFileSystemCalls(self):
+        """ The file system calls made to read each file {basename:{call:count}}. """
+        return self.__calls
+
+    def getNumberOfFileSystemCalls(self):
+        return sum(sum(calls.values()) for calls in self.__calls.itervalues())
 
     def areFormatsConsistent(self):
         """ Check if the data files found are all the same format. """
@@ -159,16 +333,39 @@ class Dataset:
             return "various"
 
     def getFrames(self, geo, **kwargs):
-        """ Extract the frames from the dataset. """
+        """
+        Extract the frames from the dataset.
+
+        If a masks.MaskRegistry is supplied (the "masks" keyword), each
+        frame is given its chip's pixel mask so that the masked pixels
+        are dropped before clustering. See iterFrames to get the frames
+        one at a time instead.
+        """
+
+        return list(self.iterFrames(geo, **kwargs))
+
+    def iterFrames(self, geo, **kwargs):
+        """
+        Iterate over the frames in the dataset, in start time order.
+
+        Each frame is only made (and so clustered) when the generator
+        reaches it. The memory used is only bounded for a lazy dataset
+        (Dataset(..., lazy=True)): its data file is only read then too,
+        and is released by the dataset once the frame has been made, so
+        only the frames the caller keeps hold of stay in memory. For an
+        eager dataset, all of the pixel maps were read by the constructor
+        and stay in memory.
+        See getFrames for the arguments.
+        """
 
         # Get the geospatial information from the tuple provided.
         lat = geo[0]; lon = geo[1]; alt = geo[2]
 
-        ## The list of frames to return.
-        frames = []
+        ## The pixel mask registry (if any).
+        masks = kwargs.pop("masks", None)
 
         # Loop over the DSC files to get each frame.
-        for df in self.dscfiles:
+        for df, pixelmap in self.__iterPixelMaps():
             #print df.getDscFilename(), df.getDataFilename()
 
             frameargs = {\
@@ -184,16 +381,81 @@ class Dataset:
                 "acqtime"     : df.getAcqTime(), \
                 "width"       : df.getFrameWidth(), \
                 "height"      : df.getFrameHeight(), \
-                "format"      : self.datfileformats[0], \
-                "pixelmap"    : df.getPixelMap(), \
+                "format"      : df.getDataFormat(), \
+                "pixelmap"    : pixelmap, \
                 "ismc"        : False\
                 }
 
+            # The chip's pixel mask.
+            if masks is not None and masks.getMask(df.getChipId()) is not None:
+                frameargs["pixelmask"] = masks.getMask(df.getChipId())
+
             # Optional properties.
             for key, arg in kwargs.iteritems():
                 frameargs[key] = kwargs[key]
 
-            # Add the frame to the list of frames.
-            frames.append(Frame(**frameargs))
+            yield Frame(**frameargs)
+
+    def findHotPixels(self, masks, frequency=HOT_PIXEL_FREQUENCY, minframes=HOT_PIXEL_MIN_FRAMES):
+        """
+        Find the hot pixels in the dataset and add them to a mask registry.
+
+        The frames are added to the registry's hit counts one at a time
+        (so, for a lazy dataset, each data file is read and released).
+        See masks.MaskRegistry.updateHotPixels for the arguments.
+
+        @returns A dictionary of the number of new hot pixels for each chip.
+        """
+
+        for df, pixelmap in self.__iterPixelMaps():
+            masks.addFrame(df.getChipId(), pixelmap, df.getFrameHeight(), df.getFrameWidth())
+
+        return masks.updateHotPixels(frequency, minframes)
+
+    def getKlusterTable(self, chunksize=64):
+        """
+        Cluster every frame in the dataset in batches.
+
+        The frames are in the same (start time) order as getFrames().
+        Each batch of chunksize frames is labelled as soon as its pixel
+        maps have been read, so (for a lazy dataset) only one batch of
+        pixel maps is held at a time.
+        See labelling.labelFrameStack for the table and pixel arrays returned.
+        """
+
+        if len(self.dscfiles) == 0:
+            return labelFrameStack([])
+
+        ## The frame dimensions (checked for consistency across the dataset).
+        rows = getConsistentValue([df.getFrameHeight() for df in self.dscfiles], "FRAME_SIZE_MISMATCH")
+        cols = getConsistentValue([df.getFrameWidth()  for df in self.dscfiles], "FRAME_SIZE_MISMATCH")
+
+        ## The cluster tables and pixel arrays of each batch.
+        tables = []; Xss = []; Css = []
+
+        ## The pixel maps of the current batch.
+        chunk = []
+
+        ## The number of frames and hits in the batches labelled so far.
+        n_frames = 0; n_hits = 0
+
+        for i, (df, pixelmap) in enumerate(self.__iterPixelMaps()):
+
+            chunk.append(pixelmap)
+
+            if len(chunk) < chunksize and i < len(self.dscfiles) - 1:
+                continue
+
+            table, Xs, Cs = labelFrameStack(chunk, rows, cols, chunksize)
+
+            # Number the frames and pixels from the start of the dataset.
+            table["frame"] += n_frames
+            table["start"] += n_hits
+
+            tables.append(table); Xss.append(Xs); Css.append(Cs)
+
+            n_frames += len(chunk); n_hits += len(Xs)
+
+            chunk = []
 
-        return frames
+        return np.concatenate(tables), np.concatenate(Xss), np.concatenate(Css)
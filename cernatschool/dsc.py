@@ -20,23 +20,44 @@ from dscvals import *
 from handlers import isChipIdValid, getPixelmanTimeString
 
 #...for the HELPING.
-from helpers import getFormat
+from helpers import getFormat, getBufferFormat
+
+#...for the DSC headers.
+from dscheader import parseDscHeader, getDscKey
+
+#...for reading the data files.
+from readers import readFile, readDataFile, parseDataBuffer, getPixelMap, parseTypeLine, getBinaryFormat
 
 class DscFile:
     """
     A wrapper class for the Pixelman DSC files.
+
+    If the contents of the DSC and data files have already been read
+    (e.g. by Dataset, which reads each file once), they can be supplied
+    so that neither file is opened again. If lazy, the data file isn't
+    read until its pixel map is needed (see loadDataFile), and the pixel
+    map can be released again with releasePixelMap.
+
+    @param [in] dscfilename The path of the DSC file.
+    @param [in] dscbuf The contents of the DSC file (optional).
+    @param [in] databuf The contents of the data file, or a memory map of it (optional).
+    @param [in] fmt The data file format (needed with databuf; optional if lazy).
+    @param [in] header The already parsed DSC header (optional; see dscheader).
+    @param [in] lazy Read the data file only when it's needed?
     """
 
-    def __init__(self, dscfilename):
+    def __init__(self, dscfilename, dscbuf=None, databuf=None, fmt=None, header=None, lazy=False):
         """ The constructor. """
 
-        # Check if the file exists. If it doesn't, throw an exception.
-        if not os.path.exists(dscfilename):
-            raise IOError("NOT_EXIST")
+        if dscbuf is None and header is None:
+
+            # Check if the file exists. If it doesn't, throw an exception.
+            if not os.path.exists(dscfilename):
+                raise IOError("NOT_EXIST")
 
-        # Check that the file is, indeed, a file.
-        if not os.path.isfile(dscfilename):
-            raise IOError("NOT_FILE")
+            # Check that the file is, indeed, a file.
+            if not os.path.isfile(dscfilename):
+                raise IOError("NOT_FILE")
 
         ## The frame width.
         self.__fWidth = None
@@ -44,6 +65,12 @@ class DscFile:
         ## The frame height.
         self.__fHeight = None
 
+        ## The data type of the count values (e.g. "i16").
+        self.__dataType = None
+
+        ## The parsed DSC header (see dscheader.parseDscHeader).
+        self.__header = None
+
         ## The acquisition mode.
         self.__acqMode = None
 
@@ -98,20 +125,30 @@ class DscFile:
         ## The data file name.
         self.__datafilename = dscfilename[:-4]
 
-        if not os.path.exists(self.__datafilename):
+        if databuf is None and not lazy and not os.path.exists(self.__datafilename):
             raise IOError #("MISSING_DAT")
 
         # Process the DSC file.
-        self.processDscFile()
+        self.processDscFile(dscbuf, header)
+
+        ## Is the data file only read when it's needed?
+        self.__lazy = lazy
+
+        if lazy:
+            ## The pixel map (None until the data file is read).
+            self.__pixelmap = None
 
-        ## The pixel map.
-        self.__pixelmap = {}
+            ## The data file format (None until the data file is read, if not supplied).
+            self.__format = fmt
+        else:
+            ## The pixel map.
+            self.__pixelmap = {}
 
-        ## The data file format.
-        self.__format = getFormat(self.__datafilename)
+            ## The data file format.
+            self.__format = fmt if databuf is not None else getFormat(self.__datafilename)
 
-        # Process the data file.
-        self.processDataFile()
+            # Process the data file.
+            self.processDataFile(databuf)
 
     def __lt__(self, other):
         return self.getStartTime() < other.getStartTime()
@@ -128,6 +165,12 @@ class DscFile:
     def getFrameHeight(self):
         return self.__fHeight
 
+    def getDataType(self):
+        return self.__dataType
+
+    def getHeader(self):
+        return self.__header
+
     def getAcqMode(self):
         return self.__acqMode
 
@@ -221,244 +264,278 @@ class DscFile:
     def getBSPreampEnabled(self):
         return self.__bspenabled
 
+    def getDataFormat(self):
+        return self.__format
+
     def getPixelMap(self):
+        if self.__pixelmap is None:
+            self.loadDataFile()
         return self.__pixelmap
 
-    def processDscFile(self):
-        """ Process the detector settings file (.dsc). """
+    def isDataLoaded(self):
+        return self.__pixelmap is not None
 
-        # The DSC file.
-        f = open(self.__dscfilename, "r")
+    def loadDataFile(self, calls=None):
+        """
+        Read (memory map) and process the data file, with a single open.
 
-        ## The lines of the DSC file.
-        ls = f.readlines()
+        If the data file format isn't known yet, it's worked out from
+        the same contents (and, for the binary formats, the DSC type line).
 
-        # Close the DSC file.
-        f.close()
+        @param [in] calls A dictionary to add the file system calls made to (see readers.readFile).
+        @returns The data file format.
+        """
 
-        lg.debug("")
+        buf, st = readFile(self.__datafilename, calls, mapped=True)
 
-        # The frame width and height.
-        whvals = ls[2].strip().split(" ")
+        if self.__format is None:
 
-        try:
-            self.__fWidth = int(whvals[2].split("=")[1])
-        except TypeError:
-            raise IOError("BAD_WIDTH")
-
-        if self.__fWidth < 256 or self.__fWidth > 1024:
-            raise IOError("BAD_WIDTH")
-
-        try:
-            self.__fHeight = int(whvals[3].split("=")[1])
-        except TypeError:
-            raise IOError("BAD_HEIGHT")
+            self.__format = getBufferFormat(buf)
 
-        if self.__fHeight < 256 or self.__fHeight > 1024:
-            raise IOError("BAD_HEIGHT")
-
-        lg.debug(" * Frame dimensions: %d [pix.] x %d [pix.]." % (self.__fWidth, self.__fHeight))
-
-        # Loop over the lines of the DSC file.
-        for i, l in enumerate(ls):
-            #print("%5d: %s" % (i, l.strip()))
-
-            # Acquisition mode.
-            if DSC_ACQ_MODE_STRING in l:
+            # Binary data files are recognised from the DSC file's type line.
+            if self.__format == 0:
                 try:
-                    self.__acqMode = int(ls[i+2].strip())
-                except ValueError:
-                    raise IOError("BAD_ACQ_MODE")
-                lg.debug(" * Acquisition mode is '%s'." % (ACQ_MODES[self.__acqMode]))
+                    self.__format = getBinaryFormat(len(buf), self.__header["typeline"])
+                except IOError:
+                    lg.debug(" Bad DSC type line!")
 
-            elif DSC_ACQ_TIME_STRING in l:
-                try:
-                    self.__acqTime = float(ls[i+2].strip())
-                except ValueError:
-                    raise IOError("BAD_ACQ_TIME")
-                lg.debug(" * Acquisition time is '%f' [%s]." % (self.__acqTime, ACQ_TIME_UNITS_SHORT))
-
-            elif DSC_CHIPID_STRING in l:
-
-                chipid = ls[i+2].strip()
-                if not isChipIdValid(chipid):
-                    raise IOError("Invalid chip ID in the DSC file.")
-                self.__chipid = chipid
-                lg.debug(" * Chip ID is '%s'." % (self.__chipid))
-
-            elif DSC_DACS_STRING in l:
-
-                # Break down the DAC string.
-                self.__dacs = [int(x) for x in ls[i+2].strip().split(" ")]
-
-                self.__IKrum       = self.__dacs[0]
-                self.__Disc        = self.__dacs[1]
-                self.__Preamp      = self.__dacs[2]
-                self.__BuffAnalogA = self.__dacs[3]
-                self.__BuffAnalogB = self.__dacs[4]
-                self.__Hist        = self.__dacs[5]
-                self.__THL         = self.__dacs[6]
-                self.__THLCoarse   = self.__dacs[7]
-                self.__Vcas        = self.__dacs[8]
-                self.__FBK         = self.__dacs[9]
-                self.__GND         = self.__dacs[10]
-                self.__THS         = self.__dacs[11]
-                self.__BiasLVDS    = self.__dacs[12]
-                self.__RefLVDS     = self.__dacs[13]
-
-                lg.debug(" * DAC values:")
-                lg.debug(" * --> IKrum           = %4d" % (self.__IKrum))
-                lg.debug(" * --> Disc            = %4d" % (self.__Disc))
-                lg.debug(" * --> Preamp          = %4d" % (self.__Preamp))
-                lg.debug(" * --> BuffAnalogA     = %4d" % (self.__BuffAnalogA))
-                lg.debug(" * --> BuffAnalogB     = %4d" % (self.__BuffAnalogB))
-                lg.debug(" * --> Hist            = %4d" % (self.__Hist))
-                lg.debug(" * --> THL             = %4d" % (self.__THL))
-                lg.debug(" * --> THLCoarse       = %4d" % (self.__THLCoarse))
-                lg.debug(" * --> Vcas            = %4d" % (self.__Vcas))
-                lg.debug(" * --> FBK             = %4d" % (self.__FBK))
-                lg.debug(" * --> GND             = %4d" % (self.__GND))
-                lg.debug(" * --> THS             = %4d" % (self.__THS))
-                lg.debug(" * --> BiasLVDS        = %4d" % (self.__BiasLVDS))
-                lg.debug(" * --> RefLVDS         = %4d" % (self.__RefLVDS))
-
-            elif DSC_FIRMWARE_STRING in l:
-                self.__firmwarev = ls[i+2].strip()
-
-            # Note - needs 'lower()' because of a 2.1.1/2.2.2 mismatch...
-            elif DSC_BIAS_VOLTAGE_STRING.lower() in l.lower():
-                try:
-                    hv = float(ls[i+2].strip())
-                except ValueError:
-                    raise IOError("BAD_HV_VALUE")
+        if self.__format <= 0:
+            self.__format = None
+            raise IOError("BAD_FORMAT")
 
-                if hv < 0.0 or hv > 100.0:
-                    raise IOError("BAD_HV_VALUE")
+        self.processDataFile(buf)
 
-                self.__hv = hv
-                lg.debug(" * Bias voltage (HV) is %f [V]." % (self.__hv))
+        return self.__format
 
-            elif DSC_HW_TIMER_STRING in l:
-                try:
-                    self.__hwTimerMode = int(ls[i+2].strip())
-                except ValueError:
-                    raise IOError("BAD_HW_TIMER_MODE")
-                lg.debug(" * Hardware time mode is '%s'." % (HW_TIME_MODES[self.__hwTimerMode]))
+    def releasePixelMap(self):
+        """ Forget the pixel map of a lazily read data file (it's read again if needed). """
+        if self.__lazy:
+            self.__pixelmap = None
 
-            elif DSC_INTERFACE_STRING in l:
-                self.__interface = ls[i+2].strip()
-                lg.debug(" * Interface is '%s'." % (self.__interface))
+    def processDscFile(self, buf=None, header=None):
+        """
+        Process the detector settings file (.dsc).
 
-            elif DSC_MPX_CLOCK_STRING in l:
-                try:
-                    mpxClock = float(ls[i+2].strip())
-                except ValueError:
-                    raise IOError("BAD_MPX_CLOCK")
-                self.__mpxClock = mpxClock
-                lg.debug(" * Medipix clock is %f [MHz]." % (self.__mpxClock))
+        The settings are looked up in the header table from
+        dscheader.parseDscHeader.
 
-            elif DSC_MPX_TYPE_STRING in l:
-                try:
-                    mpxType = int(ls[i+2].strip())
-                except ValueError:
-                    raise IOError("BAD_MPX_TYPE")
-                if mpxType not in [1,2,3]:
-                    raise IOError("BAD_MPX_TYPE")
-                self.__mpxType = mpxType
-                lg.debug(" * Detector type is '%s'." % (MPX_TYPES_LONG[self.__mpxType]))
-
-            elif DSC_PIXELMAN_VERSION_STRING in l:
-                self.__pixelmanv = ls[i+2].strip()
-                lg.debug(" * Pixelman version is '%s'." % (self.__pixelmanv))
-
-            elif DSC_POLARITY_STRING in l:
-                try:
-                    pol = int(ls[i+2].strip())
-                except ValueError:
-                    raise IOError("BAD_POLARITY")
-                if pol not in [0,1]:
-                    raise IOError("BAD_POLARITY")
-                self.__polarity = pol
-                lg.debug(" * Polarity is '%s'." % (POLARITIES[self.__polarity]))
+        @param [in] buf The contents of the DSC file (if None, the file is read).
+        @param [in] header The already parsed header (e.g. from a DscHeaderCache).
+        """
 
-            elif DSC_START_TIME_STRING in l:
+        if header is None:
+            if buf is None:
+                # The DSC file.
+                with open(self.__dscfilename, "r") as f:
+                    buf = f.read()
+            header = parseDscHeader(buf)
 
-                try:
-                    ## The full start time.
-                    st = float(ls[i+2].strip())
+        ## The parsed header.
+        self.__header = header
 
-                    self.__startTime = st
+        ## The settings {key:[type, value]}.
+        fields = header["fields"]
 
-                except:
-                    raise IOError("BAD_START_TIME")
+        lg.debug("")
 
-                sec, sub, sts = getPixelmanTimeString(st)
+        # The frame width and height.
+        whvals = header["typeline"].split(" ")
 
-                self.__startTimeS = sts
+        try:
+            self.__fWidth = int(whvals[2].split("=")[1])
+        except TypeError:
+            raise IOError("BAD_WIDTH")
 
-                lg.debug(" * Start time is %20.6f [s]." % (self.__startTime))
-                lg.debug(" *--> Converted to string: '%s'." % (sts))
+        if self.__fWidth < 256 or self.__fWidth > 1024:
+            raise IOError("BAD_WIDTH")
 
-                # Check if the start time matches the supplied string.
-                #if self.__startTimeS is not None and sts != self.__startTimeS:
-                #    lg.debug(" * A mismatch between the start times.")
-                #    raise IOError("START_TIME_MISMATCH")
+        try:
+            self.__fHeight = int(whvals[3].split("=")[1])
+        except TypeError:
+            raise IOError("BAD_HEIGHT")
 
-            #elif DSC_START_TIME_S_STRING in l:
-            #
-            #    # Set the start time string from the DSC file.
-            #    self.__startTimeS = ls[i+2].strip()
-            #
-            #    lg.debug(" * Start time (string) is '%s'." % (self.__startTimeS))
-            #
-            #    #if self.__startTime is not None:
-            #    #    sec, sub, sts = getPixelmanTimeString(self.__startTime)
-            #    #    #if self.__startTimeS != sts:
-            #    #    #    raise IOError("START_TIME_MISMATCH")
+        if self.__fHeight < 256 or self.__fHeight > 1024:
+            raise IOError("BAD_HEIGHT")
 
-            elif DSC_TPX_CLOCK_STRING.lower() in l.lower():
+        lg.debug(" * Frame dimensions: %d [pix.] x %d [pix.]." % (self.__fWidth, self.__fHeight))
 
-                if "byte[1]" in ls[i+1].strip():
+        # The data type (needed to read the binary formats).
+        self.__dataType = parseTypeLine(header["typeline"])[0]
+
+        # Acquisition mode.
+        if getDscKey(DSC_ACQ_MODE_STRING) in fields:
+            try:
+                self.__acqMode = int(fields[getDscKey(DSC_ACQ_MODE_STRING)][1])
+            except ValueError:
+                raise IOError("BAD_ACQ_MODE")
+            lg.debug(" * Acquisition mode is '%s'." % (ACQ_MODES[self.__acqMode]))
+
+        if getDscKey(DSC_ACQ_TIME_STRING) in fields:
+            try:
+                self.__acqTime = float(fields[getDscKey(DSC_ACQ_TIME_STRING)][1])
+            except ValueError:
+                raise IOError("BAD_ACQ_TIME")
+            lg.debug(" * Acquisition time is '%f' [%s]." % (self.__acqTime, ACQ_TIME_UNITS_SHORT))
+
+        if getDscKey(DSC_CHIPID_STRING) in fields:
+
+            chipid = fields[getDscKey(DSC_CHIPID_STRING)][1]
+            if not isChipIdValid(chipid):
+                raise IOError("Invalid chip ID in the DSC file.")
+            self.__chipid = chipid
+            lg.debug(" * Chip ID is '%s'." % (self.__chipid))
+
+        if getDscKey(DSC_DACS_STRING) in fields:
+
+            # The DAC values (already split up).
+            self.__dacs = fields[getDscKey(DSC_DACS_STRING)][1]
+
+            self.__IKrum       = self.__dacs[0]
+            self.__Disc        = self.__dacs[1]
+            self.__Preamp      = self.__dacs[2]
+            self.__BuffAnalogA = self.__dacs[3]
+            self.__BuffAnalogB = self.__dacs[4]
+            self.__Hist        = self.__dacs[5]
+            self.__THL         = self.__dacs[6]
+            self.__THLCoarse   = self.__dacs[7]
+            self.__Vcas        = self.__dacs[8]
+            self.__FBK         = self.__dacs[9]
+            self.__GND         = self.__dacs[10]
+            self.__THS         = self.__dacs[11]
+            self.__BiasLVDS    = self.__dacs[12]
+            self.__RefLVDS     = self.__dacs[13]
+
+            lg.debug(" * DAC values:")
+            lg.debug(" * --> IKrum           = %4d" % (self.__IKrum))
+            lg.debug(" * --> Disc            = %4d" % (self.__Disc))
+            lg.debug(" * --> Preamp          = %4d" % (self.__Preamp))
+            lg.debug(" * --> BuffAnalogA     = %4d" % (self.__BuffAnalogA))
+            lg.debug(" * --> BuffAnalogB     = %4d" % (self.__BuffAnalogB))
+            lg.debug(" * --> Hist            = %4d" % (self.__Hist))
+            lg.debug(" * --> THL             = %4d" % (self.__THL))
+            lg.debug(" * --> THLCoarse       = %4d" % (self.__THLCoarse))
+            lg.debug(" * --> Vcas            = %4d" % (self.__Vcas))
+            lg.debug(" * --> FBK             = %4d" % (self.__FBK))
+            lg.debug(" * --> GND             = %4d" % (self.__GND))
+            lg.debug(" * --> THS             = %4d" % (self.__THS))
+            lg.debug(" * --> BiasLVDS        = %4d" % (self.__BiasLVDS))
+            lg.debug(" * --> RefLVDS         = %4d" % (self.__RefLVDS))
+
+        if getDscKey(DSC_FIRMWARE_STRING) in fields:
+            self.__firmwarev = fields[getDscKey(DSC_FIRMWARE_STRING)][1]
+
+        # Note - the keys are in lower case because of a 2.1.1/2.2.2 mismatch...
+        if getDscKey(DSC_BIAS_VOLTAGE_STRING) in fields:
+            try:
+                hv = float(fields[getDscKey(DSC_BIAS_VOLTAGE_STRING)][1])
+            except ValueError:
+                raise IOError("BAD_HV_VALUE")
+
+            if hv < 0.0 or hv > 100.0:
+                raise IOError("BAD_HV_VALUE")
+
+            self.__hv = hv
+            lg.debug(" * Bias voltage (HV) is %f [V]." % (self.__hv))
+
+        if getDscKey(DSC_HW_TIMER_STRING) in fields:
+            try:
+                self.__hwTimerMode = int(fields[getDscKey(DSC_HW_TIMER_STRING)][1])
+            except ValueError:
+                raise IOError("BAD_HW_TIMER_MODE")
+            lg.debug(" * Hardware time mode is '%s'." % (HW_TIME_MODES[self.__hwTimerMode]))
+
+        if getDscKey(DSC_INTERFACE_STRING) in fields:
+            self.__interface = fields[getDscKey(DSC_INTERFACE_STRING)][1]
+            lg.debug(" * Interface is '%s'." % (self.__interface))
+
+        if getDscKey(DSC_MPX_CLOCK_STRING) in fields:
+            try:
+                mpxClock = float(fields[getDscKey(DSC_MPX_CLOCK_STRING)][1])
+            except ValueError:
+                raise IOError("BAD_MPX_CLOCK")
+            self.__mpxClock = mpxClock
+            lg.debug(" * Medipix clock is %f [MHz]." % (self.__mpxClock))
+
+        if getDscKey(DSC_MPX_TYPE_STRING) in fields:
+            try:
+                mpxType = int(fields[getDscKey(DSC_MPX_TYPE_STRING)][1])
+            except ValueError:
+                raise IOError("BAD_MPX_TYPE")
+            if mpxType not in [1,2,3]:
+                raise IOError("BAD_MPX_TYPE")
+            self.__mpxType = mpxType
+            lg.debug(" * Detector type is '%s'." % (MPX_TYPES_LONG[self.__mpxType]))
+
+        if getDscKey(DSC_PIXELMAN_VERSION_STRING) in fields:
+            self.__pixelmanv = fields[getDscKey(DSC_PIXELMAN_VERSION_STRING)][1]
+            lg.debug(" * Pixelman version is '%s'." % (self.__pixelmanv))
+
+        if getDscKey(DSC_POLARITY_STRING) in fields:
+            try:
+                pol = int(fields[getDscKey(DSC_POLARITY_STRING)][1])
+            except ValueError:
+                raise IOError("BAD_POLARITY")
+            if pol not in [0,1]:
+                raise IOError("BAD_POLARITY")
+            self.__polarity = pol
+            lg.debug(" * Polarity is '%s'." % (POLARITIES[self.__polarity]))
+
+        if getDscKey(DSC_START_TIME_STRING) in fields:
+
+            try:
+                ## The full start time.
+                st = float(fields[getDscKey(DSC_START_TIME_STRING)][1])
+
+                self.__startTime = st
+
+            except:
+                raise IOError("BAD_START_TIME")
+
+            sec, sub, sts = getPixelmanTimeString(st)
+
+            self.__startTimeS = sts
+
+            lg.debug(" * Start time is %20.6f [s]." % (self.__startTime))
+            lg.debug(" *--> Converted to string: '%s'." % (sts))
+
+        if getDscKey(DSC_TPX_CLOCK_STRING) in fields:
+
+            tpxtype, val = fields[getDscKey(DSC_TPX_CLOCK_STRING)]
+
+            if tpxtype == "byte":
+
+                if val not in [0,1,2,3]:
+                    raise IOError("BAD_TPX_CLOCK_MODE")
+
+                self.__tpxClock = TPX_CLOCK_VALS[val]
+                lg.debug(" * Timepix clock = %f [MHz]." % (self.__tpxClock))
+
+            elif tpxtype == "double":
+                self.__tpxClock = float(val)
+            else:
+                raise IOError("BAD_TPX_CLOCK")
 
-                    val = int(ls[i+2].strip())
+        if getDscKey(DSC_NAME_SN_STRING) in fields:
+            self.__nameAndSN = fields[getDscKey(DSC_NAME_SN_STRING)][1]
+            lg.debug(" * Name and serial no. = '%s'." % (self.__nameAndSN))
 
-                    if val not in [0,1,2,3]:
-                        raise("BAD_TPX_CLOCK_MODE")
+        lg.debug("")
 
-                    self.__tpxClock = TPX_CLOCK_VALS[val]
-                    lg.debug(" * Timepix clock = %f [MHz]." % (self.__tpxClock))
+    def processDataFile(self, buf=None):
+        """
+        Process the accompanying Timepix datafile.
 
-                elif "double[1]" in ls[i+1].strip():
-                    self.__tpxClock = float(ls[i+2].strip())
-                else:
-                    raise IOError("BAD_TPX_CLOCK")
+        The whole file is converted at once. The binary formats are
+        viewed through a memory map of the file, either the one supplied
+        or one made by readers.readDataFile.
 
-            elif DSC_NAME_SN_STRING in l:
-                self.__nameAndSN = ls[i+2].strip()
-                lg.debug(" * Name and serial no. = '%s'." % (self.__nameAndSN))
+        @param [in] buf The contents of the data file, or a memory map of it
+                        (see readers.readFile). If None, the file is read.
+        """
 
-        lg.debug("")
+        if buf is None:
+            Xs, Cs = readDataFile(self.__datafilename, self.__format, self.__fHeight, self.__fWidth, self.__dataType)
+        else:
+            Xs, Cs = parseDataBuffer(buf, self.__format, self.__fHeight, self.__fWidth, self.__dataType)
 
-    def processDataFile(self):
-        """ Process the accompanying Timepix datafile. """
-
-        df = open(self.__datafilename, "r")
-        ls = df.readlines()
-        df.close()
-
-        # Loop over the lines in the file.
-        for j, l in enumerate(ls):
-
-            if   self.__format == 4114: # ASCII xyC.
-                vals = l.strip().split("\t")
-                self.__pixelmap[self.__fHeight * int(vals[1]) + int(vals[0])] = int(vals[2])
-            elif self.__format == 18: # ASCII matrix.
-                vals = [int(val) for val in l.strip().split(" ")]
-                for i, C in enumerate(vals):
-                    if C > 0:
-                        self.__pixelmap[(self.__fHeight * j) + i] = C
-            elif self.__format == 8210: # ASCII XC
-                vals = [int(val) for val in l.strip().split("\t")]
-                self.__pixelmap[vals[0]] = vals[1]
-            else:
-                raise IOError("FRAME_BAD_FORMAT")
+        self.__pixelmap = getPixelMap(Xs, Cs)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Parsing and caching of the Pixelman DSC file headers.
+
+A DSC file is made up of blocks like:
+
+    "HV" ("Bias voltage [V]"):
+    double[1]
+    18.000000
+
+i.e. a key line, a type line and a value line. The blocks are parsed
+in one pass into a table of {key:[type, value]}, with the values
+converted to the type given, so the settings can be looked up by key
+rather than by scanning the lines for each one. The keys are the names
+in the first quotes, in lower case (e.g. "hv").
+
+Parsed headers can be kept in a DscHeaderCache, saved as JSON, so that
+unchanged DSC files don't have to be read or parsed again.
+"""
+
+#...the usual suspects.
+import os, re
+
+#...for the logging.
+import logging as lg
+
+#...for the cache files.
+import json
+
+## The first line of a DSC file.
+DSC_FIRST_LINE = "A000000001"
+
+## The pattern of the type lines, e.g. "double[1]" or "u16[14]".
+DSC_TYPE_PATTERN = re.compile(r"^(\w+)\[(\d+)\]$")
+
+## The DSC data types holding text.
+DSC_TEXT_TYPES = ["char", "uchar"]
+
+## The DSC data types holding floating point values.
+DSC_FLOAT_TYPES = ["double", "float"]
+
+def getDscKey(keystring):
+    """
+    Get the table key for a DSC key string.
+
+    @param [in] keystring A key line or name, e.g. '"HV" ("Bias voltage [V]"):' or "Timepix clock".
+    @returns The name in the first quotes (or the whole string), in lower case.
+    """
+
+    if keystring.startswith("\"") and "\"" in keystring[1:]:
+        return keystring[1:keystring.index("\"", 1)].lower()
+
+    return keystring.lower()
+
+def parseDscValue(typename, count, l):
+    """
+    Convert a DSC value line to the type given by its type line.
+
+    Values that can't be converted are left as the (stripped) string,
+    so that they can be reported when they are used.
+
+    @param [in] typename The data type, e.g. "double".
+    @param [in] count The number of values.
+    @param [in] l The value line.
+    @returns The value (a string for the text types, a number, or a list of numbers if count > 1).
+    """
+
+    l = l.strip()
+
+    if typename in DSC_TEXT_TYPES:
+        return l
+
+    ## The conversion function.
+    convert = float if typename in DSC_FLOAT_TYPES else int
+
+    try:
+        vals = [convert(val) for val in l.split()]
+    except ValueError:
+        return l
+
+    if count == 1 and len(vals) == 1:
+        return vals[0]
+
+    return vals
+
+def parseDscHeader(buf):
+    """
+    Parse the contents of a DSC file into a header table.
+
+    @param [in] buf The contents of the DSC file.
+    @returns The header {"typeline":the frame type line, "fields":{key:[type, value]}}.
+    """
+
+    ## The lines of the DSC file.
+    ls = buf.splitlines()
+
+    if len(ls) < 3 or ls[0].strip() != DSC_FIRST_LINE:
+        raise IOError("BAD_DSC_FILE")
+
+    ## The table of the settings {key:[type, value]}.
+    fields = {}
+
+    for i in range(3, len(ls) - 2):
+
+        ## The (possible) key line.
+        l = ls[i].strip()
+
+        if not (l.startswith("\"") and l.endswith(":")):
+            continue
+
+        m = DSC_TYPE_PATTERN.match(ls[i+1].strip())
+
+        if m is None:
+            continue
+
+        fields[getDscKey(l)] = [m.group(1), parseDscValue(m.group(1), int(m.group(2)), ls[i+2])]
+
+    return {"typeline" : ls[2].strip(), "fields" : fields}
+
+def encodeStrings(obj):
+    """
+    Convert the (unicode) strings read from JSON back to (byte) strings.
+
+    @param [in] obj The object read from JSON.
+    @returns The same object, with every unicode string (including the dictionary keys) encoded as UTF-8.
+    """
+
+    if isinstance(obj, unicode):
+        return obj.encode("utf-8")
+
+    if isinstance(obj, list):
+        return [encodeStrings(val) for val in obj]
+
+    if isinstance(obj, dict):
+        return dict((encodeStrings(key), encodeStrings(val)) for key, val in obj.iteritems())
+
+    return obj
+
+class DscHeaderCache:
+    """
+    A persistent cache of parsed DSC file headers.
+
+    Each header is kept with the size and modification time of its
+    file, and is only used if the file still has the same size and
+    modification time.
+
+    @param [in] path The path of the cache JSON file (loaded if it exists).
+    """
+
+    def __init__(self, path=None):
+        """ Constructor. """
+
+        ## The path of the cache JSON file.
+        self.__path = path
+
+        ## The cached headers {absolute path:{"size":..., "mtime":..., "header":...}}.
+        self.__entries = {}
+
+        ## The number of headers taken from the cache.
+        self.__n_hits = 0
+
+        ## The number of headers added to (or updated in) the cache.
+        self.__n_updates = 0
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def load(self, path):
+        """ Load the headers from a cache JSON file. """
+
+        # The strings are converted back to str, so that the cached headers
+        # are the same as freshly parsed ones.
+        with open(path, "r") as f:
+            self.__entries = encodeStrings(json.load(f))
+
+        lg.info(" * Loaded %d DSC header(s) from '%s'." % (len(self.__entries), path))
+
+    def save(self, path=None):
+        """ Save the headers to a cache JSON file (by default, the one loaded). """
+
+        if path is None:
+            path = self.__path
+
+        if path is None:
+            raise IOError("NO_HEADER_CACHE_PATH")
+
+        with open(path, "w") as f:
+            json.dump(self.__entries, f)
+
+    def hasFile(self, fn):
+        """ Is there a header (possibly out of date) for the file fn? """
+        return os.path.abspath(fn) in self.__entries
+
+    def getHeader(self, fn, size, mtime):
+        """
+        Get the cached header for a DSC file.
+
+        @param [in] fn The path of the DSC file.
+        @param [in] size The size of the file [bytes].
+        @param [in] mtime The modification time of the file.
+        @returns The header (see parseDscHeader), or None if it isn't cached or is out of date.
+        """
+
+        entry = self.__entries.get(os.path.abspath(fn))
+
+        if entry is None or entry["size"] != size or entry["mtime"] != mtime:
+            return None
+
+        self.__n_hits += 1
+
+        return entry["header"]
+
+    def setHeader(self, fn, size, mtime, header):
+        """ Add (or replace) the header for a DSC file. """
+
+        self.__entries[os.path.abspath(fn)] = {"size" : size, "mtime" : mtime, "header" : header}
+
+        self.__n_updates += 1
+
+    def getNumberOfHeaders(self):
+        return len(self.__entries)
+
+    def getNumberOfHits(self):
+        return self.__n_hits
+
+    def getNumberOfUpdates(self):
+        return self.__n_updates
@@ -8,11 +8,17 @@ import logging as lg
 #from datavals import *
 
 #...for the HANDLING.
-from handlers import getPixelmanTimeString, getPixelsStringFromPixelMap
+from handlers import getPixelmanTimeString, getPixelsString
 
 #...for the Klusters (Clusters).
 from kluster import KlusterFinder
 
+#...for the pixel masks.
+from masks import getMaskArray, getMaskedPixels, applyMask
+
+#...for the hit arrays.
+from labelling import getHitArrays
+
 class Frame:
     """
     A wrapper class for Timepix frames.
@@ -190,6 +196,36 @@ class Frame:
         if "ismc" in kwargs.keys():
             self.__ismc = kwargs["ismc"]
 
+        ## The clustering engine.
+        self.__engine = "legacy"
+        if "engine" in kwargs.keys():
+            self.__engine = kwargs["engine"]
+
+        ## The pixel connectivity used for clustering (4 or 8).
+        self.__connectivity = 8
+        if "connectivity" in kwargs.keys():
+            self.__connectivity = kwargs["connectivity"]
+
+        ## The joining distance for gap-tolerant clustering [pixels] (uses the spatialhash engine).
+        self.__radius = None
+        if "radius" in kwargs.keys():
+            self.__radius = kwargs["radius"]
+
+        ## The thresholds for choosing the engine ("auto" only).
+        self.__thresholds = None
+        if "thresholds" in kwargs.keys():
+            self.__thresholds = kwargs["thresholds"]
+
+        ## The cluster properties to calculate (None for all of them).
+        self.__properties = None
+        if "properties" in kwargs.keys():
+            self.__properties = kwargs["properties"]
+
+        ## Build cluster objects for the gamma candidates?
+        self.__gammas = True
+        if "gammas" in kwargs.keys():
+            self.__gammas = kwargs["gammas"]
+
         if "skipclustering" in kwargs.keys():
             if kwargs["skipclustering"]:
                 #print("SKIPPING THE CLUSTERING!")
@@ -199,7 +235,7 @@ class Frame:
         # Do the clustering.
 
         ## The frame's cluster finder.
-        self.__kf = KlusterFinder(self.getPixelMap(), self.getWidth(), self.getHeight(), self.isMC(), self.__pixel_mask_map)
+        self.__kf = KlusterFinder(self.getPixelMap(), self.getWidth(), self.getHeight(), self.isMC(), self.__pixel_mask_map, self.__engine, self.__connectivity, self.__radius, self.__gammas, self.__thresholds, self.__properties)
 
         self.__n_klusters = self.__kf.getNumberOfKlusters()
 
@@ -306,22 +342,11 @@ class Frame:
         return len(self.__pixelmap)
 
     def getNumberOfUnmaskedPixels(self):
-        unmasked = 0
-        #lg.debug(self.__pixelmap)
-        #lg.debug(self.__pixel_mask_map)
-        #for X in self.__pixel_mask_map.keys():
-        #    lg.debug(" * %5d -> (%5d,%5d)." % (X, X%256, X/256))
-        for X in self.__pixelmap.keys():
-            #lg.debug(" * Is %5d -> (%5d,%5d) in the map?" % (X, X%256, X/256))
-            if X not in self.__pixel_mask_map.keys():
-                #lg.debug(" *---> NO!")
-                unmasked += 1
-            #else:
-            #    lg.debug(" *---> YES!")
-        return unmasked
+        masked = getMaskArray(self.__pixel_mask_map, self.__height, self.__width)
+        return len(applyMask(*getHitArrays(self.__pixelmap), masked=masked)[0])
 
     def getNumberOfMaskedPixels(self):
-        return len(self.__pixel_mask_map)
+        return len(getMaskedPixels(self.__pixel_mask_map, self.__height, self.__width))
 
     def getOccupancy(self):
         return len(self.__pixelmap)
@@ -332,8 +357,10 @@ class Frame:
     def isMC(self):
         return self.__ismc
 
-    def getPixelsString(self):
-        s = ""
+    def getPixelsString(self, fmt="text"):
+        """ Serialise the frame's pixels ("json", "text" or "binary"). """
+        Xs = sorted(self.__pixelmap.keys())
+        return getPixelsString(Xs, [self.__pixelmap[X] for X in Xs], self.__width, fmt)
 
     def getNumberOfKlusters(self):
         return self.__n_klusters
@@ -358,3 +385,15 @@ class Frame:
 
     def getKlusterFinder(self):
         return self.__kf
+
+    def getEngine(self):
+        return self.__engine
+
+    def getConnectivity(self):
+        return self.__connectivity
+
+    def getRadius(self):
+        return self.__radius
+
+    def keepsGammas(self):
+        return self.__gammas
@@ -14,6 +14,18 @@ import re
 #...for the time functionality.
 import time
 
+#...for the JSON pixel export.
+import json
+
+#...for the binary pixel export.
+import numpy as np
+
+## The record format of the binary pixel export - little-endian (X, C) pairs.
+BINARY_PIXEL_DTYPE = np.dtype([("X", "<u4"), ("C", "<u4")])
+
+## The pixel export formats.
+PIXEL_EXPORT_FORMATS = ["json", "text", "binary"]
+
 def isChipIdValid(chipid):
     """ Does the chip ID conform to the UVV-XYYYY format? """
 
@@ -68,3 +80,33 @@ def getPixelsStringFromPixelMap(pixelmap):
             s += "\n"
 
     return s
+
+def getPixelsString(Xs, Cs, cols, fmt="json"):
+    """
+    Serialise a set of pixels on demand.
+
+    The formats are:
+    * "json"   - a JSON list of {"x":x, "y":y, "c":C} objects;
+    * "text"   - one "X C" line per pixel;
+    * "binary" - packed BINARY_PIXEL_DTYPE (X, C) records.
+
+    @param [in] Xs The pixel X values.
+    @param [in] Cs The pixel count values.
+    @param [in] cols The number of columns in the frame.
+    @param [in] fmt The export format.
+    @returns The serialised pixels (a str in all cases).
+    """
+
+    if fmt == "json":
+        return json.dumps([{"x" : int(X) % cols, "y" : int(X) // cols, "c" : int(C)} for X, C in zip(Xs, Cs)])
+
+    elif fmt == "text":
+        return "\n".join(["%d %d" % (X, C) for X, C in zip(Xs, Cs)])
+
+    elif fmt == "binary":
+        ## The packed pixel records.
+        records = np.zeros(len(Xs), dtype=BINARY_PIXEL_DTYPE)
+        records["X"] = Xs; records["C"] = Cs
+        return records.tostring()
+
+    raise IOError("BAD_PIXEL_EXPORT_FORMAT")
@@ -5,18 +5,30 @@
 Various helper functions for processing CERN@school Timepix datasets.
 """
 
+#...the usual suspects.
+import os
+
 #...for the logging.
 import logging as lg
 
 #...for the MATH.
 import numpy as np
 
-#...for the least squares stuff.
-from scipy.optimize import leastsq
+#...for the lines of best fit and the interior pixels.
+from properties import getLinesOfBestFit, getInteriorPixels
+
+#...for the edge pixels.
+from bitset import WORD_BITS, countEdgeBits
+
+#...for the binary data file formats.
+from readers import getBinaryFormat
 
 #...for the data values.
 from datavals import *
 
+## The most bytes looked at for the first line of a file.
+MAX_FIRST_LINE = 65536
+
 def getConsistentValue(thelist, error, emptyval=None):
     """
     Function for extracting a consistent value from a list,
@@ -39,89 +51,127 @@ def getConsistentValue(thelist, error, emptyval=None):
             raise ValueError("Empty list supplied but no empty value given!")
 
 def getFormat(fn):
+    """
+    Get the format of a file (see datavals.DATA_FILE_TYPES).
+
+    @param [in] fn The path of the file.
+    @returns The format value (0 if the format isn't recognised).
+    """
 
     ## Open the file and look at the first line.
     with open(fn, "r") as f:
+        l = f.readline()
 
-        l = f.readline().strip()
+    ## The file type value.
+    filetypeval = getBufferFormat(l)
 
-        lg.debug("")
-        lg.debug(" *--> First line is:")
-        lg.debug("\n\n%s\n" % (l))
-        lg.debug("")
+    # Is it a binary data file? The layout is given by the DSC file.
+    if filetypeval == 0 and os.path.isfile(fn + ".dsc"):
 
-        ## The file type value.
-        filetypeval = 0
+        with open(fn + ".dsc", "r") as f:
+            dscbuf = "".join([f.readline() for i in range(3)])
 
-        # Is it a DSC file?
-        # TODO: check all possible DSC file starts...
-        if   l == "A000000001":
-            filetypeval = -1
-            lg.debug(" *--> This is a %s file." % (DATA_FILE_TYPES[filetypeval]))
-            return filetypeval
+        filetypeval = getBufferFormat(l, os.path.getsize(fn), dscbuf)
 
-        # Try to break up the first line into tab-separated integers.
+    return filetypeval
 
-        try:
-            ## Values separated by tab
-            tabvals = [int(x) for x in l.split('\t')]
+def getBufferFormat(buf, size=None, dscbuf=None):
+    """
+    Get the format of a file from its contents.
 
-            lg.debug(" %d tab separated values found in the first line." % (len(tabvals)))
+    Only the first line is needed for the DSC and ASCII formats. The
+    binary formats are recognised from the "Type=" line of the matching
+    DSC file (see readers.getBinaryFormat), if it's supplied.
 
-            if len(tabvals) == 2:
-                filetypeval = 8210
-            elif len(tabvals) == 3:
-                filetypeval = 4114
-            lg.debug(" *--> This is a %s file." % (DATA_FILE_TYPES[filetypeval]))
-            return filetypeval
+    @param [in] buf The contents of the file (or its first line), or a memory map of it.
+    @param [in] size The size of the file [bytes] (for the binary formats).
+    @param [in] dscbuf The contents of the matching DSC file (or its first three lines).
+    @returns The format value (0 if the format isn't recognised).
+    """
 
-        except ValueError:
-            lg.debug(" Tab separation into integers failed!")
-            pass
+    ## The end of the first line (only the start of the file is searched).
+    end = buf.find("\n", 0, MAX_FIRST_LINE)
 
-        try:
-            ## Values separated by spaces.
-            spcvals = [int(x) for x in l.split(' ')]
+    ## The first line of the file (buf can also be a memory map - see readers.readFile).
+    l = buf[:MAX_FIRST_LINE if end < 0 else end].strip()
 
-            lg.debug(" %d space separated values found in the first line." % (len(spcvals)))
+    lg.debug("")
+    lg.debug(" *--> First line is:")
+    lg.debug("\n\n%s\n" % (l))
+    lg.debug("")
 
-            if len(spcvals) == 256:
-                filetypeval = 18
-            lg.debug(" *--> This is a %s file." % (DATA_FILE_TYPES[filetypeval]))
-            return filetypeval
+    ## The file type value.
+    filetypeval = 0
 
-        except ValueError:
-            lg.debug(" Space separation into integers failed!")
-            pass
+    # Is it a DSC file?
+    # TODO: check all possible DSC file starts...
+    if   l == "A000000001":
+        filetypeval = -1
+        lg.debug(" *--> This is a %s file." % (DATA_FILE_TYPES[filetypeval]))
+        return filetypeval
+
+    # Try to break up the first line into tab-separated integers.
+
+    try:
+        ## Values separated by tab
+        tabvals = [int(x) for x in l.split('\t')]
+
+        lg.debug(" %d tab separated values found in the first line." % (len(tabvals)))
+
+        if len(tabvals) == 2:
+            filetypeval = 8210
+        elif len(tabvals) == 3:
+            filetypeval = 4114
+        lg.debug(" *--> This is a %s file." % (DATA_FILE_TYPES[filetypeval]))
+        return filetypeval
+
+    except ValueError:
+        lg.debug(" Tab separation into integers failed!")
+        pass
 
-        lg.debug(" This is not a valid data file.")
+    try:
+        ## Values separated by spaces.
+        spcvals = [int(x) for x in l.split(' ')]
+
+        lg.debug(" %d space separated values found in the first line." % (len(spcvals)))
+
+        if len(spcvals) == 256:
+            filetypeval = 18
+        lg.debug(" *--> This is a %s file." % (DATA_FILE_TYPES[filetypeval]))
         return filetypeval
 
+    except ValueError:
+        lg.debug(" Space separation into integers failed!")
+        pass
 
-def residuals(p, y, x):
-    """ The residual function required by leastsq."""
+    # Is it a binary data file? The layout is given by the DSC file.
+    if dscbuf is not None and size is not None:
 
-    ## The gradient of the line.
-    m = p[0]
+        ## The first three lines of the DSC file.
+        ls = dscbuf.split("\n", 3)
 
-    ## The intercept with the y axis.
-    c = p[1]
+        if len(ls) >= 3 and ls[0].strip() == "A000000001":
+            try:
+                filetypeval = getBinaryFormat(size, ls[2])
+            except IOError:
+                lg.debug(" Bad DSC type line!")
+                filetypeval = 0
 
-    ## The model we're testing - a straight line in this case.
-    model = m*x + c
+        if filetypeval != 0:
+            lg.debug(" *--> This is a %s file." % (DATA_FILE_TYPES[filetypeval]))
+            return filetypeval
 
-    ## The result to return.
-    res = y - model
+    lg.debug(" This is not a valid data file.")
+    return filetypeval
 
-    # Return it!
-    return res
 
 def getLinearity(pixel_dict):
     """
     A helper function for finding the linearity of a cluster.
 
     The residuals are the perpendicular distances of each pixel
-    from the line of best fit.
+    from the line of best fit. See properties.getLinesOfBestFit,
+    which fits the lines of every cluster in a frame at once.
 
     @param [in] pixel_dict A dictionary of pixel {X:C} values.
     @returns m The gradient of the line of best fit.
@@ -134,155 +184,48 @@ def getLinearity(pixel_dict):
     lg.debug("*--> getLinearity called:")
     lg.debug("* %d pixels found." % (len(pixel_dict)))
 
-    #m, c, sumR, lin = 0.0, 0.0, 0.0, 0.0
-
-    ## The list of pixel x values.
-    xs = []
-
-    ## The list of pixel y values.
-    ys = []
-
-    # Loop over the pixels provided to get the x and y values.
-    for X, C in pixel_dict.iteritems():
-        x = float(X % 256)
-        y = float(X / 256)
-        xs.append(x)
-        ys.append(y)
-
-    ## An array of the pixel x values.
-    x_array = np.array(xs)
-
-    ## The y values.
-    y_array = np.array(ys)
-
     # If there are no pixels, return 0.0.
     if len(pixel_dict) == 0:
         lg.debug("*--> No pixels provided; exiting returning 0.0!")
         return None, None, None, None
 
-    # Check that it's not just a single pixel cluster.
-    if len(x_array) == 1:
-        lg.debug("*--> I am only one pixel! Exiting!")
-        #return None, None, None, None
-        return 0.0, x_array[0], 0.0, 0.0
-
-    # Get the equation of the line
-    #------------------------------
-
-    # Vertical line
-    # For a vertical line of pixels, all of the x values will be identical.
-    if xs.count(xs[0]) == len(xs): # Nifty little trick picked up from SE.
-        # d is the intercept on the x axis
-        #d = x_array[0]
-        return 999999.9, 999999.9, 0.0, 0.0
-
-    # Horizontal line
-    # For a horizontal line of pixels, all of the y values will be identical.
-    # We can just set m to 0 and c to y_i.
-    elif ys.count(ys[0]) == len(ys):
-        return 0.0, ys[0], 0.0, 0.0
-
-    # The line is at an angle to the axes - a bit more interesting!
-    else:
-        # A first guess from the "end" pixels.
-        # Note, however, that the "end" pixels may not be at the extremes
-        # of the cluster (to be investigated further...).
-        #
-        lg.debug("* --> Initial guesses from (%3d, %3d) - (%3d, %3d):" % \
-            (x_array[0], y_array[0], x_array[-1], y_array[-1]))
-
-        #m_init = ((y_array[-1])-(y_array[0]))/((x_array[-1])-(x_array[0]))
-        m_init = 0.0
-
-        c_init = y_array[0] - (m_init*(x_array[0]))
-
-        # A list of the initial guess parameters.
-        p0 = [m_init, c_init]
-        lg.debug("*--> Initial [m, c] = [% f, % f]" % (p0[0], p0[1]))
-
-        # The results of the least-squares finding.
-        plsq = leastsq(residuals, p0, args = (np.array(y_array), np.array(x_array)))
-
-        ## The gradient of the line.
-        m = plsq[0][0]
-
-        ## The intercept with the y axis.
-        c = plsq[0][1]
-
-        lg.debug("*--> Found   [m, c] = [% f, % f]" % (m, c))
-
-        # Now find the perpendicular distance of the pixel from the
-        # line (the residuals).
-
-        ## The denominator of |d| (the perpendicular distance).
-        #
-        # We only need this once, so we do it at the start of the loop.
-        denom = np.sqrt(1 + m*m)
-
-        ## The list of distances, one for each pixel.
-        ds = []
+    ## An array of the pixel X values.
+    Xs = np.fromiter(pixel_dict.iterkeys(), dtype=np.int64, count=len(pixel_dict))
 
-        # Loop over the pixels and calculate the distances.
-        for X, C in pixel_dict.iteritems():
-            x = X % 256
-            y = X / 256
+    ## The pixel x values.
+    x_array = (Xs % 256).astype(np.float64)
 
-            ## The numerator of |d| (the perpendicular distance).
-            numerator = np.fabs(m * x - y + c)
+    ## The pixel y values.
+    y_array = (Xs // 256).astype(np.float64)
 
-            ds.append(numerator/denom)
+    ms, cs, sumRs, lins = getLinesOfBestFit(x_array, y_array, np.zeros(len(Xs), dtype=np.int64), 1)
 
-        return m, c, sum(ds), sum(ds)/(float(len(pixel_dict)))
+    lg.debug("*--> Found   [m, c] = [% f, % f]" % (ms[0], cs[0]))
 
-    print("* ERROR - should not reach this point...")
+    return float(ms[0]), float(cs[0]), float(sumRs[0]), float(lins[0])
 
 def countEdgePixels(pixels_dict, rows, cols):
-    """ Count the number of edge pixels in the cluster. """
-
-    dir_x = [-1, -1,  0,  1,  1,  1,  0, -1]
-
-    dir_y = [ 0,  1,  1,  1,  0, -1, -1, -1]
-
-    ## The number of edge pixels in the cluster.
-    num_edge_pixels = 0
-
-    # Loop over the pixels in the cluster.
-    for X in pixels_dict.keys():
-
-        x = X%256
-
-        y = X/256
-
-        is_edge_pixel = False
-
-        # Loop over the directions.
-        for direction in range(8):
-
-            # The y poxition of the next pixel to scan.
-            ny = y + dir_y[direction]
-
-            # The x position of the next pixel to scan.
-            nx = x + dir_x[direction]
-
-            # The next pixel's X value.
-            nX = ny * cols + nx
-
-            #print "DEBUG: *-----* %1d->(% 1d, % 1d) is (%3d,%3d)->(%10d)" % \
-            #  (direction, self.dir_x[direction], self.dir_y[direction], nx, ny, nxy)
-            # If the next row or column is on an edge, skip it.
-            #if ny<0 or ny>=self.rows or nx<0 or nx>=self.cols:
-            #    continue
+    """
+    Count the number of edge pixels in the cluster.
+
+    An edge pixel is one with at least one of its eight neighbours not in
+    the cluster (or beyond the edge of the sensor). See
+    properties.getEdgePixelCounts for all of the clusters in a frame at once.
+    The pixels are counted with a bitset erosion (see bitset.countEdgeBits)
+    if the frame width is a multiple of the bitset word size, and with the
+    neighbour search of properties.getInteriorPixels if it isn't.
+
+    @param [in] pixels_dict A dictionary of pixel {X:C} values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns The number of edge pixels in the cluster.
+    """
 
-            # If the next X value is not in the pixel keys, we have an edge pixel.
-            if nX not in pixels_dict.keys():
-                #print "DEBUG: *-----* Found neighbour in self.pixels!"
-                #print "DEBUG: *     \\--* xy = %d" % (nxy)
-                #self.pixels[ xy].set_neighbour( direction,     nxy)
-                #self.pixels[nxy].set_neighbour((direction+4)%8, xy)
-                is_edge_pixel = True
-                break
+    ## The sorted pixel X values.
+    Xs = np.sort(np.fromiter(pixels_dict.iterkeys(), dtype=np.int64, count=len(pixels_dict)))
 
-        if is_edge_pixel:
-            num_edge_pixels += 1
+    # The bitsets need whole words for each row.
+    if cols % WORD_BITS != 0:
+        return int(np.sum(~getInteriorPixels(Xs, np.zeros(len(Xs), dtype=np.int64), rows, cols)))
 
-    return num_edge_pixels
+    return countEdgeBits(Xs, rows, cols)
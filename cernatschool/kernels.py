@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Optional JIT-compiled kernels for the clustering hot loops.
+
+The union-find neighbour scan and the interior (edge) pixel test are
+loops over the hits that don't vectorise cleanly. If numba is installed
+they are compiled the first time they are called; if not, the callers
+(labelling.labelUnionFind and properties.getInteriorPixels) use their
+own pure-Python/NumPy versions instead. Both give identical results.
+
+The kernels are written in the subset of Python that numba supports,
+so the uncompiled versions (see getPythonKernel) can also be run as-is.
+The kernel runs are counted, so that the cluster finder can record
+whether a compiled kernel was actually used for a frame (see
+kluster.KlusterFinder.getBackend).
+"""
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+#...for the JIT compiler (optional).
+try:
+    import numba
+except ImportError:
+    numba = None
+
+## The available kernel backends.
+BACKENDS = ["numba", "python"]
+
+## The kernel backend in use.
+_backend = "numba" if numba is not None else "python"
+
+## The number of times the kernels have been run.
+_n_calls = 0
+
+def getBackend():
+    """ The kernel backend in use ("numba" or "python"). """
+    return _backend
+
+def setBackend(backend):
+    """
+    Choose the kernel backend.
+
+    @param [in] backend "numba" (needs numba to be installed) or "python".
+    """
+
+    global _backend
+
+    if backend not in BACKENDS:
+        raise IOError("UNKNOWN_KERNEL_BACKEND")
+
+    if backend == "numba" and numba is None:
+        raise IOError("NO_JIT_COMPILER")
+
+    _backend = backend
+
+    lg.info(" * Using the '%s' kernel backend." % (backend))
+
+def useJit():
+    """ Should the callers use the compiled kernels? """
+    return _backend == "numba"
+
+def getNumberOfKernelCalls():
+    """
+    The number of times the kernels have been run (by the callers).
+
+    Compare the values before and after a piece of work to find out
+    whether a compiled kernel was actually used for it.
+    """
+    return _n_calls
+
+def countCalls(kernel):
+    """ Wrap a kernel so that its calls are counted (see getNumberOfKernelCalls). """
+
+    def run(*args):
+        global _n_calls
+        _n_calls += 1
+        return kernel(*args)
+
+    run.__name__ = kernel.__name__; run.__doc__ = kernel.__doc__
+
+    return run
+
+def unionFindLabels(Xs, rows, cols, diagonals):
+    """
+    Label the connected clusters with a raster-order union-find pass.
+
+    This is the same algorithm as labelling.labelUnionFind, with the
+    visited pixels held in a flat (rows x cols) index array rather
+    than a dictionary.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] diagonals Are the diagonal neighbours included (8-connectivity)?
+    @returns The label (0 ... n-1) of each hit, in raster order of the clusters.
+    """
+
+    n = len(Xs)
+
+    ## The parent pointer of each hit.
+    parents = np.arange(n)
+
+    ## The hit index + 1 of each pixel visited so far (0 = not visited).
+    visited = np.zeros(rows * cols, dtype=np.int64)
+
+    ## The neighbour X values (W, NW, N, NE).
+    nbrs = np.empty(4, dtype=np.int64)
+
+    for i in range(n):
+
+        X = Xs[i]; x = X % cols
+
+        # The previously visited neighbours.
+        nn = 0
+        if x > 0:
+            nbrs[nn] = X - 1; nn += 1
+            if diagonals:
+                nbrs[nn] = X - cols - 1; nn += 1
+        nbrs[nn] = X - cols; nn += 1
+        if diagonals and x < cols - 1:
+            nbrs[nn] = X - cols + 1; nn += 1
+
+        for k in range(nn):
+            nX = nbrs[k]
+            if nX < 0 or visited[nX] == 0:
+                continue
+            j = visited[nX] - 1
+
+            # Find the roots, halving the paths as we go.
+            ri = i
+            while parents[ri] != ri:
+                parents[ri] = parents[parents[ri]]; ri = parents[ri]
+            rj = j
+            while parents[rj] != rj:
+                parents[rj] = parents[parents[rj]]; rj = parents[rj]
+
+            # Always keep the earlier root so the labels follow the raster order.
+            if ri < rj:
+                parents[rj] = ri
+            elif rj < ri:
+                parents[ri] = rj
+
+        visited[X] = i + 1
+
+    ## The label of each hit.
+    labels = np.empty(n, dtype=np.int64)
+
+    ## The label given to each root (-1 = none yet).
+    rootlabels = np.full(n, -1, dtype=np.int64)
+
+    n_labels = 0
+
+    for i in range(n):
+        r = i
+        while parents[r] != r:
+            parents[r] = parents[parents[r]]; r = parents[r]
+        if rootlabels[r] < 0:
+            rootlabels[r] = n_labels; n_labels += 1
+        labels[i] = rootlabels[r]
+
+    return labels
+
+def interiorPixels(Xs, labels, rows, cols):
+    """
+    Find which hits have all eight neighbours in the same cluster.
+
+    The same test as properties.getInteriorPixels, with the neighbours
+    looked up in a flat (rows x cols) label array.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] labels The cluster label of each hit.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns A boolean array, True for the interior (inner) pixels.
+    """
+
+    n = len(Xs)
+
+    ## The label + 1 of each pixel (0 = no hit).
+    image = np.zeros(rows * cols, dtype=np.int64)
+    for i in range(n):
+        image[Xs[i]] = labels[i] + 1
+
+    interior = np.zeros(n, dtype=np.bool_)
+
+    for i in range(n):
+
+        X = Xs[i]; x = X % cols; y = X // cols
+
+        # Pixels on the edge of the sensor can't be interior pixels.
+        if x == 0 or y == 0 or x == cols - 1 or y == rows - 1:
+            continue
+
+        inner = True
+        for dy in range(-1, 2):
+            for dx in range(-1, 2):
+                if image[X + (dy * cols) + dx] != labels[i] + 1:
+                    inner = False
+        interior[i] = inner
+
+    return interior
+
+## The uncompiled kernels { name : function }.
+_python_kernels = {
+    "unionFindLabels" : unionFindLabels,
+    "interiorPixels"  : interiorPixels,
+    }
+
+if numba is not None:
+    unionFindLabels = numba.njit(unionFindLabels)
+    interiorPixels = numba.njit(interiorPixels)
+
+unionFindLabels = countCalls(unionFindLabels)
+interiorPixels = countCalls(interiorPixels)
+
+def getPythonKernel(name):
+    """ Get the uncompiled version of a kernel (for testing). """
+    return _python_kernels[name]
@@ -4,9 +4,6 @@
 #...for the logging.
 import logging as lg
 
-#...for copying.
-from copy import deepcopy
-
 #...for the MATH.
 import numpy as np
 
@@ -22,6 +19,27 @@ from pixel import *
 #...for the linearity calculations.
 from helpers import getLinearity, countEdgePixels
 
+#...for the pixel export.
+from handlers import getPixelsString
+
+#...for the labelling engines.
+from labelling import ENGINES, STRUCTURES, AUTO_ENGINE, getHitArrays, labelSpatialHash, chooseEngine, getEngineThresholds
+
+#...for the frame-wide cluster properties.
+from properties import getKlusterProperties, getHitLabels, getShapeDescriptors, getPropertyClosure
+
+#...for the groups of properties calculated together.
+from properties import LINE_PROPERTIES, EDGE_PROPERTIES, SHAPE_PROPERTIES
+
+#...for the pixel masks.
+from masks import getMaskArray, applyMask
+
+#...for the (optional) compiled kernels.
+import kernels
+
+#...for the small cluster shapes.
+from shapes import MAX_SHAPE_SIZE, SHAPE_TABLE, getShapeCode, getShapeCodes, getShapeRadius, isGammaCandidate
+
 class Kluster:
     """
     Wrapper class for klusters.
@@ -29,13 +47,17 @@ class Kluster:
     @param [in] rows The number of rows in the originating frame.
     @param [in] cols The number of columns in the originating frame.
     @param [in] ismc Is the cluster from a Monte Carlo simulation?
+    @param [in] properties The properties to calculate (see properties.getPropertyClosure; None for all).
     """
 
-    def __init__(self, rows, cols, ismc):
+    def __init__(self, rows, cols, ismc, properties=None):
         """ Constructor. """
 
         lg.debug(" Instantiating a Kluster object.")
 
+        ## The properties to calculate.
+        self.__properties = getPropertyClosure(None) if properties is None else properties
+
         self.dbg = True
 
         ## The number of rows in the frame.
@@ -53,9 +75,6 @@ class Kluster:
         ## A dictionary of the pixels {X:C} (populated after clustering).
         self.__pixel_dict = {}
 
-        ## Multiline JSON entry for the pixel.
-        self.pixel_string = "" #
-
         # Spatial properties.
         #
         ## The minimum x value.
@@ -82,6 +101,48 @@ class Kluster:
         ## The unweighted cluster y position [pixels].
         self.__y_uw = None
 
+        ## The unweighted cluster radius [pixels].
+        self.__r_uw = None
+
+        ## The spatial density [pixel^-1].
+        self.__rho_uw = None
+
+        ## The count-weighted cluster x position [pixels].
+        self.__x_w = None
+
+        ## The count-weighted cluster y position [pixels].
+        self.__y_w = None
+
+        ## The count-weighted cluster radius [pixels].
+        self.__r_w = None
+
+        ## The count density [counts pixel^-2].
+        self.__rho_w = None
+
+        # Shape descriptors
+        #-------------------
+
+        ## The eccentricity of the pixel distribution.
+        self.__eccentricity = None
+
+        ## The angle of the principal axis from the x axis [deg.].
+        self.__orientation = None
+
+        ## The major axis length [pixels].
+        self.__axis_major = None
+
+        ## The minor axis length [pixels].
+        self.__axis_minor = None
+
+        ## The convex hull area [pixels^2].
+        self.__hull_area = None
+
+        ## The convex hull perimeter [pixels].
+        self.__hull_perimeter = None
+
+        ## The fraction of the bounding box filled by the pixels.
+        self.__bbox_fill = None
+
         # Unweighted (u subsctript)
         self.r_u     = -1.0
         self.spatial_density_u = -1.0
@@ -188,6 +249,39 @@ class Kluster:
     def getDensityUW(self):
         return self.__rho_uw
 
+    def getXW(self):
+        return self.__x_w
+
+    def getYW(self):
+        return self.__y_w
+
+    def getRadiusW(self):
+        return self.__r_w
+
+    def getDensityW(self):
+        return self.__rho_w
+
+    def getEccentricity(self):
+        return self.__eccentricity
+
+    def getOrientation(self):
+        return self.__orientation
+
+    def getMajorAxisLength(self):
+        return self.__axis_major
+
+    def getMinorAxisLength(self):
+        return self.__axis_minor
+
+    def getHullArea(self):
+        return self.__hull_area
+
+    def getHullPerimeter(self):
+        return self.__hull_perimeter
+
+    def getBoundingBoxFill(self):
+        return self.__bbox_fill
+
     def getMaxCountValue(self):
         return self.__count_max
 
@@ -220,16 +314,11 @@ class Kluster:
 
     def isGamma(self):
         """ Is the cluster a gamma candidate? """
-        npix = self.getNumberOfPixels()
-        rad = self.getRadiusUW()
-        return npix == 1 or npix == 2 or (npix==3 and rad<TRIPIXEL_RADIUS) or (npix==4 and rad<TETRAPIXEL_RADIUS)
+        return isGammaCandidate(self.getNumberOfPixels(), self.getRadiusUW())
 
     def process(self, pixels):
         #
-        # Note that the pixels are stored in and obtained from the KlusterFinder.
-
-        # Start the string for the pixel JSON
-        self.pixels_string  = "pixels = [\n"
+        # Note that the pixels {X:C} are stored in and obtained from the KlusterFinder.
 
         xs = []
 
@@ -241,11 +330,11 @@ class Kluster:
         #for bxy in self.pixel_xy_list:
         for X in self.pixel_xy_list:
 
-            x = float(pixels[X].get_x())
+            x = float(X % self.__frame_cols)
 
-            y = float(pixels[X].get_y())
+            y = float(X / self.__frame_cols)
 
-            c = float(pixels[X].getC())
+            c = float(pixels[X])
 
             xs.append(x)
 
@@ -253,16 +342,9 @@ class Kluster:
 
             cs.append(c)
 
-            # Add the pixel to the pixel JSON text.
-            self.pixels_string += "  " + pixels[X].pixel_entry()
-
             # Add to the cluster's own pixel dictionary.
             self.__pixel_dict[X] = c
 
-
-        # End the string for the pixel JSON
-        self.pixels_string += "]"
-
         self.__xmin = min(xs)
 
         self.__xmax = max(xs)
@@ -282,21 +364,26 @@ class Kluster:
         self.__y_uw = np.mean(ys)
 
 
+        ## The properties to calculate.
+        needed = self.__properties
+
         # Calculate the cluster radius
         #------------------------------
-        # Firstly, we calculate the distance between each pixel and the centre.
-        r_i = [np.sqrt( (float(X%256) - self.__x_uw)*(float(X%256) - self.__x_uw) \
-                     +  (float(X/256) - self.__y_uw)*(float(X/256) - self.__y_uw) ) \
-            for X in self.__pixel_dict.keys()]
+        if "radius_uw" in needed:
+            # Firstly, we calculate the distance between each pixel and the centre.
+            r_i = [np.sqrt( (float(X%256) - self.__x_uw)*(float(X%256) - self.__x_uw) \
+                         +  (float(X/256) - self.__y_uw)*(float(X/256) - self.__y_uw) ) \
+                for X in self.__pixel_dict.keys()]
 
-        # Then we find the maximum of these distances. This is the cluster radius.
-        self.__r_uw = max(r_i)
+            # Then we find the maximum of these distances. This is the cluster radius.
+            self.__r_uw = max(r_i)
 
         # Find the spatial density
-        if self.__r_uw > 0.0:
-            self.__rho_uw = float(len(self.pixel_xy_list))/(self.__r_uw * self.__r_uw * np.pi)
-        else:
-            self.__rho_uw = 0.0
+        if "density_uw" in needed:
+            if self.__r_uw > 0.0:
+                self.__rho_uw = float(len(self.pixel_xy_list))/(self.__r_uw * self.__r_uw * np.pi)
+            else:
+                self.__rho_uw = 0.0
 
 
         # Cluster counts
@@ -305,33 +392,66 @@ class Kluster:
         ## The total counts in the cluster.
         self.__total_counts = self.getTotalCounts()
 
+        # Count-weighted properties
+        #---------------------------
+        # These use the x, y and count values already collected above.
+        if "x_w" in needed or "y_w" in needed:
+            if sum(cs) > 0.0:
+                self.__x_w = np.average(xs, weights=cs)
+                self.__y_w = np.average(ys, weights=cs)
+            else:
+                self.__x_w = self.__x_uw
+                self.__y_w = self.__y_uw
+
+        # The weighted radius is the largest distance of a pixel from the weighted centre.
+        if "radius_w" in needed:
+            self.__r_w = np.sqrt(((np.array(xs) - self.__x_w)**2 + (np.array(ys) - self.__y_w)**2).max())
+
+        # Find the count density
+        if "density_w" in needed:
+            if self.__r_w > 0.0:
+                self.__rho_w = float(self.__total_counts)/(self.__r_w * self.__r_w * np.pi)
+            else:
+                self.__rho_w = 0.0
+
         ## The maximum count value in the cluster.
         self.__count_max = max(cs)
 
         # Linearity information
         #-----------------------
-        self.__lin_m, self.__lin_c, self.__lin_sumR, self.__linearity = getLinearity(self.__pixel_dict)
+        if needed & LINE_PROPERTIES:
+            self.__lin_m, self.__lin_c, self.__lin_sumR, self.__linearity = getLinearity(self.__pixel_dict)
+
+        # Shape descriptors
+        #-------------------
+        if needed & SHAPE_PROPERTIES:
+            self.__setShapeDescriptors(getShapeDescriptors(np.array(sorted(self.pixel_xy_list)), \
+                np.zeros(len(self.pixel_xy_list), dtype=np.int64), self.__frame_rows, self.__frame_cols)[0])
 
         # Edge pixel information.
-        self.__n_edge = countEdgePixels(self.__pixel_dict, self.__frame_rows, self.__frame_cols)
+        if needed & EDGE_PROPERTIES:
+            self.__n_edge = countEdgePixels(self.__pixel_dict, self.__frame_rows, self.__frame_cols)
 
-        self.__outer_pixels_frac = float(self.__n_edge)/float(len(self.__pixel_dict))
+            self.__outer_pixels_frac = float(self.__n_edge)/float(len(self.__pixel_dict))
 
-        self.__inner_pixels_frac = 1.0 - self.__outer_pixels_frac
+            self.__inner_pixels_frac = 1.0 - self.__outer_pixels_frac
 
-        if 0 in xs or 0 in ys or 255 in xs or 255 in ys:
-            self.__is_edge_kluster = True
-        else:
-            self.__is_edge_kluster = False
+        # Is the cluster on the edge of the sensor (whatever the frame size)?
+        self.__is_edge_kluster = bool(min(xs) == 0 or min(ys) == 0 or \
+            max(xs) == self.__frame_cols - 1 or max(ys) == self.__frame_rows - 1)
 
         # TMP
         self.__energy_total = 0.0
         self.__energy_max = 0.0
 
+        # Only format the debug output if someone is going to read it.
+        if not lg.getLogger().isEnabledFor(lg.DEBUG):
+            return
+
         lg.debug("*")
         lg.debug("* NEW CLUSTER:")
         lg.debug("*")
-        lg.debug(self.pixels_string)
+        lg.debug(self.getPixelsString("json"))
         lg.debug("*")
         lg.debug("* Cluster properties:")
         lg.debug("*")
@@ -350,15 +470,40 @@ class Kluster:
         lg.debug("*")
         lg.debug("* UNWEIGHTED:")
         lg.debug("* Cluster (x, y) = (%6.2f, %6.2f)" % (self.__x_uw, self.__y_uw))
-        lg.debug("* Cluster radius               = %10.5f" % self.__r_uw)
-        lg.debug("* Cluster spatial density \\rho = %10.5f" % self.__rho_uw)
-        lg.debug("*")
-        lg.debug("* Line of best fit:          %f * x %+f" % (self.__lin_m, self.__lin_c))
-        lg.debug("* Sum of residuals \Sum{R} = %f" % (self.__lin_sumR))
-        lg.debug("* Linearity                = %f" % (self.__linearity))
-        lg.debug("*")
-        lg.debug("* Number of edge pixels    = %5d" % (self.__n_edge))
+        if self.__rho_uw is not None:
+            lg.debug("* Cluster radius               = %10.5f" % self.__r_uw)
+            lg.debug("* Cluster spatial density \\rho = %10.5f" % self.__rho_uw)
         lg.debug("*")
+        if self.__rho_w is not None:
+            lg.debug("* WEIGHTED:")
+            lg.debug("* Cluster (x, y) = (%6.2f, %6.2f)" % (self.__x_w, self.__y_w))
+            lg.debug("* Cluster radius               = %10.5f" % self.__r_w)
+            lg.debug("* Cluster count density        = %10.5f" % self.__rho_w)
+            lg.debug("*")
+        if self.__linearity is not None:
+            lg.debug("* Line of best fit:          %f * x %+f" % (self.__lin_m, self.__lin_c))
+            lg.debug("* Sum of residuals \Sum{R} = %f" % (self.__lin_sumR))
+            lg.debug("* Linearity                = %f" % (self.__linearity))
+            lg.debug("*")
+        if self.__eccentricity is not None:
+            lg.debug("* SHAPE:")
+            lg.debug("* Eccentricity             = %f" % (self.__eccentricity))
+            lg.debug("* Orientation              = %f" % (self.__orientation))
+            lg.debug("* Major, minor axes        = %f, %f" % (self.__axis_major, self.__axis_minor))
+            lg.debug("* Hull area, perimeter     = %f, %f" % (self.__hull_area, self.__hull_perimeter))
+            lg.debug("* Bounding box fill        = %f" % (self.__bbox_fill))
+            lg.debug("*")
+        if self.__n_edge is not None:
+            lg.debug("* Number of edge pixels    = %5d" % (self.__n_edge))
+            lg.debug("*")
+
+    def __setShapeDescriptors(self, s):
+        """ Set the shape descriptors from a row of properties.getShapeDescriptors. """
+
+        self.__eccentricity = float(s["eccentricity"]); self.__orientation = float(s["orientation"])
+        self.__axis_major = float(s["axis_major"]); self.__axis_minor = float(s["axis_minor"])
+        self.__hull_area = float(s["hull_area"]); self.__hull_perimeter = float(s["hull_perimeter"])
+        self.__bbox_fill = float(s["bbox_fill"])
 
     def getKlusterPropertiesJson(self):
 
@@ -376,12 +521,23 @@ class Kluster:
             "y_uw"          : self.getYUW(),            \
             "radius_uw"     : self.getRadiusUW(),       \
             "density_uw"    : self.getDensityUW(),      \
+            "x_w"           : self.getXW(),             \
+            "y_w"           : self.getYW(),             \
+            "radius_w"      : self.getRadiusW(),        \
+            "density_w"     : self.getDensityW(),       \
             "totalcounts"   : self.getTotalCounts(),    \
             "maxcounts"     : self.getMaxCountValue(),  \
             "lin_m"         : m,                        \
             "lin_c"         : c,                        \
             "lin_sumofres"  : sumR,                     \
             "lin_linearity" : self.getLinearity(),      \
+            "eccentricity"  : self.getEccentricity(),   \
+            "orientation"   : self.getOrientation(),    \
+            "axis_major"    : self.getMajorAxisLength(),\
+            "axis_minor"    : self.getMinorAxisLength(),\
+            "hull_area"     : self.getHullArea(),       \
+            "hull_perimeter": self.getHullPerimeter(),  \
+            "bbox_fill"     : self.getBoundingBoxFill(),\
             #"n_edgepixels"  :, \
             #"edgefrac"      :, \
             #"innerfrac"     :, \
@@ -391,11 +547,406 @@ class Kluster:
             #"maxenergy"     :, \
             #"frameid"       :\
             }
-        return p
+
+        # Leave out the properties that weren't calculated.
+        return dict((key, value) for key, value in p.iteritems() if value is not None)
 
     def getPixelMap(self):
         return self.__pixel_dict
 
+    def getPixelsString(self, fmt="json"):
+        """ Serialise the cluster's pixels ("json", "text" or "binary"). """
+        return getPixelsString(self.pixel_xy_list, [self.__pixel_dict[X] for X in self.pixel_xy_list], self.__frame_cols, fmt)
+
+
+class CompactKluster(object):
+    """
+    A compact, array-backed alternative to the Kluster class.
+
+    The pixel X values and counts are held in two NumPy arrays and the
+    cluster properties in __slots__, so there are no per-pixel objects,
+    no per-cluster dictionaries and no instance __dict__. The accessor
+    API is that of the Kluster class.
+
+    @param [in] rows The number of rows in the originating frame.
+    @param [in] cols The number of columns in the originating frame.
+    @param [in] ismc Is the cluster from a Monte Carlo simulation?
+    @param [in] Xs The pixel X values (X = y*cols + x).
+    @param [in] Cs The pixel count values.
+    @param [in] props The cluster's row from properties.getKlusterProperties (optional).
+    @param [in] properties The properties to calculate (see properties.getPropertyClosure; None for all).
+    """
+
+    __slots__ = [
+        "__frame_rows", "__frame_cols", "__is_mc",
+        "__Xs", "__Cs",
+        "__xmin", "__xmax", "__ymin", "__ymax", "__width", "__height",
+        "__x_uw", "__y_uw", "__r_uw", "__rho_uw",
+        "__x_w", "__y_w", "__r_w", "__rho_w",
+        "__total_counts", "__count_max",
+        "__lin_m", "__lin_c", "__lin_sumR", "__linearity",
+        "__eccentricity", "__orientation", "__axis_major", "__axis_minor",
+        "__hull_area", "__hull_perimeter", "__bbox_fill",
+        "__energy_total", "__energy_max",
+        "__n_edge", "__inner_pixels_frac", "__outer_pixels_frac",
+        "__is_edge_kluster",
+        "__props", "__properties",
+        ]
+
+    ## The data type used for the pixel X values.
+    X_DTYPE = np.int32
+
+    ## The data type used for the pixel count values.
+    C_DTYPE = np.int32
+
+    def __init__(self, rows, cols, ismc, Xs, Cs, props=None, properties=None):
+        """ Constructor. """
+
+        ## The number of rows in the frame.
+        self.__frame_rows = rows
+
+        ## The number of columns in the frame.
+        self.__frame_cols = cols
+
+        ## Is the cluster from Monte Carlo simulation?
+        self.__is_mc = ismc
+
+        ## The pixel X values.
+        self.__Xs = np.asarray(Xs, dtype=self.X_DTYPE)
+
+        ## The pixel count values.
+        self.__Cs = np.asarray(Cs, dtype=self.C_DTYPE)
+
+        ## The total counts.
+        self.__total_counts = int(self.__Cs.sum())
+
+        # The remaining properties are set by process().
+        self.__xmin = None; self.__xmax = None; self.__ymin = None; self.__ymax = None
+        self.__width = None; self.__height = None
+        self.__x_uw = None; self.__y_uw = None; self.__r_uw = None; self.__rho_uw = None
+        self.__x_w = None; self.__y_w = None; self.__r_w = None; self.__rho_w = None
+        self.__count_max = None
+        self.__lin_m = None; self.__lin_c = None; self.__lin_sumR = None; self.__linearity = None
+        self.__eccentricity = None; self.__orientation = None
+        self.__axis_major = None; self.__axis_minor = None
+        self.__hull_area = None; self.__hull_perimeter = None; self.__bbox_fill = None
+        self.__energy_total = None; self.__energy_max = None
+        self.__n_edge = None; self.__inner_pixels_frac = None; self.__outer_pixels_frac = None
+        self.__is_edge_kluster = None
+
+        ## The precalculated properties (if any).
+        self.__props = props
+
+        ## The properties to calculate.
+        self.__properties = getPropertyClosure(None) if properties is None else properties
+
+    def __lt__(self, other):
+        return self.getNumberOfPixels() < other.getNumberOfPixels()
+
+    def get_pixel_xy_list(self):
+        return self.__Xs.tolist()
+
+    def contains_pixel(self, pixel_xy):
+        return pixel_xy in self.__Xs
+
+    def getPixelXs(self):
+        return self.__Xs
+
+    def getPixelCs(self):
+        return self.__Cs
+
+    def getNumberOfPixels(self):
+        return len(self.__Xs)
+
+    def getTotalCounts(self):
+        return self.__total_counts
+
+    def getWidth(self):
+        if self.__width is None: raise IOError("UNPROCESSED_KLUSTER")
+        return self.__width
+
+    def getHeight(self):
+        if self.__height is None: raise IOError("UNPROCESSED_KLUSTER")
+        return self.__height
+
+    def getXMin(self):
+        if self.__xmin is None: raise IOError("UNPROCESSED_KLUSTER")
+        return self.__xmin
+
+    def getXMax(self):
+        if self.__xmax is None: raise IOError("UNPROCESSED_KLUSTER")
+        return self.__xmax
+
+    def getYMin(self):
+        if self.__ymin is None: raise IOError("UNPROCESSED_KLUSTER")
+        return self.__ymin
+
+    def getYMax(self):
+        if self.__ymax is None: raise IOError("UNPROCESSED_KLUSTER")
+        return self.__ymax
+
+    def getXUW(self):
+        return self.__x_uw
+
+    def getYUW(self):
+        return self.__y_uw
+
+    def getRadiusUW(self):
+        return self.__r_uw
+
+    def getDensityUW(self):
+        return self.__rho_uw
+
+    def getXW(self):
+        return self.__x_w
+
+    def getYW(self):
+        return self.__y_w
+
+    def getRadiusW(self):
+        return self.__r_w
+
+    def getDensityW(self):
+        return self.__rho_w
+
+    def getEccentricity(self):
+        return self.__eccentricity
+
+    def getOrientation(self):
+        return self.__orientation
+
+    def getMajorAxisLength(self):
+        return self.__axis_major
+
+    def getMinorAxisLength(self):
+        return self.__axis_minor
+
+    def getHullArea(self):
+        return self.__hull_area
+
+    def getHullPerimeter(self):
+        return self.__hull_perimeter
+
+    def getBoundingBoxFill(self):
+        return self.__bbox_fill
+
+    def getMaxCountValue(self):
+        return self.__count_max
+
+    def getLineOfBestFitValues(self):
+        return self.__lin_m, self.__lin_c, self.__lin_sumR
+
+    def getLinearity(self):
+        return self.__linearity
+
+    def getTotalEnergy(self):
+        return self.__energy_total
+
+    def getMaxEnergy(self):
+        return self.__energy_max
+
+    def getNumberOfEdgePixels(self):
+        return self.__n_edge
+
+    def getInnerPixelFraction(self):
+        return self.__inner_pixels_frac
+
+    def getOuterPixelFraction(self):
+        return self.__outer_pixels_frac
+
+    def isEdgeCluster(self):
+        return self.__is_edge_kluster
+
+    def isMC(self):
+        return self.__is_mc
+
+    def isGamma(self):
+        """ Is the cluster a gamma candidate? """
+        return isGammaCandidate(self.getNumberOfPixels(), self.getRadiusUW())
+
+    def process(self, pixels=None):
+        """ Calculate the cluster properties from the pixel arrays. """
+
+        # Use the frame-wide properties, if they have been supplied.
+        if self.__props is not None:
+            self.__setProperties(self.__props)
+            return
+
+        ## The pixel x values.
+        xs = (self.__Xs % self.__frame_cols).astype(np.float64)
+
+        ## The pixel y values.
+        ys = (self.__Xs // self.__frame_cols).astype(np.float64)
+
+        self.__xmin = xs.min(); self.__xmax = xs.max()
+
+        self.__ymin = ys.min(); self.__ymax = ys.max()
+
+        self.__width = self.__xmax - self.__xmin + 1
+
+        self.__height = self.__ymax - self.__ymin + 1
+
+        self.__x_uw = np.mean(xs)
+
+        self.__y_uw = np.mean(ys)
+
+        ## The properties to calculate.
+        needed = self.__properties
+
+        # The cluster radius is the largest distance of a pixel from the centre.
+        if "radius_uw" in needed:
+            self.__r_uw = np.sqrt(((xs - self.__x_uw)**2 + (ys - self.__y_uw)**2).max())
+
+        # Find the spatial density
+        if "density_uw" in needed:
+            if self.__r_uw > 0.0:
+                self.__rho_uw = float(len(self.__Xs))/(self.__r_uw * self.__r_uw * np.pi)
+            else:
+                self.__rho_uw = 0.0
+
+        ## The maximum count value in the cluster.
+        self.__count_max = float(self.__Cs.max())
+
+        # The count-weighted centre, radius and count density.
+        if "x_w" in needed or "y_w" in needed:
+            if self.__total_counts > 0:
+                self.__x_w = np.average(xs, weights=self.__Cs)
+                self.__y_w = np.average(ys, weights=self.__Cs)
+            else:
+                self.__x_w = self.__x_uw
+                self.__y_w = self.__y_uw
+
+        if "radius_w" in needed:
+            self.__r_w = np.sqrt(((xs - self.__x_w)**2 + (ys - self.__y_w)**2).max())
+
+        if "density_w" in needed:
+            if self.__r_w > 0.0:
+                self.__rho_w = float(self.__total_counts)/(self.__r_w * self.__r_w * np.pi)
+            else:
+                self.__rho_w = 0.0
+
+        # Linearity information
+        if needed & LINE_PROPERTIES:
+            self.__lin_m, self.__lin_c, self.__lin_sumR, self.__linearity = getLinearity(self.getPixelMap())
+
+        # Shape descriptors
+        if needed & SHAPE_PROPERTIES:
+            self.__setShapeDescriptors(getShapeDescriptors(np.sort(self.__Xs), \
+                np.zeros(len(self.__Xs), dtype=np.int64), self.__frame_rows, self.__frame_cols)[0])
+
+        # Edge pixel information.
+        if needed & EDGE_PROPERTIES:
+            self.__n_edge = countEdgePixels(self.getPixelMap(), self.__frame_rows, self.__frame_cols)
+
+            self.__outer_pixels_frac = float(self.__n_edge)/float(len(self.__Xs))
+
+            self.__inner_pixels_frac = 1.0 - self.__outer_pixels_frac
+
+        self.__is_edge_kluster = bool(self.__xmin == 0 or self.__ymin == 0 or \
+            self.__xmax == self.__frame_cols - 1 or self.__ymax == self.__frame_rows - 1)
+
+        # TMP
+        self.__energy_total = 0.0
+        self.__energy_max = 0.0
+
+    def __setProperties(self, p):
+        """ Set the cluster properties from a row of the frame-wide properties. """
+
+        self.__xmin = float(p["xmin"]); self.__xmax = float(p["xmax"])
+        self.__ymin = float(p["ymin"]); self.__ymax = float(p["ymax"])
+        self.__width = float(p["width"]); self.__height = float(p["height"])
+        self.__x_uw = float(p["x_uw"]); self.__y_uw = float(p["y_uw"])
+        self.__count_max = float(p["maxcounts"])
+        self.__is_edge_kluster = bool(p["isedgekluster"])
+
+        ## The properties that were calculated.
+        needed = self.__properties
+
+        if "radius_uw" in needed: self.__r_uw = float(p["radius_uw"])
+        if "density_uw" in needed: self.__rho_uw = float(p["density_uw"])
+        if "x_w" in needed or "y_w" in needed:
+            self.__x_w = float(p["x_w"]); self.__y_w = float(p["y_w"])
+        if "radius_w" in needed: self.__r_w = float(p["radius_w"])
+        if "density_w" in needed: self.__rho_w = float(p["density_w"])
+
+        # Linearity information
+        if needed & LINE_PROPERTIES:
+            self.__lin_m = float(p["lin_m"]); self.__lin_c = float(p["lin_c"])
+            self.__lin_sumR = float(p["lin_sumofres"]); self.__linearity = float(p["lin_linearity"])
+
+        # Shape descriptors
+        if needed & SHAPE_PROPERTIES:
+            self.__setShapeDescriptors(p)
+
+        if needed & EDGE_PROPERTIES:
+            self.__n_edge = int(p["n_edgepixels"])
+            self.__outer_pixels_frac = float(p["edgefrac"])
+            self.__inner_pixels_frac = float(p["innerfrac"])
+
+        # TMP
+        self.__energy_total = 0.0
+        self.__energy_max = 0.0
+
+        # The row is no longer needed.
+        self.__props = None
+
+    def __setShapeDescriptors(self, s):
+        """ Set the shape descriptors from a row of properties.getShapeDescriptors. """
+
+        self.__eccentricity = float(s["eccentricity"]); self.__orientation = float(s["orientation"])
+        self.__axis_major = float(s["axis_major"]); self.__axis_minor = float(s["axis_minor"])
+        self.__hull_area = float(s["hull_area"]); self.__hull_perimeter = float(s["hull_perimeter"])
+        self.__bbox_fill = float(s["bbox_fill"])
+
+    def getKlusterPropertiesJson(self):
+
+        m, c, sumR = self.getLineOfBestFitValues()
+
+        p = {\
+            "size"          : self.getNumberOfPixels(), \
+            "xmin"          : self.getXMin(),           \
+            "xmax"          : self.getXMax(),           \
+            "ymin"          : self.getYMin(),           \
+            "ymax"          : self.getYMax(),           \
+            "width"         : self.getWidth(),          \
+            "height"        : self.getHeight(),         \
+            "x_uw"          : self.getXUW(),            \
+            "y_uw"          : self.getYUW(),            \
+            "radius_uw"     : self.getRadiusUW(),       \
+            "density_uw"    : self.getDensityUW(),      \
+            "x_w"           : self.getXW(),             \
+            "y_w"           : self.getYW(),             \
+            "radius_w"      : self.getRadiusW(),        \
+            "density_w"     : self.getDensityW(),       \
+            "totalcounts"   : self.getTotalCounts(),    \
+            "maxcounts"     : self.getMaxCountValue(),  \
+            "lin_m"         : m,                        \
+            "lin_c"         : c,                        \
+            "lin_sumofres"  : sumR,                     \
+            "lin_linearity" : self.getLinearity(),      \
+            "eccentricity"  : self.getEccentricity(),   \
+            "orientation"   : self.getOrientation(),    \
+            "axis_major"    : self.getMajorAxisLength(),\
+            "axis_minor"    : self.getMinorAxisLength(),\
+            "hull_area"     : self.getHullArea(),       \
+            "hull_perimeter": self.getHullPerimeter(),  \
+            "bbox_fill"     : self.getBoundingBoxFill(),\
+            }
+
+        # Leave out the properties that weren't calculated.
+        return dict((key, value) for key, value in p.iteritems() if value is not None)
+
+    def getPixelMap(self):
+        """ The cluster's pixels as a {X:C} dictionary (built on request). """
+        return dict(zip(self.__Xs.tolist(), self.__Cs.tolist()))
+
+    def getPixelsString(self, fmt="json"):
+        """ Serialise the cluster's pixels ("json", "text" or "binary"). """
+        return getPixelsString(self.__Xs, self.__Cs, self.__frame_cols, fmt)
+
+
+## The cluster properties the KlusterFinder needs to find the gamma candidates.
+FINDER_PROPERTIES = ["size", "radius_uw"]
 
 class KlusterFinder:
     """
@@ -407,7 +958,7 @@ class KlusterFinder:
     dir_x = [-1, -1,  0,  1,  1,  1,  0, -1]
     dir_y = [ 0,  1,  1,  1,  0, -1, -1, -1]
 
-    def __init__(self, data, r, c, ismc, maskdict={}):
+    def __init__(self, data, r, c, ismc, maskdict={}, engine="legacy", connectivity=8, radius=None, gammas=True, thresholds=None, properties=None):
 
         """
         Constructor.
@@ -416,7 +967,16 @@ class KlusterFinder:
         @param [in] r The number of rows in the originating frame.
         @param [in] c The number of columns in the originating frame.
         @param [in] ismc Is the cluster from simulated data?
-        @param [in] maskdict A dictionary of masked pixels.
+        @param [in] maskdict The masked pixels - a dictionary {X:...}, a sorted
+                             array of X values or a boolean (rows x cols) array.
+        @param [in] engine The clustering engine ("legacy", "auto" or one of labelling.ENGINES).
+        @param [in] connectivity The pixel connectivity (4 or 8).
+        @param [in] radius Join hits within this distance [pixels]. Only the "spatialhash"
+                           engine can do this, so if a radius is given it is used
+                           instead of the engine asked for (see getEngine).
+        @param [in] gammas Build cluster objects for the gamma candidates too?
+        @param [in] thresholds The engine choice thresholds to change (for "auto"; see labelling.chooseEngine).
+        @param [in] properties The names of the cluster properties needed (None for all of them).
         """
         lg.debug(""); lg.debug(" Instantiating a cluster finder object."); lg.debug("")
 
@@ -433,13 +993,91 @@ class KlusterFinder:
         ## Are we looking at simulated data?
         self.__is_mc = ismc
 
-        self.__pixel_map = deepcopy(data)
+        ## The clustering engine (for "auto", the engine chosen for this frame).
+        self.__engine = engine
+
+        ## The engine choice thresholds (for "auto" only).
+        self.__thresholds = getEngineThresholds(thresholds) if engine == AUTO_ENGINE else None
+
+        if connectivity not in STRUCTURES:
+            raise IOError("BAD_CONNECTIVITY")
+
+        ## The pixel connectivity (4 or 8).
+        self.__connectivity = connectivity
+
+        ## The joining distance [pixels] for gap-tolerant clustering.
+        self.__radius = radius
+
+        ## The frame-wide cluster properties (array-based engines only).
+        self.__kluster_props = None
+
+        # Gap-tolerant clustering needs the spatial hash grid (whatever the engine asked for).
+        if radius is not None:
+            if engine != "spatialhash":
+                lg.info(" * Using the 'spatialhash' engine rather than '%s' to join hits within %f pixels." % (engine, radius))
+            self.__engine = "spatialhash"
+
+        ## The directions (see dir_x, dir_y) in which pixels are neighbours.
+        self.__directions = range(8) if connectivity == 8 else range(0, 8, 2)
+
+        ## The pixel map {X:C} - the caller's, which is never copied or changed.
+        self.__pixel_map = data
+
+        ## The masked pixels (a boolean array, True = masked), or None.
+        self.__mask = getMaskArray(maskdict, self.rows, self.cols)
+
+        ## Build cluster objects for the gamma candidates?
+        self.__keep_gammas = gammas
+
+        ## The cluster properties to calculate (with those needed to find the gamma candidates).
+        self.__properties = getPropertyClosure(None if properties is None else list(properties) + FINDER_PROPERTIES)
+
+        ## The number of clusters found (including any gamma candidates not kept).
+        self.__n_klusters = 0
+
+        ## The number of gamma candidates.
+        self.__n_gammas = 0
+
+        ## The number of monopixel candidates.
+        self.__n_g1 = 0
+
+        ## The number of bipixel candidates.
+        self.__n_g2 = 0
+
+        ## The number of tripixel candidates.
+        self.__n_g3 = 0
+
+        ## The number of tetrapixel candidates.
+        self.__n_g4 = 0
+
+        ## The number of kernel calls made before the clusters were found.
+        n_calls = kernels.getNumberOfKernelCalls()
+
+        # Find the clusters with the requested engine. The gamma candidates
+        # are counted from their shapes - we won't always store these so we
+        # need to know the numbers.
+        if self.__engine == "legacy":
+            self.__growKlusters()
+            self.__countKlusters()
+        elif self.__engine in ENGINES or self.__engine == AUTO_ENGINE:
+            self.__labelKlusters()
+        else:
+            raise IOError("BAD_KLUSTER_ENGINE")
+
+        self.__n_gammas = self.__n_g1 + self.__n_g2 + self.__n_g3 + self.__n_g4
 
-        # Remove the masked pixels from the data.
-        if maskdict is not None:
-            for X in maskdict:
-                if X in self.__pixel_map.keys():
-                    del self.__pixel_map[X]
+        # Calculate the blob properties
+        for b in self.blob_list:
+            b.process(self.__pixel_map)
+
+        # Sort the cluster list by cluster size.
+        self.blob_list.sort(reverse=True)
+
+        ## The kernel backend used for the frame (None if no compiled kernel was run).
+        self.__backend = kernels.getBackend() if kernels.getNumberOfKernelCalls() > n_calls else None
+
+    def __growKlusters(self):
+        """ Find the clusters by growing blobs from each pixel's neighbours. """
 
         #print "DEBUG: Data supplied has %6d pixels." % \
         #  (len(data))
@@ -451,11 +1089,14 @@ class KlusterFinder:
         # * Puts all of the data into the pixel map;
         # * Assigns neighbouring pixels where it find them.
         for xy, c in self.__pixel_map.iteritems():
+            # Skip the masked pixels.
+            if self.__mask is not None and self.__mask[xy]:
+                continue
             x = xy % self.cols; y = xy / self.cols
             self.pixels[xy] = Pixel(x,y,c,-1, self.rows, self.cols)
 
-            # Loop over the eight possible directions.
-            for direction in range(8):
+            # Loop over the possible directions.
+            for direction in self.__directions:
                 ny = y + self.dir_y[direction]  # Next row.
                 nx = x + self.dir_x[direction]  # Next column.
                 nxy = ny * self.cols + nx # The next xy value.
@@ -493,7 +1134,7 @@ class KlusterFinder:
             #  (p.get_x(),p.get_y(),p.get_c(),p.get_mask())
             # Start a new blob if the pixel hasn't been blobed yet.
             if p.get_mask() == -1:
-                blob = Kluster(self.rows, self.cols, self.__is_mc)
+                blob = Kluster(self.rows, self.cols, self.__is_mc, self.__properties)
                 p.set_mask(0)
                 #print "DEBUG: Mask set to %3d" % (p.get_mask())
                 blob.insert(xy, p)
@@ -509,7 +1150,7 @@ class KlusterFinder:
                             # (self.pixels[bxy].get_mask() + 2.0 ** direction)
                             # If the Pixel isn't already in the Kluster, add it.
                             if not blob.contains_pixel(nxy):
-                                blob.insert(nxy, self.pixels[bxy])
+                                blob.insert(nxy, self.pixels[nxy])
                             # end of Pixel presence check.
                         # end of Pixel neighbour in direction existence check.
                 # end of loop over the directions.
@@ -527,53 +1168,121 @@ class KlusterFinder:
             # end of loop over blobs
             print "DEBUG:------------------------------"
 
-        ## The number of gamma candidates.
-        self.__n_gammas = 0
+    def __labelKlusters(self):
+        """ Find the clusters (as CompactKlusters) with one of the array-based labelling engines. """
 
-        ## The number of monopixel candidates.
-        self.__n_g1 = 0
+        ## The sorted (unmasked) pixel X values and their counts.
+        Xs, Cs = applyMask(*getHitArrays(self.__pixel_map), masked=self.__mask)
 
-        ## The number of bipixel candidates.
-        self.__n_g2 = 0
+        # Choose the engine for this frame, if asked to.
+        if self.__engine == AUTO_ENGINE:
+            self.__engine = chooseEngine(Xs, self.rows, self.cols, self.__thresholds)
 
-        ## The number of tripixel candidates.
-        self.__n_g3 = 0
+        ## The labels and the pixel X values for each cluster.
+        if self.__engine == "spatialhash":
+            labels, groups = labelSpatialHash(Xs, self.rows, self.cols, self.__connectivity, self.__radius)
+        else:
+            labels, groups = ENGINES[self.__engine](Xs, self.rows, self.cols, self.__connectivity)
 
-        ## The number of tetrapixel candidates.
-        self.__n_g4 = 0
+        ## The properties of all of the clusters, calculated in one pass.
+        self.__kluster_props = getKlusterProperties(Xs, Cs, labels, self.rows, self.cols, self.__properties)
+
+        ## The number of pixels in each cluster.
+        sizes = self.__kluster_props["size"]
+
+        ## The gamma classification of each cluster's shape (-1 = no shape in the table).
+        shape_classes = SHAPE_TABLE[getShapeCodes(Xs, getHitLabels(Xs, labels), self.cols, len(groups))]
+
+        ## Is the cluster a gamma candidate? (Using the radius for shapes not in the table.)
+        r = self.__kluster_props["radius_uw"]
+        isgammas = np.where(shape_classes >= 0, shape_classes == 1, \
+            (sizes <= 2) | ((sizes == 3) & (r < TRIPIXEL_RADIUS)) | ((sizes == 4) & (r < TETRAPIXEL_RADIUS)))
+
+        self.__n_klusters = len(groups)
+
+        self.__n_g1 = int(np.sum(isgammas & (sizes == 1)))
+        self.__n_g2 = int(np.sum(isgammas & (sizes == 2)))
+        self.__n_g3 = int(np.sum(isgammas & (sizes == 3)))
+        self.__n_g4 = int(np.sum(isgammas & (sizes == 4)))
+
+        for i, pixel_xys in enumerate(groups):
+            if isgammas[i] and not self.__keep_gammas:
+                continue
+            blob = CompactKluster(self.rows, self.cols, self.__is_mc, pixel_xys, Cs[np.searchsorted(Xs, pixel_xys)], \
+                self.__kluster_props[i], self.__properties)
+            self.insert(blob)
+
+    def __countKlusters(self):
+        """ Count the (legacy) clusters and gamma candidates, removing the gammas if they aren't wanted. """
+
+        ## The clusters to keep.
+        kept = []
 
-        # Calculate the blob properties
         for b in self.blob_list:
-            b.process(self.pixels)
-
-            # Count the gamma candidates - we won't store these so we need to
-            # know the numbers.
-            if   b.getNumberOfPixels() == 1:
-                self.__n_g1 += 1
-            # Bipixel gamma.
-            elif b.getNumberOfPixels() == 2:
-                self.__n_g2 += 1
-            # Tripixel...
-            elif b.getNumberOfPixels() == 3:
-                # Tripixel gamma.
-                if b.r_u < TRIPIXEL_RADIUS: #0.75
-                    self.__n_g3 += 1
-            # Tetrapixel...
-            elif b.getNumberOfPixels() == 4:
-                # Tetrapixel gamma.
-                if b.r_u < TETRAPIXEL_RADIUS: #0.71
-                    self.__n_g4 += 1
-
-            self.__n_gammas = self.__n_g1 + self.__n_g2 + self.__n_g3 + self.__n_g4
 
-        # Sort the cluster list by cluster size.
-        self.blob_list.sort(reverse=True)
+            ## The cluster's pixel X values.
+            Xs = b.get_pixel_xy_list()
+
+            ## The number of pixels in the cluster.
+            npix = len(Xs)
+
+            ## Is the cluster a gamma candidate?
+            isgamma = False
+
+            if npix <= MAX_SHAPE_SIZE:
+                shape_class = SHAPE_TABLE[getShapeCode(Xs, self.cols)]
+                if shape_class >= 0:
+                    isgamma = (shape_class == 1)
+                else:
+                    isgamma = isGammaCandidate(npix, getShapeRadius([(X % self.cols, X // self.cols) for X in Xs]))
+
+            if isgamma:
+                if   npix == 1: self.__n_g1 += 1
+                elif npix == 2: self.__n_g2 += 1
+                elif npix == 3: self.__n_g3 += 1
+                elif npix == 4: self.__n_g4 += 1
+
+            if self.__keep_gammas or not isgamma:
+                kept.append(b)
+
+        self.__n_klusters = len(self.blob_list)
+
+        self.blob_list = kept
 
     def insert(self, blob):
         self.blob_list.append(blob)
 
+    def getEngine(self):
+        """ The engine used (the one chosen for "auto", and "spatialhash" if a radius was given). """
+        return self.__engine
+
+    def getBackend(self):
+        """ The kernel backend actually used for the frame ("numba"), or None if no compiled kernel was run. """
+        return self.__backend
+
+    def getProperties(self):
+        """ The names of the cluster properties calculated. """
+        return sorted(self.__properties)
+
+    def getEngineThresholds(self):
+        """ The thresholds used to choose the engine (None if it wasn't chosen automatically). """
+        return self.__thresholds
+
+    def getConnectivity(self):
+        return self.__connectivity
+
+    def getRadius(self):
+        return self.__radius
+
+    def getKlusterProperties(self):
+        """ The frame-wide cluster properties array (None for the legacy engine). """
+        return self.__kluster_props
+
     def getNumberOfKlusters(self):
-        return len(self.blob_list)
+        return self.__n_klusters
+
+    def keepsGammas(self):
+        return self.__keep_gammas
 
     def getListOfKlusters(self):
         return self.blob_list
@@ -0,0 +1,757 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Connected-component labelling engines for finding Klusters in Timepix frames.
+
+Each engine takes the hit pixel X values of a frame (X = y*cols + x,
+as used throughout the pixel maps) and groups them into clusters of
+8-connected (or, optionally, 4-connected) pixels. The engines return the
+labels in their own natural form along with a list of the pixel X
+arrays - one per cluster - that the KlusterFinder uses to build its
+Klusters.
+"""
+
+#...for the logging.
+import logging as lg
+
+#...for the flat integer arrays.
+from array import array
+
+#...for the MATH.
+import numpy as np
+
+#...for the image labelling.
+from scipy import ndimage
+
+#...for the sparse (hit-only) labelling.
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+#...for the (optional) compiled kernels.
+import kernels
+
+#...for the bitset labelling.
+from bitset import labelBits
+
+## The structuring element for 8-connected labelling.
+EIGHT_CONNECTED = np.ones((3, 3), dtype=np.int32)
+
+## The structuring element for 4-connected labelling.
+FOUR_CONNECTED = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]], dtype=np.int32)
+
+## The structuring elements for each connectivity { connectivity : structure }.
+STRUCTURES = {
+    4 : FOUR_CONNECTED,
+    8 : EIGHT_CONNECTED,
+    }
+
+## The joining distance equivalent to each connectivity [pixels].
+CONNECTIVITY_RADII = {
+    4 : 1.0,
+    8 : np.sqrt(2.0),
+    }
+
+## The data type of the batched cluster table.
+KLUSTER_TABLE_DTYPE = np.dtype([
+    ("frame",  np.int64), # The index of the frame in the stack.
+    ("kluster", np.int64), # The index of the cluster within its frame.
+    ("start",  np.int64), # The offset of the cluster's first pixel in the pixel arrays.
+    ("size",   np.int64), # The number of pixels in the cluster.
+    ])
+
+def getHitArrays(pixelmap):
+    """
+    Convert a {X:C} pixel map into sorted NumPy arrays of X and C values.
+
+    @param [in] pixelmap A dictionary of pixel {X:C} values.
+    @returns Xs The sorted pixel X values.
+    @returns Cs The corresponding count values.
+    """
+
+    ## The pixel X values (unsorted).
+    Xs = np.fromiter(pixelmap.iterkeys(), dtype=np.int64, count=len(pixelmap))
+
+    ## The count values (in the same order).
+    Cs = np.fromiter(pixelmap.itervalues(), dtype=np.int64, count=len(pixelmap))
+
+    ## The order that sorts the X values.
+    order = np.argsort(Xs, kind="mergesort")
+
+    return Xs[order], Cs[order]
+
+def groupByLabel(Xs, labels):
+    """
+    Split the pixel X values into one array per label.
+
+    @param [in] Xs The pixel X values.
+    @param [in] labels The label (0 ... n-1) of each pixel.
+    @returns A list of the pixel X arrays, indexed by label.
+    """
+
+    if len(Xs) == 0:
+        return []
+
+    ## The order that groups the pixels by label (stable, so X order is kept).
+    order = np.argsort(labels, kind="mergesort")
+
+    ## The number of pixels with each label.
+    sizes = np.bincount(labels)
+
+    return np.split(Xs[order], np.cumsum(sizes)[:-1])
+
+def getStackStructure(connectivity):
+    """
+    Get the structuring element for labelling a stack of frames -
+    connected within each frame, with no connectivity between frames.
+    """
+    structure = np.zeros((3, 3, 3), dtype=np.int32)
+    structure[1] = STRUCTURES[connectivity]
+    return structure
+
+def labelDense(Xs, rows, cols, connectivity=8):
+    """
+    Label the connected clusters by scattering the hits into a frame array.
+
+    The hits are placed in a rows x cols occupancy array which is labelled
+    in one pass with whole-array operations, so the cost is dominated by
+    the sensor area rather than the cluster shapes.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns image The label image (0 = no hit, 1 ... n = cluster label).
+    @returns groups A list of the pixel X arrays, one per cluster.
+    """
+
+    ## The occupancy array for the frame.
+    occupancy = np.zeros(rows * cols, dtype=np.bool_)
+    occupancy[Xs] = True
+
+    image, n = ndimage.label(occupancy.reshape(rows, cols), structure=STRUCTURES[connectivity])
+
+    lg.debug(" * Dense labelling found %d clusters." % (n))
+
+    ## The label of each hit (0 ... n-1).
+    labels = image.ravel()[Xs] - 1
+
+    return image, groupByLabel(Xs, labels)
+
+def findRoot(parents, i):
+    """
+    Find the root of a union-find tree, halving the path as we go.
+
+    @param [in] parents The parent pointer array.
+    @param [in] i The index of the element.
+    @returns The index of the root element.
+    """
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+def labelUnionFind(Xs, rows, cols, connectivity=8):
+    """
+    Label the connected clusters with a single raster-order union-find pass.
+
+    As the (sorted) hits are visited in raster order, each one is joined
+    to the already-visited neighbours to its W, NW, N and NE (or just W
+    and N for 4-connectivity). The parent
+    pointers live in a flat integer array with one entry per hit, so the
+    work is linear in the number of hits whatever the cluster shapes.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns labels The label (0 ... n-1) of each hit, in raster order of the clusters.
+    @returns groups A list of the pixel X arrays, one per cluster.
+    """
+
+    ## The number of hits.
+    n = len(Xs)
+
+    ## Are the diagonal neighbours included?
+    diagonals = connectivity == 8
+
+    # Use the compiled kernel if there is one.
+    if kernels.useJit():
+        labels = kernels.unionFindLabels(np.asarray(Xs, dtype=np.int64), rows, cols, diagonals)
+        return labels, groupByLabel(Xs, labels)
+
+    ## The parent pointer of each hit.
+    parents = array("l", xrange(n))
+
+    ## The hit index of each pixel visited so far {X:i}.
+    visited = {}
+
+    for i, X in enumerate(Xs.tolist()):
+
+        x = X % cols
+
+        # The previously visited neighbours (W, NW, N, NE).
+        if not diagonals:
+            nbrs = (X - 1, X - cols) if x > 0 else (X - cols,)
+        elif x > 0:
+            nbrs = (X - 1, X - cols - 1, X - cols)
+        else:
+            nbrs = (X - cols,)
+        if diagonals and x < cols - 1:
+            nbrs += (X - cols + 1,)
+
+        for nX in nbrs:
+            j = visited.get(nX)
+            if j is not None:
+                ri = findRoot(parents, i); rj = findRoot(parents, j)
+                # Always keep the earlier root so the labels follow the raster order.
+                if ri < rj:
+                    parents[rj] = ri
+                elif rj < ri:
+                    parents[ri] = rj
+
+        visited[X] = i
+
+    ## The label of each hit.
+    labels = np.empty(n, dtype=np.int64)
+
+    ## The label given to each root {root:label}.
+    rootlabels = {}
+
+    for i in xrange(n):
+        r = findRoot(parents, i)
+        if r not in rootlabels:
+            rootlabels[r] = len(rootlabels)
+        labels[i] = rootlabels[r]
+
+    lg.debug(" * Union-find labelling found %d clusters." % (len(rootlabels)))
+
+    return labels, groupByLabel(Xs, labels)
+
+def labelBitset(Xs, rows, cols, connectivity=8):
+    """
+    Label the connected clusters by flood filling a packed occupancy bitset.
+
+    The frame's occupancy is packed one bit per pixel, and each cluster is
+    grown from its first pixel with word-level shifts and ANDs (see bitset.py).
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame (a multiple of 64).
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns labels The label (0 ... n-1) of each hit, in raster order of the clusters.
+    @returns groups A list of the pixel X arrays, one per cluster.
+    """
+
+    labels = labelBits(Xs, rows, cols, connectivity)
+
+    return labels, groupByLabel(Xs, labels)
+
+def getStackHitArrays(frames, rows, cols):
+    """
+    Get the frame index, X and C values of the hits in a stack of frames.
+
+    @param [in] frames An (N, rows, cols) array of counts, or a list of N {X:C} pixel maps.
+    @param [in] rows The number of rows in each frame.
+    @param [in] cols The number of columns in each frame.
+    @returns Fs The frame index of each hit.
+    @returns Xs The pixel X value of each hit.
+    @returns Cs The count value of each hit.
+    """
+
+    if isinstance(frames, np.ndarray):
+
+        if frames.ndim != 3 or frames.shape[1:] != (rows, cols):
+            raise IOError("BAD_FRAME_STACK")
+
+        ## The counts, one row per frame.
+        counts = frames.reshape(len(frames), rows * cols)
+
+        Fs, Xs = np.nonzero(counts)
+
+        return Fs.astype(np.int64), Xs.astype(np.int64), counts[Fs, Xs].astype(np.int64)
+
+    ## The hit arrays for each of the frames.
+    hits = [getHitArrays(pixelmap) for pixelmap in frames]
+
+    if len(hits) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    Fs = np.repeat(np.arange(len(hits), dtype=np.int64), [len(Xs) for Xs, Cs in hits])
+
+    return Fs, np.concatenate([Xs for Xs, Cs in hits]), np.concatenate([Cs for Xs, Cs in hits])
+
+def getNeighbourPairs(Xs, rows, cols, connectivity=8):
+    """
+    Find the pairs of connected neighbours in a sorted array of hits.
+
+    Only the W, NW, N and NE neighbours of each hit are looked up (by
+    binary search of the sorted X values), which finds every pair once.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns is The hit index of the first pixel in each pair.
+    @returns js The hit index of the second pixel in each pair.
+    """
+
+    ## The x value of each hit.
+    xs = Xs % cols
+
+    ## The hit indices of the pairs found for each direction.
+    is_list, js_list = [], []
+
+    # The (offset, column check) of the W, N, NW and NE neighbours.
+    directions = [(1, xs > 0), (cols, None)]
+    if connectivity == 8:
+        directions += [(cols + 1, xs > 0), (cols - 1, xs < cols - 1)]
+
+    for offset, ok in directions:
+
+        ## The X values of the candidate neighbours.
+        nXs = Xs - offset
+
+        ## Where the candidates would be in the sorted hits.
+        js = np.searchsorted(Xs, nXs)
+
+        ## Which of the candidates are actually hit.
+        found = Xs[np.minimum(js, len(Xs) - 1)] == nXs
+        if ok is not None:
+            found &= ok
+
+        is_list.append(np.nonzero(found)[0]); js_list.append(js[found])
+
+    return np.concatenate(is_list), np.concatenate(js_list)
+
+def labelSparse(Xs, rows, cols, connectivity=8):
+    """
+    Label the connected clusters using only the (sorted) hits.
+
+    The neighbour pairs are found by binary search over the sorted X
+    values and the connected components of the resulting graph give the
+    clusters, so the empty part of the sensor is never touched and the
+    cost scales with the number of hits rather than the sensor area.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns labels The label (0 ... n-1) of each hit, in raster order of the clusters.
+    @returns groups A list of the pixel X arrays, one per cluster.
+    """
+
+    if len(Xs) == 0:
+        return np.zeros(0, dtype=np.int64), []
+
+    ## The pairs of neighbouring hits.
+    ips, jps = getNeighbourPairs(Xs, rows, cols, connectivity)
+
+    labels = labelPairs(len(Xs), ips, jps)
+
+    lg.debug(" * Sparse labelling found %d clusters." % (labels.max() + 1))
+
+    return labels, groupByLabel(Xs, labels)
+
+def labelPairs(n, ips, jps):
+    """
+    Label the connected components of a graph of hits.
+
+    @param [in] n The number of hits.
+    @param [in] ips The hit index of the first hit in each joined pair.
+    @param [in] jps The hit index of the second hit in each joined pair.
+    @returns The label (0 ... n-1) of each hit, numbered in hit order.
+    """
+
+    ## The (hit) adjacency matrix.
+    adjacency = coo_matrix((np.ones(len(ips), dtype=np.int8), (ips, jps)), shape=(n, n))
+
+    n_klusters, labels = connected_components(adjacency, directed=False)
+
+    return labels.astype(np.int64)
+
+def getRuns(Xs, cols):
+    """
+    Run-length encode the rows of a frame's (sorted) hits.
+
+    A run is a horizontal line of consecutive hits in one row.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] cols The number of columns in the frame.
+    @returns starts The X value of the first hit in each run.
+    @returns ends The X value of the last hit in each run.
+    @returns runs The run index of each hit.
+    """
+
+    ## Does each hit start a new run (a gap before it, or a new row)?
+    isstart = np.ones(len(Xs), dtype=np.bool_)
+    isstart[1:] = (np.diff(Xs) != 1) | (Xs[1:] % cols == 0)
+
+    ## The run index of each hit.
+    runs = np.cumsum(isstart) - 1
+
+    ## The hit index of the first hit in each run.
+    firsts = np.flatnonzero(isstart)
+
+    ## The hit index of the last hit in each run.
+    lasts = np.append(firsts[1:] - 1, len(Xs) - 1)
+
+    return Xs[firsts], Xs[lasts], runs
+
+def getRunPairs(starts, ends, cols, connectivity=8):
+    """
+    Find the pairs of touching runs in consecutive rows.
+
+    The runs in each row are sorted and don't overlap, so the runs in the
+    row above that touch a given run are a contiguous block, found with
+    two binary searches.
+
+    @param [in] starts The X value of the first hit in each (sorted) run.
+    @param [in] ends The X value of the last hit in each run.
+    @param [in] cols The number of columns in the frame.
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns is The index of the lower run in each pair.
+    @returns js The index of the upper run in each pair.
+    """
+
+    ## How far past its ends a run reaches diagonally.
+    d = 1 if connectivity == 8 else 0
+
+    ## The first and last X value of the row above each run.
+    rowstarts = (starts // cols - 1) * cols; rowends = rowstarts + cols - 1
+
+    ## The range of X values each run touches in the row above.
+    los = np.maximum(starts - cols - d, rowstarts); his = np.minimum(ends - cols + d, rowends)
+
+    ## The first run ending at or after the range, and the first starting after it.
+    jlos = np.searchsorted(ends, los, side="left"); jhis = np.searchsorted(starts, his, side="right")
+
+    ## The number of runs touched by each run.
+    n_touched = np.maximum(jhis - jlos, 0)
+
+    ## The index of the lower run in each pair.
+    ips = np.repeat(np.arange(len(starts)), n_touched)
+
+    ## The position of each pair within its lower run's block.
+    offsets = np.arange(len(ips)) - np.repeat(np.cumsum(n_touched) - n_touched, n_touched)
+
+    return ips, np.repeat(jlos, n_touched) + offsets
+
+def labelRuns(Xs, rows, cols, connectivity=8):
+    """
+    Label the connected clusters with the two-pass run-based algorithm.
+
+    The first pass run-length encodes each row of hits and finds the
+    runs that touch (overlap, or meet diagonally) in consecutive rows;
+    the second resolves these into clusters and labels each hit with
+    the label of its run. The work scales with the number of runs rather
+    than the number of hits, which helps with the large, dense clusters
+    made by alpha particles and heavy ions.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns labels The label (0 ... n-1) of each hit, in raster order of the clusters.
+    @returns groups A list of the pixel X arrays, one per cluster.
+    """
+
+    if len(Xs) == 0:
+        return np.zeros(0, dtype=np.int64), []
+
+    starts, ends, runs = getRuns(Xs, cols)
+
+    ## The pairs of touching runs.
+    ips, jps = getRunPairs(starts, ends, cols, connectivity)
+
+    ## The label of each run (the runs are in raster order, so the labels are too).
+    runlabels = labelPairs(len(starts), ips, jps)
+
+    labels = runlabels[runs]
+
+    lg.debug(" * Run-based labelling found %d clusters from %d runs." % (runlabels.max() + 1, len(starts)))
+
+    return labels, groupByLabel(Xs, labels)
+
+def getSpatialHashPairs(Xs, rows, cols, radius):
+    """
+    Find the pairs of hits within a given distance using a spatial hash grid.
+
+    The hits are hashed into square buckets at least radius pixels wide,
+    so every partner of a hit lies in its own bucket or one of the eight
+    around it. Only those candidate pairs are tested, which keeps the work
+    close to linear in the number of hits even on saturated frames.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] radius The joining distance [pixels].
+    @returns is The hit index of the first pixel in each pair.
+    @returns js The hit index of the second pixel in each pair.
+    """
+
+    ## The number of hits.
+    n = len(Xs)
+
+    ## The hit x and y values.
+    xs = Xs % cols; ys = Xs // cols
+
+    ## The bucket width [pixels].
+    size = max(int(np.ceil(radius)), 1)
+
+    ## The number of bucket columns (plus a border on either side).
+    nbcols = ((cols + size - 1) // size) + 2
+
+    ## The bucket key of each hit.
+    keys = ((ys // size) + 1) * nbcols + (xs // size) + 1
+
+    ## The hits sorted by bucket.
+    order = np.argsort(keys, kind="mergesort"); sortedkeys = keys[order]
+
+    ## The hit indices of the pairs found for each bucket offset.
+    is_list, js_list = [], []
+
+    # Each pair of neighbouring buckets is only visited once.
+    for dbx, dby in ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1)):
+
+        ## The key of the neighbouring bucket for each hit.
+        nkeys = keys + (dby * nbcols) + dbx
+
+        ## The range of the neighbouring bucket's hits in the sorted hits.
+        starts = np.searchsorted(sortedkeys, nkeys, side="left")
+        counts = np.searchsorted(sortedkeys, nkeys, side="right") - starts
+
+        ## The candidate pairs.
+        ips = np.repeat(np.arange(n), counts)
+        jps = order[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+
+        ## The squared distance between the hits in each pair.
+        d2 = (xs[ips] - xs[jps])**2 + (ys[ips] - ys[jps])**2
+
+        keep = d2 <= radius * radius
+        if dbx == 0 and dby == 0:
+            keep &= ips < jps
+
+        is_list.append(ips[keep]); js_list.append(jps[keep])
+
+    return np.concatenate(is_list), np.concatenate(js_list)
+
+def labelSpatialHash(Xs, rows, cols, connectivity=8, radius=None):
+    """
+    Label the clusters of hits that lie within a given distance of each other.
+
+    With no radius this reproduces the 4- or 8-connected clusters (hits
+    1 or sqrt(2) pixels apart); a larger radius joins clusters across gaps,
+    e.g. for broken tracks and delta rays.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] connectivity The pixel connectivity (4 or 8) used if no radius is given.
+    @param [in] radius The joining distance [pixels].
+    @returns labels The label (0 ... n-1) of each hit, in raster order of the clusters.
+    @returns groups A list of the pixel X arrays, one per cluster.
+    """
+
+    if radius is None:
+        radius = CONNECTIVITY_RADII[connectivity]
+
+    if len(Xs) == 0:
+        return np.zeros(0, dtype=np.int64), []
+
+    ## The pairs of hits within the joining distance.
+    ips, jps = getSpatialHashPairs(Xs, rows, cols, radius)
+
+    labels = labelPairs(len(Xs), ips, jps)
+
+    lg.debug(" * Spatial hash labelling (r = %f) found %d clusters." % (radius, labels.max() + 1))
+
+    return labels, groupByLabel(Xs, labels)
+
+def labelFrameStack(frames, rows=256, cols=256, chunksize=64, connectivity=8):
+    """
+    Label the connected clusters in a whole stack of frames at once.
+
+    The frames are labelled as a 3-D volume whose structuring element has
+    no connectivity along the frame axis, so no cluster crosses a frame
+    boundary. The frames are processed in chunks of chunksize to keep the
+    size of the label volume bounded.
+
+    @param [in] frames An (N, rows, cols) array of counts, or a list of N {X:C} pixel maps.
+    @param [in] rows The number of rows in each frame.
+    @param [in] cols The number of columns in each frame.
+    @param [in] chunksize The number of frames to label in each call.
+    @param [in] connectivity The pixel connectivity (4 or 8).
+    @returns table The cluster table (KLUSTER_TABLE_DTYPE), ordered by frame.
+    @returns Xs The pixel X values of the clusters' pixels, in table order.
+    @returns Cs The corresponding count values.
+    """
+
+    Fs, Xs, Cs = getStackHitArrays(frames, rows, cols)
+
+    ## The number of frames in the stack.
+    n_frames = len(frames)
+
+    ## The number of pixels in each frame.
+    area = rows * cols
+
+    ## The global (stack) index of each hit.
+    Gs = (Fs * area) + Xs
+
+    ## The global cluster label of each hit.
+    labels = np.empty(len(Gs), dtype=np.int64)
+
+    ## The number of clusters found so far.
+    n_klusters = 0
+
+    ## The structuring element for the frame stack.
+    structure = getStackStructure(connectivity)
+
+    for first in range(0, n_frames, chunksize):
+
+        last = min(first + chunksize, n_frames)
+
+        ## The hits in this chunk of frames.
+        inchunk = slice(np.searchsorted(Fs, first), np.searchsorted(Fs, last))
+
+        ## The occupancy volume for the chunk.
+        occupancy = np.zeros((last - first) * area, dtype=np.bool_)
+        occupancy[Gs[inchunk] - (first * area)] = True
+
+        volume, n = ndimage.label(occupancy.reshape(last - first, rows, cols), structure=structure)
+
+        labels[inchunk] = volume.ravel()[Gs[inchunk] - (first * area)] - 1 + n_klusters
+
+        n_klusters += n
+
+    lg.debug(" * Stack labelling found %d clusters in %d frames." % (n_klusters, n_frames))
+
+    ## The order that groups the hits by cluster.
+    order = np.argsort(labels, kind="mergesort")
+
+    ## The cluster table.
+    table = np.zeros(n_klusters, dtype=KLUSTER_TABLE_DTYPE)
+
+    table["size"] = np.bincount(labels, minlength=n_klusters)
+
+    table["start"][1:] = np.cumsum(table["size"])[:-1]
+
+    table["frame"] = Fs[order][table["start"]]
+
+    # Number the clusters within each frame.
+    table["kluster"] = np.arange(n_klusters) - np.searchsorted(table["frame"], table["frame"])
+
+    return table, Xs[order], Cs[order]
+
+## The available labelling engines { name : function }.
+ENGINES = {
+    "dense"       : labelDense,
+    "unionfind"   : labelUnionFind,
+    "sparse"      : labelSparse,
+    "spatialhash" : labelSpatialHash,
+    "bitset"      : labelBitset,
+    "runs"        : labelRuns,
+    }
+
+## The name used to ask for the engine to be chosen for each frame.
+AUTO_ENGINE = "auto"
+
+## The default thresholds for choosing the engine (see chooseEngine).
+#
+# These were tuned on 256x256 frames: union-find is quickest for a handful
+# of hits, the sparse engine for quiet frames, the run-based engine for
+# frames of long runs packed into a small area, and the dense engine for
+# everything else (in particular saturated frames).
+AUTO_ENGINE_THRESHOLDS = {
+    "dense_min_occupancy" : 0.05,  # Use the dense engine at or above this fraction of the sensor hit.
+    "unionfind_max_hits"  : 128,   # ...otherwise union-find for this many hits or fewer,
+    "sparse_max_hits"     : 384,   # ...or the sparse engine for this many hits or fewer.
+    "runs_min_row_hits"   : 24.0,  # Use the run-based engine at or above this mean number of hits per row,
+    "runs_min_bbox_fill"  : 0.25,  # ...when the hits fill at least this fraction of their bounding box.
+    }
+
+def getPrescanStats(Xs, rows, cols):
+    """
+    Get the cheap statistics of a frame's hits used to choose the engine.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns A dictionary of the number of hits, the fraction of the sensor
+             hit, the fraction of the hits' bounding box that is hit, and
+             the mean number of hits in the rows with hits.
+    """
+
+    n = len(Xs)
+
+    if n == 0:
+        return {"n_hits" : 0, "occupancy" : 0.0, "bbox_fill" : 0.0, "row_hits" : 0.0}
+
+    ## The x values of the hits.
+    xs = Xs % cols
+
+    ## The first and last rows with hits (the hits are sorted).
+    ymin = Xs[0] // cols; ymax = Xs[-1] // cols
+
+    ## The number of rows with hits.
+    n_rows = np.count_nonzero(np.diff(Xs // cols)) + 1
+
+    ## The bounding box area.
+    area = (xs.max() - xs.min() + 1) * (ymax - ymin + 1)
+
+    return {
+        "n_hits"     : n,
+        "occupancy"  : float(n) / float(rows * cols),
+        "bbox_fill"  : float(n) / float(area),
+        "row_hits"   : float(n) / float(n_rows),
+        }
+
+def getEngineThresholds(thresholds=None):
+    """
+    Get the engine choice thresholds, with any given values replacing the defaults.
+
+    @param [in] thresholds A dictionary of the thresholds to change (optional).
+    @returns The full dictionary of thresholds.
+    """
+
+    ## The thresholds to use.
+    ts = dict(AUTO_ENGINE_THRESHOLDS)
+
+    if thresholds is not None:
+        for name, value in thresholds.iteritems():
+            if name not in ts:
+                raise IOError("UNKNOWN_ENGINE_THRESHOLD")
+            ts[name] = value
+
+    return ts
+
+def chooseEngine(Xs, rows, cols, thresholds=None):
+    """
+    Choose the labelling engine for a frame from its pre-scan statistics.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] thresholds The thresholds to change from AUTO_ENGINE_THRESHOLDS (optional).
+    @returns The name of the engine (a key of ENGINES).
+    """
+
+    ts = getEngineThresholds(thresholds)
+
+    stats = getPrescanStats(Xs, rows, cols)
+
+    if stats["occupancy"] >= ts["dense_min_occupancy"]:
+        engine = "dense"
+    elif stats["n_hits"] <= ts["unionfind_max_hits"]:
+        engine = "unionfind"
+    elif stats["n_hits"] <= ts["sparse_max_hits"]:
+        engine = "sparse"
+    elif stats["row_hits"] >= ts["runs_min_row_hits"] and stats["bbox_fill"] >= ts["runs_min_bbox_fill"]:
+        engine = "runs"
+    else:
+        engine = "dense"
+
+    lg.debug(" * Chose the '%s' engine for %d hits (occupancy %f, box fill %f, %f hits per row)." % \
+        (engine, stats["n_hits"], stats["occupancy"], stats["bbox_fill"], stats["row_hits"]))
+
+    return engine
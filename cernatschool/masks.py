@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Pixel masks for Timepix frames.
+
+A mask is held as a flat boolean array with one entry per pixel
+(True = masked), so it can be applied to a frame's hits as a single
+vectorised lookup rather than by copying and editing the pixel map.
+The MaskRegistry keeps the masks for each chip, and finds hot pixels.
+"""
+
+#...the usual suspects.
+import os
+
+#...for the logging.
+import logging as lg
+
+#...for the registry files.
+import json
+
+#...for the MATH.
+import numpy as np
+
+def getMaskArray(mask, rows, cols):
+    """
+    Get a flat boolean mask array from any of the supported mask forms.
+
+    @param [in] mask The masked pixels - a dictionary {X:...}, a sorted
+                     array (or list) of the X values, a boolean (rows x cols)
+                     array, or None.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns The boolean mask array (True = masked), or None if nothing is masked.
+    """
+
+    if mask is None or len(mask) == 0:
+        return None
+
+    if isinstance(mask, np.ndarray) and mask.dtype == np.bool_:
+        if mask.size != rows * cols:
+            raise IOError("BAD_MASK_SIZE")
+        masked = mask.ravel()
+    else:
+        ## The masked pixel X values.
+        Xs = np.fromiter(mask.iterkeys(), dtype=np.int64, count=len(mask)) if isinstance(mask, dict) \
+             else np.asarray(mask, dtype=np.int64)
+        masked = np.zeros(rows * cols, dtype=np.bool_)
+        masked[Xs] = True
+
+    return masked if masked.any() else None
+
+def getMaskedPixels(mask, rows, cols):
+    """
+    Get the sorted X values of the masked pixels.
+
+    @param [in] mask The masked pixels (see getMaskArray).
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns A sorted array of the masked pixel X values.
+    """
+
+    masked = getMaskArray(mask, rows, cols)
+
+    if masked is None:
+        return np.array([], dtype=np.int64)
+
+    return np.flatnonzero(masked)
+
+def applyMask(Xs, Cs, masked):
+    """
+    Remove the masked pixels from a frame's hit arrays.
+
+    @param [in] Xs The pixel X values.
+    @param [in] Cs The corresponding count values.
+    @param [in] masked The boolean mask array (from getMaskArray), or None.
+    @returns Xs, Cs The unmasked hits.
+    """
+
+    if masked is None:
+        return Xs, Cs
+
+    ## Which hits are kept?
+    keep = ~masked[Xs]
+
+    return Xs[keep], Cs[keep]
+
+## The fraction of frames a pixel must be hit in to be flagged as hot.
+HOT_PIXEL_FREQUENCY = 0.5
+
+## The minimum number of frames needed before any pixels are flagged as hot.
+HOT_PIXEL_MIN_FRAMES = 10
+
+class MaskRegistry:
+    """
+    A persistent registry of the masked pixels for each chip.
+
+    The masks are keyed by chip ID (see DscFile.getChipId) and saved as
+    JSON. Hot pixels are found from the hit frequency of each pixel,
+    accumulated one frame at a time with addFrame().
+
+    @param [in] path The path of the registry JSON file (loaded if it exists).
+    """
+
+    def __init__(self, path=None):
+        """ Constructor. """
+
+        ## The path of the registry JSON file.
+        self.__path = path
+
+        ## The masked pixel X values for each chip {chipid:sorted array}.
+        self.__masks = {}
+
+        ## The frame dimensions for each chip {chipid:(rows, cols)}.
+        self.__dims = {}
+
+        ## The boolean mask arrays for each chip (made when first needed).
+        self.__mask_arrays = {}
+
+        ## The number of frames each pixel has been hit in, for each chip.
+        self.__hits = {}
+
+        ## The number of frames seen for each chip.
+        self.__n_frames = {}
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def load(self, path):
+        """ Load the masks from a registry JSON file. """
+
+        with open(path, "r") as f:
+            rd = json.load(f)
+
+        for chipid, entry in rd.iteritems():
+            self.setMask(chipid, entry["pixels"], entry["rows"], entry["cols"])
+
+        lg.info(" * Loaded the pixel masks for %d chip(s) from '%s'." % (len(rd), path))
+
+    def save(self, path=None):
+        """ Save the masks to a registry JSON file (by default, the one loaded). """
+
+        if path is None:
+            path = self.__path
+
+        if path is None:
+            raise IOError("NO_MASK_REGISTRY_PATH")
+
+        rd = {}
+        for chipid, Xs in self.__masks.iteritems():
+            rows, cols = self.__dims[chipid]
+            rd[chipid] = {"rows" : rows, "cols" : cols, "pixels" : Xs.tolist()}
+
+        with open(path, "w") as f:
+            json.dump(rd, f)
+
+    def getChipIds(self):
+        return sorted(self.__masks.keys())
+
+    def getMask(self, chipid):
+        """
+        Get the boolean (rows x cols) mask array for a chip.
+
+        @param [in] chipid The chip ID.
+        @returns The mask array (True = masked), or None if the chip has no masked pixels.
+        """
+
+        if chipid not in self.__masks or len(self.__masks[chipid]) == 0:
+            return None
+
+        if chipid not in self.__mask_arrays:
+            rows, cols = self.__dims[chipid]
+            self.__mask_arrays[chipid] = getMaskArray(self.__masks[chipid], rows, cols).reshape((rows, cols))
+
+        return self.__mask_arrays[chipid]
+
+    def getMaskedPixels(self, chipid):
+        """ The sorted X values of a chip's masked pixels. """
+        return self.__masks.get(chipid, np.array([], dtype=np.int64))
+
+    def setMask(self, chipid, pixels, rows=256, cols=256):
+        """
+        Set (replace) the masked pixels for a chip.
+
+        @param [in] chipid The chip ID.
+        @param [in] pixels The masked pixels (see getMaskArray).
+        @param [in] rows The number of rows in the chip's frames.
+        @param [in] cols The number of columns in the chip's frames.
+        """
+
+        self.__masks[chipid] = getMaskedPixels(pixels, rows, cols)
+        self.__dims[chipid] = (rows, cols)
+        self.__mask_arrays.pop(chipid, None)
+
+    def addFrame(self, chipid, pixelmap, rows=256, cols=256):
+        """
+        Add a frame's hits to the hit frequency count for its chip.
+
+        @param [in] chipid The chip ID.
+        @param [in] pixelmap The frame's pixels {X:C}.
+        @param [in] rows The number of rows in the frame.
+        @param [in] cols The number of columns in the frame.
+        """
+
+        if chipid not in self.__hits:
+            self.__hits[chipid] = np.zeros(rows * cols, dtype=np.int32)
+            self.__n_frames[chipid] = 0
+            self.__dims.setdefault(chipid, (rows, cols))
+
+        if self.__dims[chipid] != (rows, cols):
+            raise IOError("FRAME_SIZE_MISMATCH")
+
+        self.__hits[chipid][np.fromiter(pixelmap.iterkeys(), dtype=np.int64, count=len(pixelmap))] += 1
+
+        self.__n_frames[chipid] += 1
+
+    def getNumberOfFrames(self, chipid):
+        return self.__n_frames.get(chipid, 0)
+
+    def updateHotPixels(self, frequency=HOT_PIXEL_FREQUENCY, minframes=HOT_PIXEL_MIN_FRAMES):
+        """
+        Add the hot pixels found so far to the chips' masks.
+
+        A pixel is hot if it has been hit in more than the given fraction
+        of the frames seen for its chip. Chips with fewer than minframes
+        frames are left alone.
+
+        @param [in] frequency The hit frequency above which a pixel is hot.
+        @param [in] minframes The minimum number of frames needed.
+        @returns A dictionary of the number of new hot pixels for each chip.
+        """
+
+        ## The number of new hot pixels found for each chip.
+        n_new = {}
+
+        for chipid, hits in self.__hits.iteritems():
+
+            if self.__n_frames[chipid] < minframes:
+                continue
+
+            ## The hot pixels.
+            hot = np.flatnonzero(hits > frequency * self.__n_frames[chipid])
+
+            rows, cols = self.__dims[chipid]
+
+            ## The pixels already masked.
+            masked = self.getMaskedPixels(chipid)
+
+            n_new[chipid] = len(np.setdiff1d(hot, masked))
+
+            self.setMask(chipid, np.union1d(masked, hot), rows, cols)
+
+            lg.info(" * Chip '%s': %d hot pixel(s) found in %d frames (%d new)." % \
+                (chipid, len(hot), self.__n_frames[chipid], n_new[chipid]))
+
+        return n_new
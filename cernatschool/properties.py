@@ -0,0 +1,655 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Vectorised kernels for calculating the properties of all of the
+clusters in a frame at once.
+
+The kernels work on the frame's sorted hit arrays (X = y*cols + x and
+the counts C) and the cluster label of each hit, as produced by the
+engines in labelling.py, rather than looping over the clusters.
+"""
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+#...for the (optional) compiled kernels.
+import kernels
+
+## The per-cluster properties calculated by getKlusterProperties.
+## (The names match those used in the cluster properties JSON.)
+KLUSTER_PROPERTIES_DTYPE = np.dtype([
+    ("size",          np.int64),
+    ("xmin",          np.float64),
+    ("xmax",          np.float64),
+    ("ymin",          np.float64),
+    ("ymax",          np.float64),
+    ("width",         np.float64),
+    ("height",        np.float64),
+    ("x_uw",          np.float64),
+    ("y_uw",          np.float64),
+    ("radius_uw",     np.float64),
+    ("density_uw",    np.float64),
+    ("x_w",           np.float64),
+    ("y_w",           np.float64),
+    ("radius_w",      np.float64),
+    ("density_w",     np.float64),
+    ("totalcounts",   np.int64),
+    ("maxcounts",     np.float64),
+    ("n_edgepixels",  np.int64),
+    ("edgefrac",      np.float64),
+    ("innerfrac",     np.float64),
+    ("isedgekluster", np.bool_),
+    ("lin_m",         np.float64),
+    ("lin_c",         np.float64),
+    ("lin_sumofres",  np.float64),
+    ("lin_linearity", np.float64),
+    ])
+
+## The shape descriptors calculated by getShapeDescriptors.
+SHAPE_DESCRIPTORS_DTYPE = np.dtype([
+    ("eccentricity",   np.float64),
+    ("orientation",    np.float64),
+    ("axis_major",     np.float64),
+    ("axis_minor",     np.float64),
+    ("hull_area",      np.float64),
+    ("hull_perimeter", np.float64),
+    ("bbox_fill",      np.float64),
+    ])
+
+## The cluster properties with the shape descriptors.
+KLUSTER_PROPERTIES_DTYPE = np.dtype(KLUSTER_PROPERTIES_DTYPE.descr + SHAPE_DESCRIPTORS_DTYPE.descr)
+
+## The cluster properties, and the other properties each one is calculated from.
+#
+# The properties are only calculated when they (or properties that depend
+# on them) are asked for - see getPropertyClosure.
+PROPERTY_DEPENDENCIES = {
+    "size"           : [],
+    "xmin"           : [],
+    "xmax"           : [],
+    "ymin"           : [],
+    "ymax"           : [],
+    "width"          : ["xmin", "xmax"],
+    "height"         : ["ymin", "ymax"],
+    "x_uw"           : ["size"],
+    "y_uw"           : ["size"],
+    "radius_uw"      : ["x_uw", "y_uw"],
+    "density_uw"     : ["size", "radius_uw"],
+    "x_w"            : ["x_uw", "totalcounts"],
+    "y_w"            : ["y_uw", "totalcounts"],
+    "radius_w"       : ["x_w", "y_w"],
+    "density_w"      : ["radius_w", "totalcounts"],
+    "totalcounts"    : [],
+    "maxcounts"      : [],
+    "n_edgepixels"   : [],
+    "edgefrac"       : ["n_edgepixels", "size"],
+    "innerfrac"      : ["edgefrac"],
+    "isedgekluster"  : ["xmin", "xmax", "ymin", "ymax"],
+    "lin_m"          : [],
+    "lin_c"          : ["lin_m"],
+    "lin_sumofres"   : ["lin_m", "lin_c"],
+    "lin_linearity"  : ["lin_sumofres", "size"],
+    "eccentricity"   : ["axis_major", "axis_minor"],
+    "orientation"    : [],
+    "axis_major"     : [],
+    "axis_minor"     : [],
+    "hull_area"      : [],
+    "hull_perimeter" : [],
+    "bbox_fill"      : ["size", "width", "height"],
+    }
+
+## The properties that are always calculated (they cost next to nothing).
+BASIC_PROPERTIES = frozenset(["size", "xmin", "xmax", "ymin", "ymax", "width", "height", \
+    "x_uw", "y_uw", "totalcounts", "maxcounts", "isedgekluster"])
+
+## The lines of best fit properties (calculated together).
+LINE_PROPERTIES = frozenset(["lin_m", "lin_c", "lin_sumofres", "lin_linearity"])
+
+## The edge pixel properties (calculated together).
+EDGE_PROPERTIES = frozenset(["n_edgepixels", "edgefrac", "innerfrac"])
+
+## The shape descriptors (calculated together).
+SHAPE_PROPERTIES = frozenset(SHAPE_DESCRIPTORS_DTYPE.names)
+
+## The cut prefixes used in the particle type definitions (see types.json)
+## and the properties they cut on { prefix:property }.
+TYPE_CUTS = {
+    "size" : "size",
+    "rad"  : "radius_uw",
+    "rho"  : "density_uw",
+    "lin"  : "lin_linearity",
+    "inr"  : "innerfrac",
+    "ttc"  : "totalcounts",
+    "mxc"  : "maxcounts",
+    }
+
+## The cuts a type definition may leave out { prefix:property }.
+#
+# For a prefix "xxx", the type gives "xxx_min" and/or "xxx_max";
+# cuts a type doesn't define (e.g. in older type files) are not applied.
+# See the README.md file for an example.
+OPTIONAL_TYPE_CUTS = {
+    "rdw" : "radius_w",
+    "rhw" : "density_w",
+    "ecc" : "eccentricity",
+    "ori" : "orientation",
+    "maj" : "axis_major",
+    "mnr" : "axis_minor",
+    "hla" : "hull_area",
+    "hlp" : "hull_perimeter",
+    "bbf" : "bbox_fill",
+    }
+
+def getPropertyClosure(names=None):
+    """
+    Get the properties needed to calculate the requested properties.
+
+    @param [in] names The names of the requested properties (None for all of them).
+    @returns The set of the requested properties, the properties they
+             depend on (and so on) and the basic properties.
+    """
+
+    if names is None:
+        return frozenset(PROPERTY_DEPENDENCIES.keys())
+
+    ## The properties needed.
+    needed = set(BASIC_PROPERTIES)
+
+    ## The properties still to be checked.
+    todo = list(names)
+
+    while len(todo) > 0:
+        name = todo.pop()
+        if name not in PROPERTY_DEPENDENCIES:
+            raise IOError("UNKNOWN_KLUSTER_PROPERTY")
+        if name not in needed:
+            todo.extend(PROPERTY_DEPENDENCIES[name])
+        needed.add(name)
+
+    return frozenset(needed)
+
+def getTypeProperties(types):
+    """
+    Get the properties needed to sort clusters into the given particle types.
+
+    @param [in] types The list of type definitions, as read from e.g. types.json.
+    @returns The names of the properties used by the types' cuts.
+    """
+
+    ## The properties needed (the bounding box is used for the edge check).
+    names = set(TYPE_CUTS.values()) | set(["xmin", "xmax", "ymin", "ymax"])
+
+    for t in types:
+        for typename, vals in t.iteritems():
+            for cut, name in OPTIONAL_TYPE_CUTS.iteritems():
+                if cut + "_min" in vals or cut + "_max" in vals:
+                    names.add(name)
+
+    return sorted(names)
+
+## The gradient (and intercept) given to vertical lines of best fit.
+VERTICAL_LINE_GRADIENT = 999999.9
+
+## The (dx, dy) offsets of the eight neighbouring pixels.
+NEIGHBOUR_OFFSETS = [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
+
+def getHitLabels(Xs, labels):
+    """
+    Get the cluster label (0 ... n-1) of each hit from a label array or image.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] labels The label of each hit, or a label image (0 = no hit).
+    @returns The label of each hit.
+    """
+    labels = np.asarray(labels)
+    if labels.ndim == 2:
+        return labels.ravel()[Xs].astype(np.int64) - 1
+    return labels.astype(np.int64)
+
+def getInteriorPixels(Xs, labels, rows, cols):
+    """
+    Find which hits have all eight neighbours in the same cluster.
+
+    The neighbours are looked up by binary search of the sorted X values;
+    neighbours beyond the edge of the sensor count as missing.
+
+    @param [in] Xs The sorted pixel X values.
+    @param [in] labels The cluster label of each hit.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns A boolean array, True for the interior (inner) pixels.
+    """
+
+    # Use the compiled kernel if there is one.
+    if kernels.useJit():
+        return kernels.interiorPixels(np.asarray(Xs, dtype=np.int64), np.asarray(labels, dtype=np.int64), rows, cols)
+
+    ## The hit x and y values.
+    xs = Xs % cols; ys = Xs // cols
+
+    ## Is the pixel an interior pixel (so far)?
+    interior = np.ones(len(Xs), dtype=np.bool_)
+
+    for dx, dy in NEIGHBOUR_OFFSETS:
+
+        ## The X values of the neighbours.
+        nXs = Xs + (dy * cols) + dx
+
+        ## Where the neighbours would be in the sorted hits.
+        js = np.minimum(np.searchsorted(Xs, nXs), len(Xs) - 1)
+
+        interior &= (Xs[js] == nXs) & (labels[js] == labels)
+
+        # Neighbours beyond the edges of the sensor.
+        interior &= (xs + dx >= 0) & (xs + dx < cols) & (ys + dy >= 0) & (ys + dy < rows)
+
+    return interior
+
+def getInteriorPixelImage(image):
+    """
+    Find the interior pixels of a label image by comparing it with shifted copies.
+
+    A pixel is an interior pixel if all eight of its neighbours have the
+    same (non-zero) label; beyond the edge of the sensor counts as no hit.
+
+    @param [in] image The label image (0 = no hit).
+    @returns A boolean image, True for the interior (inner) pixels.
+    """
+
+    rows, cols = image.shape
+
+    ## The label image with a border of empty pixels.
+    padded = np.zeros((rows + 2, cols + 2), dtype=image.dtype)
+    padded[1:-1, 1:-1] = image
+
+    ## Is the pixel an interior pixel (so far)?
+    interior = (image > 0)
+
+    for dx, dy in NEIGHBOUR_OFFSETS:
+        interior &= (padded[1 + dy:rows + 1 + dy, 1 + dx:cols + 1 + dx] == image)
+
+    return interior
+
+def getEdgePixelCounts(Xs, labels, rows, cols):
+    """
+    Count the edge (outer) pixels of every cluster in a frame at once.
+
+    A label image is tested with shifted-array comparisons
+    (getInteriorPixelImage), a per-hit label array with a binary search
+    of the sorted hits (getInteriorPixels).
+
+    @param [in] Xs The sorted pixel X values of the frame's hits.
+    @param [in] labels The cluster label (0 ... n-1) of each hit, or a label image.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns n_edge The number of edge pixels in each cluster.
+    @returns innerfrac The fraction of inner pixels in each cluster.
+    @returns outerfrac The fraction of outer (edge) pixels in each cluster.
+    """
+
+    labels = np.asarray(labels)
+
+    if labels.ndim == 2:
+        interior = getInteriorPixelImage(labels).ravel()[Xs]
+    else:
+        interior = getInteriorPixels(Xs, labels, rows, cols)
+
+    labels = getHitLabels(Xs, labels)
+
+    ## The number of clusters.
+    n = labels.max() + 1 if len(labels) > 0 else 0
+
+    ## The number of pixels in each cluster.
+    sizes = np.bincount(labels, minlength=n)
+
+    n_edge = sizes - np.bincount(labels[interior], minlength=n)
+
+    outerfrac = n_edge / np.maximum(sizes, 1).astype(np.float64)
+
+    return n_edge, 1.0 - outerfrac, outerfrac
+
+def getLinesOfBestFit(xs, ys, labels, n):
+    """
+    Fit a straight line (y = mx + c) to the pixels of every cluster at once.
+
+    The line is the least squares fit of y on x, found in closed form from
+    the second moments of each cluster's pixels. The residuals are the
+    perpendicular distances of the pixels from the line. As before:
+    * a single pixel gives (0.0, x, 0.0, 0.0);
+    * a horizontal line gives (0.0, y, 0.0, 0.0);
+    * a vertical line gives (VERTICAL_LINE_GRADIENT, VERTICAL_LINE_GRADIENT, 0.0, 0.0).
+
+    @param [in] xs The pixel x values.
+    @param [in] ys The pixel y values.
+    @param [in] labels The cluster label (0 ... n-1) of each pixel.
+    @param [in] n The number of clusters.
+    @returns m The gradients of the lines of best fit.
+    @returns c The intercepts of the lines of best fit.
+    @returns sumR The sums of the residuals.
+    @returns lin The linearities, sumR/N_pixels.
+    """
+
+    ## The number of pixels in each cluster.
+    sizes = np.bincount(labels, minlength=n).astype(np.float64)
+
+    ## The mean x and y values.
+    xm = np.bincount(labels, weights=xs, minlength=n) / sizes
+    ym = np.bincount(labels, weights=ys, minlength=n) / sizes
+
+    ## The pixel positions relative to the means.
+    dxs = xs - xm[labels]; dys = ys - ym[labels]
+
+    ## The second moments.
+    sxx = np.bincount(labels, weights=dxs * dxs, minlength=n)
+    sxy = np.bincount(labels, weights=dxs * dys, minlength=n)
+
+    ## Which clusters are vertical lines (or single pixels)?
+    vertical = (sxx == 0.0)
+
+    m = np.where(vertical, 0.0, sxy / np.where(vertical, 1.0, sxx))
+    c = ym - (m * xm)
+
+    ## The perpendicular distance of each pixel from its cluster's line.
+    ds = np.fabs(m[labels] * xs - ys + c[labels]) / np.sqrt(1.0 + m[labels]**2)
+
+    sumR = np.where(vertical, 0.0, np.bincount(labels, weights=ds, minlength=n))
+
+    # Single pixels and vertical lines.
+    c = np.where(sizes == 1, xm, c)
+    m = np.where(vertical & (sizes > 1), VERTICAL_LINE_GRADIENT, m)
+    c = np.where(vertical & (sizes > 1), VERTICAL_LINE_GRADIENT, c)
+
+    return m, c, sumR, sumR / sizes
+
+def getHullChains(pxs, pys, pls, turn):
+    """
+    Find one half (lower or upper chain) of the convex hull of each cluster.
+
+    The points must be sorted by cluster, then x, then y, with no
+    duplicates. Every point that doesn't make the required turn with its
+    neighbours can't be a hull vertex, so all such points (in all of the
+    clusters) are removed at once, and this is repeated until none are
+    left. The first and last points of each cluster are always kept.
+
+    @param [in] pxs The point x values.
+    @param [in] pys The point y values.
+    @param [in] pls The cluster label of each point.
+    @param [in] turn 1 for the lower chain (anticlockwise turns), -1 for the upper chain.
+    @returns The indices of the points on the chains (in the same order).
+    """
+
+    ## The indices of the points still on the chains.
+    keep = np.arange(len(pxs))
+
+    while len(keep) > 2:
+
+        ## The points and their neighbours along the chains.
+        o = keep[:-2]; a = keep[1:-1]; b = keep[2:]
+
+        ## The z component of the cross product (a - o) x (b - o).
+        cross = (pxs[a] - pxs[o]) * (pys[b] - pys[o]) - (pys[a] - pys[o]) * (pxs[b] - pxs[o])
+
+        ## The points to remove - those (between two points of the same cluster) not turning the right way.
+        remove = (pls[o] == pls[a]) & (pls[b] == pls[a]) & (turn * cross <= 0)
+
+        if not remove.any():
+            break
+
+        keep = keep[np.concatenate(([True], ~remove, [True]))]
+
+    return keep
+
+def getConvexHulls(xs, ys, labels, n):
+    """
+    Find the area and perimeter of the convex hull of each cluster.
+
+    The hulls are of the pixels (as unit squares), so a single pixel has
+    an area of 1 and a perimeter of 4. Only the outer corners of the
+    first and last pixel in each row of a cluster can be on its hull, so
+    these are found for all of the clusters at once. The lower and upper
+    chains of the hulls (as in Andrew's monotone chain algorithm) are
+    then found for all of the clusters together (see getHullChains).
+
+    @param [in] xs The pixel x values.
+    @param [in] ys The pixel y values.
+    @param [in] labels The cluster label (0 ... n-1) of each pixel.
+    @param [in] n The number of clusters.
+    @returns areas The hull areas [pixels^2].
+    @returns perimeters The hull perimeters [pixels].
+    """
+
+    areas = np.zeros(n); perimeters = np.zeros(n)
+
+    if n == 0:
+        return areas, perimeters
+
+    ## The rows of the clusters, and which row each pixel is in.
+    rowkeys, inverse = np.unique(labels * (ys.max() + 1) + ys, return_inverse=True)
+
+    ## The first and last x in each row.
+    lefts = np.full(len(rowkeys), np.inf); np.minimum.at(lefts, inverse, xs)
+    rights = np.full(len(rowkeys), -np.inf); np.maximum.at(rights, inverse, xs)
+
+    ## The cluster and y value of each row.
+    rowlabels = rowkeys // (ys.max() + 1); rowys = rowkeys % (ys.max() + 1)
+
+    ## The candidate hull points (pixel corners) and their clusters.
+    pxs = np.concatenate((lefts, lefts, rights + 1, rights + 1))
+    pys = np.concatenate((rowys, rowys + 1, rowys, rowys + 1))
+    pls = np.tile(rowlabels, 4)
+
+    ## The points sorted by cluster, then x, then y.
+    order = np.lexsort((pys, pxs, pls))
+
+    pxs = pxs[order]; pys = pys[order]; pls = pls[order]
+
+    # Remove the duplicate points (shared corners of neighbouring rows).
+    unique = np.concatenate(([True], (pls[1:] != pls[:-1]) | (pxs[1:] != pxs[:-1]) | (pys[1:] != pys[:-1])))
+
+    pxs = pxs[unique]; pys = pys[unique]; pls = pls[unique]
+
+    for turn in [1, -1]:
+
+        ## The points on the chains.
+        chain = getHullChains(pxs, pys, pls, turn)
+
+        ## The edges along the chains (from each point to the next in the same cluster).
+        a = chain[:-1]; b = chain[1:]; same = pls[a] == pls[b]
+        a = a[same]; b = b[same]
+
+        ## The cluster of each edge.
+        els = pls[a].astype(np.int64)
+
+        # The shoelace terms - the upper chain is followed backwards round the hull.
+        areas += turn * np.bincount(els, weights=pxs[a] * pys[b] - pxs[b] * pys[a], minlength=n)
+
+        perimeters += np.bincount(els, weights=np.hypot(pxs[b] - pxs[a], pys[b] - pys[a]), minlength=n)
+
+    return 0.5 * np.abs(areas), perimeters
+
+def getShapeDescriptors(Xs, labels, rows, cols):
+    """
+    Calculate the shape descriptors of every cluster in a frame at once.
+
+    From the second moments of each cluster's pixels (the covariance
+    eigenvalues l1 >= l2):
+    * eccentricity - sqrt(1 - l2/l1) (0 for a round or single pixel cluster);
+    * orientation - the angle of the principal axis from the x axis [degrees];
+    * axis_major, axis_minor - the axis lengths, 4*sqrt(l) [pixels].
+    Also:
+    * hull_area, hull_perimeter - of the convex hull of the pixels (see getConvexHulls);
+    * bbox_fill - the fraction of the bounding box covered by the pixels.
+
+    @param [in] Xs The sorted pixel X values of the frame's hits.
+    @param [in] labels The cluster label (0 ... n-1) of each hit, or a label image.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns A SHAPE_DESCRIPTORS_DTYPE array with one row per cluster label.
+    """
+
+    labels = getHitLabels(Xs, labels)
+
+    ## The number of clusters.
+    n = labels.max() + 1 if len(labels) > 0 else 0
+
+    ## The shape descriptors.
+    shapes = np.zeros(n, dtype=SHAPE_DESCRIPTORS_DTYPE)
+
+    if n == 0:
+        return shapes
+
+    ## The hit x and y values.
+    xs = (Xs % cols).astype(np.float64); ys = (Xs // cols).astype(np.float64)
+
+    ## The number of pixels in each cluster.
+    sizes = np.bincount(labels, minlength=n).astype(np.float64)
+
+    ## The pixel positions relative to the cluster centres.
+    dxs = xs - (np.bincount(labels, weights=xs, minlength=n) / sizes)[labels]
+    dys = ys - (np.bincount(labels, weights=ys, minlength=n) / sizes)[labels]
+
+    ## The second (central) moments.
+    mu20 = np.bincount(labels, weights=dxs * dxs, minlength=n) / sizes
+    mu02 = np.bincount(labels, weights=dys * dys, minlength=n) / sizes
+    mu11 = np.bincount(labels, weights=dxs * dys, minlength=n) / sizes
+
+    ## The eigenvalues of the covariance matrix.
+    root = np.sqrt(((mu20 - mu02) / 2.0)**2 + mu11**2)
+    l1 = (mu20 + mu02) / 2.0 + root
+    l2 = np.maximum((mu20 + mu02) / 2.0 - root, 0.0)
+
+    shapes["eccentricity"] = np.where(l1 > 0.0, np.sqrt(1.0 - l2 / np.where(l1 > 0.0, l1, 1.0)), 0.0)
+    shapes["orientation"] = np.degrees(0.5 * np.arctan2(2.0 * mu11, mu20 - mu02))
+    shapes["axis_major"] = 4.0 * np.sqrt(l1)
+    shapes["axis_minor"] = 4.0 * np.sqrt(l2)
+
+    shapes["hull_area"], shapes["hull_perimeter"] = getConvexHulls(xs, ys, labels, n)
+
+    ## The bounding box areas.
+    xmins = np.full(n, np.inf); np.minimum.at(xmins, labels, xs)
+    xmaxs = np.full(n, -np.inf); np.maximum.at(xmaxs, labels, xs)
+    ymins = np.full(n, np.inf); np.minimum.at(ymins, labels, ys)
+    ymaxs = np.full(n, -np.inf); np.maximum.at(ymaxs, labels, ys)
+
+    shapes["bbox_fill"] = sizes / ((xmaxs - xmins + 1) * (ymaxs - ymins + 1))
+
+    return shapes
+
+def getKlusterProperties(Xs, Cs, labels, rows, cols, properties=None):
+    """
+    Calculate the properties of every cluster in a frame in one pass.
+
+    @param [in] Xs The sorted pixel X values of the frame's hits.
+    @param [in] Cs The corresponding count values.
+    @param [in] labels The cluster label (0 ... n-1) of each hit, or a label image.
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] properties The properties needed (see getPropertyClosure; None for all of them).
+    @returns A KLUSTER_PROPERTIES_DTYPE array with one row per cluster label
+             (the properties not needed are left as zero).
+    """
+
+    ## The properties to calculate.
+    needed = getPropertyClosure(None) if properties is None else properties
+
+    # The edge (outer) and inner pixels.
+    if needed & EDGE_PROPERTIES:
+        n_edge, innerfrac, outerfrac = getEdgePixelCounts(Xs, labels, rows, cols)
+
+    labels = getHitLabels(Xs, labels)
+
+    ## The number of clusters.
+    n = labels.max() + 1 if len(labels) > 0 else 0
+
+    ## The cluster properties.
+    props = np.zeros(n, dtype=KLUSTER_PROPERTIES_DTYPE)
+
+    if n == 0:
+        return props
+
+    ## The hit x and y values.
+    xs = (Xs % cols).astype(np.float64); ys = (Xs // cols).astype(np.float64)
+
+    ## The order that groups the hits by cluster.
+    order = np.argsort(labels, kind="mergesort")
+
+    ## The number of pixels in each cluster.
+    sizes = np.bincount(labels, minlength=n)
+
+    ## The index (in the grouped hits) of each cluster's first pixel.
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    props["size"] = sizes
+
+    # The bounding boxes.
+    props["xmin"] = np.minimum.reduceat(xs[order], starts)
+    props["xmax"] = np.maximum.reduceat(xs[order], starts)
+    props["ymin"] = np.minimum.reduceat(ys[order], starts)
+    props["ymax"] = np.maximum.reduceat(ys[order], starts)
+    props["width"]  = props["xmax"] - props["xmin"] + 1
+    props["height"] = props["ymax"] - props["ymin"] + 1
+
+    # The unweighted centroids.
+    props["x_uw"] = np.bincount(labels, weights=xs, minlength=n) / sizes
+    props["y_uw"] = np.bincount(labels, weights=ys, minlength=n) / sizes
+
+    # The radius - the largest distance of a pixel from the centroid.
+    if "radius_uw" in needed:
+        d2 = (xs - props["x_uw"][labels])**2 + (ys - props["y_uw"][labels])**2
+        props["radius_uw"] = np.sqrt(np.maximum.reduceat(d2[order], starts))
+
+    # The spatial density (zero for a zero-radius cluster).
+    if "density_uw" in needed:
+        r = props["radius_uw"]
+        props["density_uw"] = np.where(r > 0.0, sizes / (np.pi * np.where(r > 0.0, r, 1.0)**2), 0.0)
+
+    # The counts.
+    props["totalcounts"] = np.bincount(labels, weights=Cs, minlength=n).round()
+    props["maxcounts"] = np.maximum.reduceat(Cs[order], starts)
+
+    if "x_w" in needed or "y_w" in needed:
+
+        ## The total counts, for weighting (1 for clusters with no counts).
+        ws = np.where(props["totalcounts"] > 0, props["totalcounts"], 1).astype(np.float64)
+
+        # The count-weighted centroids (unweighted for clusters with no counts).
+        props["x_w"] = np.where(props["totalcounts"] > 0, np.bincount(labels, weights=xs * Cs, minlength=n) / ws, props["x_uw"])
+        props["y_w"] = np.where(props["totalcounts"] > 0, np.bincount(labels, weights=ys * Cs, minlength=n) / ws, props["y_uw"])
+
+    # The weighted radius - the largest distance of a pixel from the weighted centroid.
+    if "radius_w" in needed:
+        d2 = (xs - props["x_w"][labels])**2 + (ys - props["y_w"][labels])**2
+        props["radius_w"] = np.sqrt(np.maximum.reduceat(d2[order], starts))
+
+    # The count density (zero for a zero-radius cluster).
+    if "density_w" in needed:
+        r = props["radius_w"]
+        props["density_w"] = np.where(r > 0.0, props["totalcounts"] / (np.pi * np.where(r > 0.0, r, 1.0)**2), 0.0)
+
+    if needed & EDGE_PROPERTIES:
+        props["n_edgepixels"] = n_edge
+        props["edgefrac"] = outerfrac
+        props["innerfrac"] = innerfrac
+
+    # Clusters touching the edge of the sensor.
+    props["isedgekluster"] = (props["xmin"] == 0) | (props["ymin"] == 0) | \
+                             (props["xmax"] == cols - 1) | (props["ymax"] == rows - 1)
+
+    # The lines of best fit and linearity.
+    if needed & LINE_PROPERTIES:
+        props["lin_m"], props["lin_c"], props["lin_sumofres"], props["lin_linearity"] = \
+            getLinesOfBestFit(xs, ys, labels, n)
+
+    # The shape descriptors.
+    if needed & SHAPE_PROPERTIES:
+        shapes = getShapeDescriptors(Xs, labels, rows, cols)
+        for name in SHAPE_DESCRIPTORS_DTYPE.names:
+            props[name] = shapes[name]
+
+    lg.debug(" * Calculated the properties of %d clusters." % (n))
+
+    return props
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Readers for the Pixelman data file formats.
+
+Each reader turns the contents of a data file into two arrays - the
+pixel X values (X = y*cols + x) and their count values - which can be
+turned into a pixel map {X:C} with getPixelMap(). The ASCII formats are
+converted in a single NumPy call over the whole file, rather than
+splitting and converting each line in Python. The binary formats are
+memory-mapped and viewed as typed arrays, with no per-pixel Python work.
+
+The binary files hold little-endian values, in the data type given on
+the "Type=" line of the frame's DSC file (e.g. "Type=i16 [X,C] width=256
+height=256"). The matrix format (17) is one value per pixel, in row
+order; the sparse formats are packed records of 32-bit unsigned pixel
+indices - X (8209) or x and y (4113) - followed by the count value.
+"""
+
+#...the usual suspects.
+import os, stat
+
+#...for the memory maps.
+import mmap
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+## The number of values on each line of the ASCII column formats { format:values }.
+ASCII_COLUMNS = {
+    4114 : 3, # ASCII [x, y, C].
+    8210 : 2, # ASCII [X, C].
+    }
+
+## The ASCII matrix format.
+ASCII_MATRIX = 18
+
+## The ASCII formats the readers understand.
+ASCII_FORMATS = sorted(ASCII_COLUMNS.keys() + [ASCII_MATRIX])
+
+## The binary count value types { DSC type name:NumPy data type }.
+BINARY_VALUE_TYPES = {
+    "i16"    : "<i2",
+    "u32"    : "<u4",
+    "double" : "<f8",
+    }
+
+## The data type of the binary pixel indices.
+BINARY_INDEX_TYPE = "<u4"
+
+## The index fields of each binary format's records { format:fields }.
+BINARY_INDICES = {
+    17   : [],         # Binary matrix.
+    8209 : ["X"],      # Binary [X, C].
+    4113 : ["x", "y"], # Binary [x, y, C].
+    }
+
+## The binary format for each DSC layout (anything else is a matrix).
+BINARY_LAYOUTS = {
+    "[X,C]"   : 8209,
+    "[X,Y,C]" : 4113,
+    }
+
+def parseAsciiBuffer(buf, fmt, rows, cols):
+    """
+    Get the hits from the contents of an ASCII data file.
+
+    @param [in] buf The contents of the data file (a string).
+    @param [in] fmt The data file format (see datavals.DATA_FILE_TYPES).
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns Xs, Cs The pixel X values and their count values (in file order).
+    """
+
+    if fmt not in ASCII_FORMATS:
+        raise IOError("FRAME_BAD_FORMAT")
+
+    ## All of the values in the file, in order.
+    vals = np.fromstring(buf, dtype=np.int64, sep=" ")
+
+    if fmt == ASCII_MATRIX:
+
+        if len(vals) != rows * cols:
+            raise IOError("FRAME_BAD_FORMAT")
+
+        # Only the hit pixels are kept.
+        Xs = np.flatnonzero(vals > 0)
+
+        return Xs, vals[Xs]
+
+    ## The number of values on each line.
+    n = ASCII_COLUMNS[fmt]
+
+    ## The number of lines in the file.
+    n_lines = buf.strip().count("\n") + 1 if len(vals) > 0 else 0
+
+    # A bad value stops the conversion, so check that nothing is missing.
+    if len(vals) != n * n_lines:
+        raise IOError("FRAME_BAD_FORMAT")
+
+    vals = vals.reshape((n_lines, n))
+
+    if fmt == 4114:
+        return (vals[:, 1] * cols) + vals[:, 0], vals[:, 2]
+
+    return vals[:, 0], vals[:, 1]
+
+def parseAsciiLines(ls, fmt, rows, cols):
+    """
+    Get the pixel map from the lines of an ASCII data file, one line at a time.
+
+    This is the original line-by-line parser, kept as the reference for
+    parseAsciiBuffer (see benchmark-readers.py).
+
+    @param [in] ls The lines of the data file.
+    @param [in] fmt The data file format (see datavals.DATA_FILE_TYPES).
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @returns The pixel map {X:C}.
+    """
+
+    ## The pixel map.
+    pixelmap = {}
+
+    # Loop over the lines in the file.
+    for j, l in enumerate(ls):
+
+        if   fmt == 4114: # ASCII xyC.
+            vals = l.strip().split("\t")
+            pixelmap[cols * int(vals[1]) + int(vals[0])] = int(vals[2])
+        elif fmt == 18: # ASCII matrix.
+            vals = [int(val) for val in l.strip().split(" ")]
+            for i, C in enumerate(vals):
+                if C > 0:
+                    pixelmap[(cols * j) + i] = C
+        elif fmt == 8210: # ASCII XC
+            vals = [int(val) for val in l.strip().split("\t")]
+            pixelmap[vals[0]] = vals[1]
+        else:
+            raise IOError("FRAME_BAD_FORMAT")
+
+    return pixelmap
+
+def getPixelMap(Xs, Cs):
+    """
+    Make a pixel map from the hit arrays.
+
+    As with a dictionary filled line by line, a pixel that appears more
+    than once keeps its last count value.
+
+    @param [in] Xs The pixel X values.
+    @param [in] Cs The corresponding count values.
+    @returns The pixel map {X:C}.
+    """
+    return dict(zip(Xs.tolist(), Cs.tolist()))
+
+def parseTypeLine(l):
+    """
+    Get the data type and layout from the "Type=" line of a DSC file.
+
+    @param [in] l The line, e.g. "Type=i16 [X,Y,C] width=256 height=256".
+    @returns The data type (e.g. "i16"), the layout (e.g. "[X,Y,C]", or None
+             for a matrix) and the frame width and height (None if not given).
+    """
+
+    ## The values on the line.
+    vals = l.strip().split()
+
+    if len(vals) == 0 or not vals[0].startswith("Type="):
+        raise IOError("BAD_DSC_TYPE")
+
+    ## The layout (if there is one).
+    layout = None
+
+    ## The frame dimensions { "width"/"height":value }.
+    dims = {}
+
+    for val in vals[1:]:
+        if val.startswith("["):
+            layout = val.upper()
+        elif "=" in val:
+            key, value = val.split("=", 1)
+            try:
+                dims[key] = int(value)
+            except ValueError:
+                raise IOError("BAD_DSC_TYPE")
+
+    return vals[0].split("=")[1], layout, dims.get("width"), dims.get("height")
+
+def getBinaryDtype(fmt, datatype):
+    """
+    Get the NumPy data type of a binary format's values (or records).
+
+    @param [in] fmt The data file format (17, 8209 or 4113).
+    @param [in] datatype The count data type from the DSC file (see BINARY_VALUE_TYPES).
+    @returns The NumPy data type.
+    """
+
+    if fmt not in BINARY_INDICES:
+        raise IOError("FRAME_BAD_FORMAT")
+
+    if datatype not in BINARY_VALUE_TYPES:
+        raise IOError("BAD_DATA_TYPE")
+
+    if fmt == 17:
+        return np.dtype(BINARY_VALUE_TYPES[datatype])
+
+    return np.dtype([(name, BINARY_INDEX_TYPE) for name in BINARY_INDICES[fmt]] + \
+        [("C", BINARY_VALUE_TYPES[datatype])])
+
+def getBinaryFormat(size, typeline):
+    """
+    Work out the binary format of a data file from its DSC "Type=" line.
+
+    @param [in] size The size of the data file [bytes].
+    @param [in] typeline The "Type=" line of the frame's DSC file.
+    @returns The format (see datavals.DATA_FILE_TYPES), or 0 if the size doesn't fit it.
+    """
+
+    datatype, layout, cols, rows = parseTypeLine(typeline)
+
+    if datatype not in BINARY_VALUE_TYPES:
+        return 0
+
+    ## The binary format.
+    fmt = BINARY_LAYOUTS.get(layout, 17)
+
+    ## The size of each value (or record) [bytes].
+    itemsize = getBinaryDtype(fmt, datatype).itemsize
+
+    if fmt == 17 and rows is not None and cols is not None:
+        return fmt if size == rows * cols * itemsize else 0
+
+    return fmt if size % itemsize == 0 else 0
+
+def parseBinaryBuffer(buf, fmt, rows, cols, datatype="i16"):
+    """
+    Get the hits from the contents of a binary data file.
+
+    @param [in] buf The contents of the data file (a string, or a memory map).
+    @param [in] fmt The data file format (17, 8209 or 4113).
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] datatype The count data type from the DSC file (see BINARY_VALUE_TYPES).
+    @returns Xs, Cs The pixel X values and their count values (in file order).
+    """
+
+    ## The data type of the values (or records).
+    dt = getBinaryDtype(fmt, datatype)
+
+    if len(buf) % dt.itemsize != 0 or (fmt == 17 and len(buf) != rows * cols * dt.itemsize):
+        raise IOError("FRAME_BAD_FORMAT")
+
+    if len(buf) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    ## The contents, viewed (not copied) as the values (or records).
+    vals = np.frombuffer(buf, dtype=dt)
+
+    if fmt == 17:
+        # Only the hit pixels are kept.
+        Xs = np.flatnonzero(vals > 0)
+        Cs = vals[Xs].astype(np.int64)
+    elif fmt == 8209:
+        Xs = vals["X"].astype(np.int64)
+        Cs = vals["C"].astype(np.int64)
+    else:
+        Xs = (vals["y"].astype(np.int64) * cols) + vals["x"]
+        Cs = vals["C"].astype(np.int64)
+
+    if len(Xs) > 0 and (Xs.min() < 0 or Xs.max() >= rows * cols):
+        raise IOError("FRAME_BAD_FORMAT")
+
+    return Xs, Cs
+
+def readBinaryFile(fn, fmt, rows, cols, datatype="i16"):
+    """
+    Get the hits from a binary data file, via a memory map.
+
+    See parseBinaryBuffer for the arguments.
+    """
+
+    # (An empty file can't be mapped.)
+    if os.path.getsize(fn) == 0:
+        return parseBinaryBuffer("", fmt, rows, cols, datatype)
+
+    ## The file's contents (the arrays returned are copies, so the map can be closed).
+    mm = np.memmap(fn, dtype=np.uint8, mode="r")
+
+    try:
+        return parseBinaryBuffer(mm, fmt, rows, cols, datatype)
+    finally:
+        del mm
+
+def parseDataBuffer(buf, fmt, rows, cols, datatype="i16"):
+    """
+    Get the hits from the contents of a data file in any of the formats.
+
+    The contents can be a memory map (see readFile), in which case the
+    binary formats are viewed through the map and the ASCII formats are
+    copied out of it for the conversion.
+
+    See parseAsciiBuffer and parseBinaryBuffer for the arguments.
+    """
+
+    if fmt in BINARY_INDICES:
+        return parseBinaryBuffer(buf, fmt, rows, cols, datatype)
+
+    return parseAsciiBuffer(buf[:], fmt, rows, cols)
+
+def readFile(fn, calls=None, mapped=False):
+    """
+    Read the whole of a file with a single open.
+
+    The file is opened, its size found with fstat, and read into one
+    buffer, so the same contents can be used to classify and then
+    parse it. If mapped, the file is memory mapped instead of read, so
+    that the binary formats can be parsed without copying the file
+    (the map can be sliced and searched like a string).
+
+    @param [in] fn The path of the file.
+    @param [in] calls A dictionary to add the file system calls made to {name:count} (optional).
+    @param [in] mapped Memory map the file rather than reading it?
+    @returns The contents of the file (a string, or a read-only mmap.mmap
+             if mapped and the file isn't empty) and its os.fstat result.
+    """
+
+    if calls is None:
+        calls = {}
+
+    fd = os.open(fn, os.O_RDONLY); calls["open"] = calls.get("open", 0) + 1
+
+    try:
+        st = os.fstat(fd); calls["fstat"] = calls.get("fstat", 0) + 1
+
+        if stat.S_ISDIR(st.st_mode):
+            raise IOError("CONTAINS_DIR")
+
+        # (An empty file can't be mapped.)
+        if mapped and st.st_size > 0:
+            mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ); calls["mmap"] = calls.get("mmap", 0) + 1
+            return mm, st
+
+        ## The chunks read so far.
+        chunks = []
+
+        ## The number of bytes to ask for - one more than the file holds,
+        ## so that (unless it has grown since the fstat) one read is enough.
+        n = st.st_size + 1
+
+        # A short read means the end of the file has been reached.
+        while True:
+            chunk = os.read(fd, n); calls["read"] = calls.get("read", 0) + 1
+            chunks.append(chunk)
+            if len(chunk) < n:
+                break
+            n = 65536
+
+    finally:
+        os.close(fd); calls["close"] = calls.get("close", 0) + 1
+
+    return "".join(chunks), st
+
+def readDataFile(fn, fmt, rows, cols, datatype="i16"):
+    """
+    Read the hits from a data file.
+
+    @param [in] fn The path of the data file.
+    @param [in] fmt The data file format (see datavals.DATA_FILE_TYPES).
+    @param [in] rows The number of rows in the frame.
+    @param [in] cols The number of columns in the frame.
+    @param [in] datatype The count data type from the DSC file (binary formats only).
+    @returns Xs, Cs The pixel X values and their count values.
+    """
+
+    if fmt in BINARY_INDICES:
+        Xs, Cs = readBinaryFile(fn, fmt, rows, cols, datatype)
+    else:
+        with open(fn, "r") as f:
+            buf = f.read()
+        Xs, Cs = parseAsciiBuffer(buf, fmt, rows, cols)
+
+    lg.debug(" * Read %d hits from '%s'." % (len(Xs), fn))
+
+    return Xs, Cs
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A precomputed table of the small (1-4 pixel) cluster shapes.
+
+Every 8-connected shape of up to four pixels fits in a 4x4 grid once it
+has been moved to the origin, so it can be identified by a 16-bit shape
+code (bit y*4 + x set for each pixel). The table gives the radius and
+gamma candidate classification of each shape, so small clusters can be
+counted without building and processing a cluster object.
+"""
+
+#...for the MATH.
+import numpy as np
+
+#...for the data values.
+from datavals import *
+
+## The size of the (square) grid the small shapes are coded in.
+SHAPE_GRID = 4
+
+## The largest cluster with a shape code [pixels].
+MAX_SHAPE_SIZE = 4
+
+## The shape code for clusters that don't have one.
+NO_SHAPE = 0
+
+def isGammaCandidate(npix, radius):
+    """
+    Is a cluster with this size and radius a gamma candidate?
+
+    @param [in] npix The number of pixels in the cluster.
+    @param [in] radius The (unweighted) cluster radius [pixels].
+    @returns True if the cluster is a gamma candidate.
+    """
+    return npix == 1 or npix == 2 or (npix == 3 and radius < TRIPIXEL_RADIUS) or (npix == 4 and radius < TETRAPIXEL_RADIUS)
+
+def getShapeRadius(pixels):
+    """
+    The largest distance of a pixel from the centre of the shape.
+
+    @param [in] pixels A list of the (x, y) pixel positions.
+    @returns The radius [pixels].
+    """
+
+    xs = np.array([float(x) for x, y in pixels]); ys = np.array([float(y) for x, y in pixels])
+
+    return np.sqrt(((xs - xs.mean())**2 + (ys - ys.mean())**2).max())
+
+def getShapeCode(Xs, cols):
+    """
+    Get the shape code of a single cluster.
+
+    @param [in] Xs The pixel X values of the cluster.
+    @param [in] cols The number of columns in the frame.
+    @returns The shape code (NO_SHAPE if the cluster is too big).
+    """
+
+    if len(Xs) > MAX_SHAPE_SIZE:
+        return NO_SHAPE
+
+    xs = [X % cols for X in Xs]; ys = [X // cols for X in Xs]
+
+    xmin = min(xs); ymin = min(ys)
+
+    if max(xs) - xmin >= SHAPE_GRID or max(ys) - ymin >= SHAPE_GRID:
+        return NO_SHAPE
+
+    return sum(1 << (((y - ymin) * SHAPE_GRID) + (x - xmin)) for x, y in zip(xs, ys))
+
+def getShapeCodes(Xs, labels, cols, n):
+    """
+    Get the shape codes of all of the clusters in a frame at once.
+
+    @param [in] Xs The pixel X values of the frame's hits.
+    @param [in] labels The cluster label (0 ... n-1) of each hit.
+    @param [in] cols The number of columns in the frame.
+    @param [in] n The number of clusters.
+    @returns The shape code of each cluster (NO_SHAPE if it is too big).
+    """
+
+    ## The hit x and y values.
+    xs = Xs % cols; ys = Xs // cols
+
+    ## The bottom left corner of each cluster.
+    xmins = np.full(n, np.iinfo(np.int64).max, dtype=np.int64); np.minimum.at(xmins, labels, xs)
+    ymins = np.full(n, np.iinfo(np.int64).max, dtype=np.int64); np.minimum.at(ymins, labels, ys)
+
+    ## The pixel positions relative to the corner.
+    dxs = xs - xmins[labels]; dys = ys - ymins[labels]
+
+    ## Does the pixel fit in the grid?
+    fits = (dxs < SHAPE_GRID) & (dys < SHAPE_GRID)
+
+    ## The number of pixels in each cluster.
+    sizes = np.bincount(labels, minlength=n)
+
+    ## Do all of the cluster's pixels fit in the grid?
+    small = (sizes <= MAX_SHAPE_SIZE) & (np.bincount(labels, weights=~fits, minlength=n) == 0)
+
+    ## The shape code bit of each pixel.
+    bits = np.where(fits, (dys * SHAPE_GRID) + dxs, 0)
+
+    codes = np.bincount(labels, weights=np.left_shift(1, bits), minlength=n).astype(np.int64)
+
+    return np.where(small, codes, NO_SHAPE)
+
+def makeSmallShapes():
+    """
+    Find every 8-connected shape of 1 to MAX_SHAPE_SIZE pixels.
+
+    @returns A dictionary of the shapes {code:(size, radius, isgamma)}.
+    """
+
+    ## The shapes of the current size (as sorted tuples of (x, y) positions).
+    current = set([((0, 0),)])
+
+    ## The shapes found {code:(size, radius, isgamma)}.
+    shapes = {}
+
+    for npix in range(1, MAX_SHAPE_SIZE + 1):
+
+        for shape in current:
+
+            code = sum(1 << ((y * SHAPE_GRID) + x) for x, y in shape)
+
+            radius = getShapeRadius(shape)
+
+            shapes[code] = (npix, radius, isGammaCandidate(npix, radius))
+
+        ## The shapes with one more pixel.
+        grown = set()
+
+        for shape in current:
+            for x, y in shape:
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        if (x + dx, y + dy) in shape:
+                            continue
+                        ps = list(shape) + [(x + dx, y + dy)]
+                        xmin = min(p[0] for p in ps); ymin = min(p[1] for p in ps)
+                        grown.add(tuple(sorted((p[0] - xmin, p[1] - ymin) for p in ps)))
+
+        current = grown
+
+    return shapes
+
+## The small cluster shapes {code:(size, radius, isgamma)}.
+SMALL_SHAPES = makeSmallShapes()
+
+## The gamma classification of each shape code (1 = gamma, 0 = not, -1 = not a known shape).
+SHAPE_TABLE = np.full(1 << (SHAPE_GRID * SHAPE_GRID), -1, dtype=np.int8)
+#
+for code, (npix, radius, isgamma) in SMALL_SHAPES.iteritems():
+    SHAPE_TABLE[code] = int(isgamma)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#...for the unit testing.
+import unittest
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+#...for the Pixelman dataset wrapper.
+from dataset import Dataset
+
+#...for the labelling engines.
+from labelling import getHitArrays, labelSparse
+
+#...for the cluster properties.
+from properties import getInteriorPixels
+
+#...for the bitset frames.
+from bitset import BitsetFrame, packBits, unpackBits, countBits, shiftBits, dilateBits, erodeBits, countEdgeBits
+
+class BitsetTest(unittest.TestCase):
+
+    def setUp(self):
+
+        ## A 3x3 block, a bipixel across a word boundary and a corner monopixel.
+        self.pixelmap = dict([((256 * y) + x, x + y) for y in range(10, 13) for x in range(10, 13)] + \
+            [((256 * 20) + 63, 5), ((256 * 20) + 64, 6), ((256 * 255) + 255, 7)])
+
+        ## The sorted pixel X values.
+        self.Xs = np.array(sorted(self.pixelmap.keys()))
+
+    def tearDown(self):
+        pass
+
+    def test_packing(self):
+
+        bits = packBits(self.Xs, 256, 256)
+
+        # The tests
+        #-----------
+        self.assertEqual(bits.shape, (256, 4))
+        self.assertEqual(bits.nbytes, 8192)
+        self.assertEqual(list(unpackBits(bits)), list(self.Xs))
+        self.assertEqual(countBits(bits), len(self.Xs))
+        #
+        # The frame width must be a whole number of words.
+        self.assertRaises(IOError, packBits, self.Xs, 256, 100)
+
+    def test_shifts(self):
+
+        bits = packBits(self.Xs, 256, 256)
+
+        # The tests
+        #-----------
+        #
+        # Across the word boundary (and off the edge of the sensor).
+        self.assertEqual(list(unpackBits(shiftBits(bits, 1, 0)))[-2:], [(256 * 20) + 64, (256 * 20) + 65])
+        self.assertEqual(countBits(shiftBits(bits, 1, 0)), 11)
+        self.assertEqual(list(unpackBits(shiftBits(bits, -1, 1)))[-2:], [(256 * 21) + 62, (256 * 21) + 63])
+        self.assertEqual(countBits(shiftBits(bits, 0, -20)), 3)
+        self.assertEqual(countBits(shiftBits(bits, 0, -21)), 1)
+        #
+        # Dilating and eroding the 3x3 block.
+        block = packBits(self.Xs[:9], 256, 256)
+        self.assertEqual(countBits(dilateBits(block)), 25)
+        self.assertEqual(countBits(dilateBits(block, 4)), 21)
+        self.assertEqual(list(unpackBits(erodeBits(block))), [(256 * 11) + 11])
+        self.assertEqual(countBits(erodeBits(dilateBits(block))), 9)
+
+    def test_bitset_frame(self):
+
+        f = BitsetFrame(self.pixelmap)
+
+        # The tests
+        #-----------
+        self.assertEqual(f.getOccupancy(), 12)
+        self.assertTrue(f.isHit((256 * 20) + 64))
+        self.assertFalse(f.isHit((256 * 20) + 65))
+        self.assertEqual(f.getCount((256 * 20) + 64), 6)
+        self.assertEqual(f.getCount((256 * 20) + 65), 0)
+        self.assertEqual(list(f.getCounts([(256 * 10) + 10, (256 * 12) + 12])), [20, 24])
+        #
+        self.assertEqual(len(f.getNeighbours((256 * 11) + 11)), 8)
+        self.assertEqual(list(f.getNeighbours((256 * 20) + 63)), [(256 * 20) + 64])
+        self.assertEqual(list(f.getIsolatedPixels()), [(256 * 255) + 255])
+        self.assertEqual(list(f.floodFill((256 * 10) + 10)), list(self.Xs[:9]))
+        self.assertEqual(list(f.getEdgePixels()), [X for X in self.Xs if X != (256 * 11) + 11])
+        self.assertEqual(list(f.getSensorEdgeHits()), [(256 * 255) + 255])
+        self.assertEqual(list(f.label()), [0] * 9 + [1, 1, 2])
+
+    def test_match_test_data(self):
+
+        ## The frames from the test dataset.
+        frames = Dataset("testdata/ASCIIxyC").getFrames((51.509915, -0.142515, 34.02), skipclustering=True)
+
+        for frame in frames:
+
+            f = BitsetFrame(frame.getPixelMap())
+
+            Xs, Cs = f.getHitArrays()
+
+            # The tests
+            #-----------
+            self.assertEqual(list(Xs), list(getHitArrays(frame.getPixelMap())[0]))
+            self.assertEqual(list(Cs), list(getHitArrays(frame.getPixelMap())[1]))
+            #
+            for connectivity in [4, 8]:
+                self.assertEqual(list(f.label(connectivity)), list(labelSparse(Xs, 256, 256, connectivity)[0]))
+            #
+            # The edge pixels of each cluster.
+            labels, groups = labelSparse(Xs, 256, 256)
+            interior = getInteriorPixels(Xs, labels, 256, 256)
+            for i, g in enumerate(groups):
+                self.assertEqual(countEdgeBits(g, 256, 256), np.sum(~interior[labels == i]))
+
+
+if __name__ == "__main__":
+
+    lg.basicConfig(filename='log_test_bitset.txt', filemode='w', level=lg.DEBUG)
+
+    lg.info("")
+    lg.info("=================================================")
+    lg.info(" Logger output from cernatschool/test_bitset.py ")
+    lg.info("=================================================")
+    lg.info("")
+
+    unittest.main()
@@ -4,6 +4,9 @@
 #...the usual suspects.
 import os, inspect
 
+#...for the temporary datasets.
+import tempfile, shutil
+
 #...for the unit testing.
 import unittest
 
@@ -13,6 +16,9 @@ import logging as lg
 #...for the dataset wrapper.
 from dataset import Dataset
 
+#...for the DSC file wrapper.
+from dsc import DscFile
+
 class DatasetTest(unittest.TestCase):
 
     def setUp(self):
@@ -31,6 +37,119 @@ class DatasetTest(unittest.TestCase):
         # The number of datafiles.
         self.assertEqual(pds.getNumberOfDataFiles(), 5)
 
+    def test_single_open(self):
+
+        ## The Pixelman dataset object.
+        pds = Dataset("testdata/ASCIIxyC/")
+
+        # The tests
+        #-----------
+        #
+        # Each file is opened, stat-ed, read (or, for the data files,
+        # memory mapped) and closed once.
+        self.assertEqual(len(pds.getFileSystemCalls()), 10)
+        for bn, calls in pds.getFileSystemCalls().iteritems():
+            if bn.endswith(".dsc"):
+                self.assertEqual(calls, {"open" : 1, "fstat" : 1, "read" : 1, "close" : 1})
+            else:
+                self.assertEqual(calls, {"open" : 1, "fstat" : 1, "mmap" : 1, "close" : 1})
+        self.assertEqual(pds.getNumberOfFileSystemCalls(), 40)
+        #
+        # The DSC files match those read straight from the files.
+        for df in pds.dscfiles:
+            rdf = DscFile(df.getDscFilename())
+            self.assertEqual(df.getPixelMap(), rdf.getPixelMap())
+            self.assertEqual(df.getStartTime(), rdf.getStartTime())
+            self.assertEqual(df.getChipId(), rdf.getChipId())
+            self.assertEqual(df.getDACs(), rdf.getDACs())
+
+    def test_lazy_frames(self):
+
+        ## The geospatial information.
+        geo = (51.509915, -0.142515, 34.02)
+
+        ## The eager and lazy datasets.
+        pds = Dataset("testdata/ASCIIxyC/")
+        lds = Dataset("testdata/ASCIIxyC/", lazy=True)
+
+        # The tests
+        #-----------
+        #
+        # Only the DSC files have been read.
+        self.assertTrue(lds.isLazy())
+        self.assertEqual(lds.getNumberOfDataFiles(), 5)
+        self.assertEqual(len(lds.getFileSystemCalls()), 5)
+        self.assertFalse(any(df.isDataLoaded() for df in lds.dscfiles))
+        #
+        ## The frame generator.
+        frames = lds.iterFrames(geo)
+        #
+        # Nothing is read until the first frame is asked for...
+        self.assertEqual(len(lds.getFileSystemCalls()), 5)
+        f = next(frames)
+        self.assertEqual(len(lds.getFileSystemCalls()), 6)
+        self.assertEqual(lds.datfileformats.values(), [4114])
+        #
+        # ...and the data file is released once the frame is made.
+        self.assertFalse(any(df.isDataLoaded() for df in lds.dscfiles))
+        #
+        # The frames are the same as those made all at once.
+        for lf, pf in zip([f] + list(frames), pds.getFrames(geo)):
+            self.assertEqual(lf.getStartTime(), pf.getStartTime())
+            self.assertEqual(lf.getPixelMap(), pf.getPixelMap())
+            self.assertEqual(lf.getNumberOfKlusters(), pf.getNumberOfKlusters())
+            self.assertEqual(lf.getNumberOfGammas(), pf.getNumberOfGammas())
+        #
+        # Each data file was mapped once.
+        for bn in lds.datfilenames.values():
+            self.assertEqual(lds.getFileSystemCalls()[bn], {"open" : 1, "fstat" : 1, "mmap" : 1, "close" : 1})
+        self.assertEqual(len(lds.getFrames(geo)), 5)
+        #
+        # The batched clustering gives the same clusters.
+        for lt, pt in zip(lds.getKlusterTable(chunksize=2), pds.getKlusterTable()):
+            self.assertEqual(lt.tolist(), pt.tolist())
+
+    def test_bad_datasets(self):
+
+        ## The temporary directory for the datasets.
+        tmpdir = tempfile.mkdtemp()
+
+        try:
+            ## The first data file of the test dataset.
+            fn = sorted(os.listdir("testdata/ASCIIxyC"))[0]
+
+            # A data file without its DSC file.
+            shutil.copy(os.path.join("testdata/ASCIIxyC", fn), tmpdir)
+            self.assertRaises(IOError, Dataset, tmpdir)
+            #
+            # ...and with it.
+            shutil.copy(os.path.join("testdata/ASCIIxyC", fn + ".dsc"), tmpdir)
+            self.assertEqual(Dataset(tmpdir).getNumberOfDataFiles(), 1)
+            #
+            # A data file that isn't one is only found when it's read.
+            with open(os.path.join(tmpdir, fn), "w") as f:
+                f.write("Not a data file.\n")
+            self.assertRaises(IOError, Dataset, tmpdir)
+            lds = Dataset(tmpdir, lazy=True)
+            self.assertRaises(IOError, list, lds.iterFrames((0.0, 0.0, 0.0)))
+            #
+            # A stray file (without a DSC file) is rejected the same way by both kinds of dataset.
+            shutil.copy(os.path.join("testdata/ASCIIxyC", fn), tmpdir)
+            with open(os.path.join(tmpdir, "README"), "w") as f:
+                f.write("Not a data file.\n")
+            for lazy in [False, True]:
+                with self.assertRaises(IOError) as cm:
+                    Dataset(tmpdir, lazy=lazy)
+                self.assertEqual(cm.exception.args[0], "BAD_FORMAT")
+            os.remove(os.path.join(tmpdir, "README"))
+            #
+            # A directory in the dataset.
+            os.mkdir(os.path.join(tmpdir, "subdir"))
+            self.assertRaises(IOError, Dataset, tmpdir)
+
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#...the usual suspects.
+import os, glob
+
+#...for the unit testing.
+import unittest
+
+#...for the logging.
+import logging as lg
+
+#...for the temporary datasets.
+import tempfile, shutil
+
+#...for the dataset wrapper.
+from dataset import Dataset
+
+#...for the DSC file wrapper.
+from dsc import DscFile
+
+#...for the DSC headers.
+from dscheader import parseDscHeader, getDscKey, DscHeaderCache
+
+#...for the DSC key strings.
+from dscvals import *
+
+class DscHeaderTest(unittest.TestCase):
+
+    def setUp(self):
+
+        ## The test DSC files.
+        self.dscfilenames = sorted(glob.glob("testdata/ASCIIxyC/*.dsc"))
+
+    def tearDown(self):
+        pass
+
+    def test_parse_header(self):
+
+        with open(self.dscfilenames[0], "r") as f:
+            header = parseDscHeader(f.read())
+
+        ## The settings.
+        fields = header["fields"]
+
+        # The tests
+        #-----------
+        self.assertEqual(header["typeline"], "Type=i16 [X,Y,C] width=256 height=256")
+        self.assertEqual(getDscKey(DSC_BIAS_VOLTAGE_STRING), "hv")
+        self.assertEqual(getDscKey(DSC_TPX_CLOCK_STRING), "timepix clock")
+        self.assertEqual(fields["hv"], ["double", 18.0])
+        self.assertEqual(fields["acq mode"], ["i32", 1])
+        self.assertEqual(fields["chipboardid"], ["uchar", "B06-W0212"])
+        self.assertEqual(fields["dacs"][1], [1, 100, 255, 127, 127, 0, 405, 7, 130, 128, 80, 85, 128, 128])
+        self.assertEqual(fields["start time (string)"][1], "Tue Jun 18 18:10:24.293207 2013")
+        #
+        # Values that can't be converted are left as they are.
+        self.assertEqual(parseDscHeader("A000000001\n[F0]\nType=i16 [X,C]\n\"HV\" (\"V\"):\ndouble[1]\nabc\n")["fields"]["hv"], \
+            ["double", "abc"])
+        self.assertRaises(IOError, parseDscHeader, "1\t2\t3\n")
+
+    def test_header_cache(self):
+
+        ## The temporary directory for the dataset and cache.
+        tmpdir = tempfile.mkdtemp()
+
+        try:
+            ## The dataset directory.
+            datadir = os.path.join(tmpdir, "data")
+            shutil.copytree("testdata/ASCIIxyC", datadir)
+
+            ## The cache file path.
+            path = os.path.join(tmpdir, "headers.json")
+
+            ## The cache.
+            headers = DscHeaderCache(path)
+
+            ## The dataset read without the cache.
+            ds = Dataset(datadir)
+
+            # The tests
+            #-----------
+            #
+            # The first time, the headers are parsed and added to the cache.
+            self.assertEqual(Dataset(datadir, headers).getNumberOfDataFiles(), 5)
+            self.assertEqual(headers.getNumberOfHits(), 0)
+            self.assertEqual(headers.getNumberOfUpdates(), 5)
+            headers.save()
+            #
+            # The second time, the DSC files aren't read at all.
+            headers = DscHeaderCache(path)
+            cds = Dataset(datadir, headers)
+            self.assertEqual(headers.getNumberOfHits(), 5)
+            self.assertEqual(headers.getNumberOfUpdates(), 0)
+            for bn in cds.dscfilenames.values():
+                self.assertEqual(cds.getFileSystemCalls()[bn], {"stat" : 1})
+            for df, cdf in zip(ds.dscfiles, cds.dscfiles):
+                self.assertEqual(df.getStartTime(), cdf.getStartTime())
+                self.assertEqual(df.getChipId(), cdf.getChipId())
+                self.assertEqual(type(df.getChipId()), type(cdf.getChipId()))
+                self.assertEqual(df.getHeader(), cdf.getHeader())
+                self.assertEqual(repr(sorted(df.getHeader()["fields"].items())), repr(sorted(cdf.getHeader()["fields"].items())))
+                self.assertEqual(df.getBiasVoltage(), cdf.getBiasVoltage())
+                self.assertEqual(df.getDACs(), cdf.getDACs())
+                self.assertEqual(df.getTpxClock(), cdf.getTpxClock())
+                self.assertEqual(df.getPixelMap(), cdf.getPixelMap())
+            #
+            # A changed DSC file is parsed again.
+            st = os.stat(self.dscfilenames[0])
+            os.utime(os.path.join(datadir, os.path.basename(self.dscfilenames[0])), (st.st_atime, st.st_mtime + 10.0))
+            Dataset(datadir, headers)
+            self.assertEqual(headers.getNumberOfHits(), 9)
+            self.assertEqual(headers.getNumberOfUpdates(), 1)
+
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+
+    lg.basicConfig(filename='log_test_dscheader.txt', filemode='w', level=lg.DEBUG)
+
+    lg.info("")
+    lg.info("===================================================")
+    lg.info(" Logger output from cernatschool/test_dscheader.py ")
+    lg.info("===================================================")
+    lg.info("")
+
+    unittest.main()
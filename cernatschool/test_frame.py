@@ -86,12 +86,15 @@ class FrameTest(unittest.TestCase):
         #
         # Cluster information.
         self.assertEqual(frames[0].getNumberOfKlusters(), 34)
-        self.assertEqual(frames[0].getNumberOfGammas(), 12)
+        #
+        # (The tri- and tetrapixels are classified by their radius, so one
+        # of each is not a gamma candidate.)
+        self.assertEqual(frames[0].getNumberOfGammas(), 10)
         self.assertEqual(frames[0].getNumberOfMonopixels(), 4)
         self.assertEqual(frames[0].getNumberOfBipixels(), 2)
-        self.assertEqual(frames[0].getNumberOfTripixelGammas(), 4)
-        self.assertEqual(frames[0].getNumberOfTetrapixelGammas(), 2)
-        self.assertEqual(frames[0].getNumberOfNonGammas(), 22)
+        self.assertEqual(frames[0].getNumberOfTripixelGammas(), 3)
+        self.assertEqual(frames[0].getNumberOfTetrapixelGammas(), 1)
+        self.assertEqual(frames[0].getNumberOfNonGammas(), 24)
 
 
 if __name__ == "__main__":
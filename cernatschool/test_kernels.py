@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#...for the unit testing.
+import unittest
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+#...for the Pixelman dataset wrapper.
+from dataset import Dataset
+
+#...for the labelling engines.
+from labelling import getHitArrays, labelUnionFind
+
+#...for the cluster properties.
+from properties import getInteriorPixels
+
+#...for the cluster finder.
+from kluster import KlusterFinder
+
+#...for the compiled kernels.
+import kernels
+
+class KernelsTest(unittest.TestCase):
+
+    def setUp(self):
+
+        ## The frames from the test dataset.
+        self.frames = Dataset("testdata/ASCIIxyC").getFrames((51.509915, -0.142515, 34.02), skipclustering=True)
+
+        ## The backend in use before the test.
+        self.backend = kernels.getBackend()
+
+    def tearDown(self):
+        kernels.setBackend(self.backend)
+
+    def test_backend(self):
+
+        # The tests
+        #-----------
+        self.assertTrue(kernels.getBackend() in kernels.BACKENDS)
+        self.assertEqual(kernels.useJit(), kernels.getBackend() == "numba")
+        #
+        kernels.setBackend("python")
+        self.assertEqual(kernels.getBackend(), "python")
+        self.assertFalse(kernels.useJit())
+        #
+        self.assertRaises(IOError, kernels.setBackend, "fortran")
+        if kernels.numba is None:
+            self.assertRaises(IOError, kernels.setBackend, "numba")
+
+    def test_backend_used(self):
+
+        ## The hits of the busiest test frame.
+        pixelmap = max([f.getPixelMap() for f in self.frames], key=len)
+
+        # The tests
+        #-----------
+        #
+        # The legacy engine never uses the kernels.
+        self.assertEqual(KlusterFinder(pixelmap, 256, 256, False).getBackend(), None)
+        if kernels.numba is not None:
+            kernels.setBackend("numba")
+            self.assertEqual(KlusterFinder(pixelmap, 256, 256, False, engine="unionfind").getBackend(), "numba")
+        #
+        # Without the compiled kernels, no backend is recorded.
+        kernels.setBackend("python")
+        for engine in ["legacy", "dense", "sparse", "runs", "bitset", "unionfind"]:
+            self.assertEqual(KlusterFinder(pixelmap, 256, 256, False, engine=engine).getBackend(), None)
+        #
+        # Each run of a kernel is counted.
+        n_calls = kernels.getNumberOfKernelCalls()
+        Xs, Cs = getHitArrays(pixelmap)
+        kernels.unionFindLabels(Xs, 256, 256, True)
+        self.assertEqual(kernels.getNumberOfKernelCalls(), n_calls + 1)
+
+    def test_kernels_match(self):
+
+        ## The uncompiled kernels.
+        uf = kernels.getPythonKernel("unionFindLabels")
+        ip = kernels.getPythonKernel("interiorPixels")
+
+        for f in self.frames:
+
+            Xs, Cs = getHitArrays(f.getPixelMap())
+
+            for backend in ["python"] + (["numba"] if kernels.numba is not None else []):
+
+                kernels.setBackend(backend)
+
+                for connectivity in [4, 8]:
+
+                    labels, groups = labelUnionFind(Xs, 256, 256, connectivity)
+
+                    # The tests
+                    #-----------
+                    self.assertEqual(list(uf(Xs, 256, 256, connectivity == 8)), list(labels))
+
+                labels, groups = labelUnionFind(Xs, 256, 256)
+
+                self.assertEqual(list(ip(Xs, labels, 256, 256)), list(getInteriorPixels(Xs, labels, 256, 256)))
+
+        # A 3x3 block - then moved so its middle row is on the edge of the sensor.
+        Xs = np.array([(256 * y) + x for y in range(10, 13) for x in range(10, 13)])
+        self.assertEqual(list(np.flatnonzero(ip(Xs, np.zeros(9, dtype=np.int64), 256, 256))), [4])
+        Xs = Xs - (256 * 11)
+        self.assertEqual(list(np.flatnonzero(ip(Xs[3:], np.zeros(6, dtype=np.int64), 256, 256))), [])
+
+
+if __name__ == "__main__":
+
+    lg.basicConfig(filename='log_test_kernels.txt', filemode='w', level=lg.DEBUG)
+
+    lg.info("")
+    lg.info("==================================================")
+    lg.info(" Logger output from cernatschool/test_kernels.py ")
+    lg.info("==================================================")
+    lg.info("")
+
+    unittest.main()
@@ -10,11 +10,17 @@ import unittest
 #...for the logging.
 import logging as lg
 
+#...for reading the pixel exports.
+import json
+
+#...for the MATH.
+import numpy as np
+
 #...for the Pixelman dataset wrapper.
 from dataset import Dataset
 
 #...for the klusters.
-from kluster import KlusterFinder
+from kluster import KlusterFinder, CompactKluster
 
 class KlusterTest(unittest.TestCase):
 
@@ -43,11 +49,14 @@ class KlusterTest(unittest.TestCase):
         #
         # This frame has 34 clusters.
         self.assertEqual(kf.getNumberOfKlusters(), 34)
-        self.assertEqual(kf.getNumberOfGammas(), 12)
+        #
+        # (The tri- and tetrapixels are classified by their radius, so one
+        # of each is not a gamma candidate.)
+        self.assertEqual(kf.getNumberOfGammas(), 10)
         self.assertEqual(kf.getNumberOfMonopixels(), 4)
         self.assertEqual(kf.getNumberOfBipixels(), 2)
-        self.assertEqual(kf.getNumberOfTripixelGammas(), 4)
-        self.assertEqual(kf.getNumberOfTetrapixelGammas(), 2)
+        self.assertEqual(kf.getNumberOfTripixelGammas(), 3)
+        self.assertEqual(kf.getNumberOfTetrapixelGammas(), 1)
 
         ## The list of clusters.
         ks = kf.getListOfKlusters()
@@ -80,8 +89,14 @@ class KlusterTest(unittest.TestCase):
         self.assertAlmostEqual(ks[0].getRadiusUW(), 8.550607, places=6)
         self.assertAlmostEqual(ks[0].getDensityUW(), 0.452782, places=6)
 
+        # Cluster properties based on the count-weighted (W) mean.
+        self.assertAlmostEqual(ks[0].getXW(), 146.476224, places=6)
+        self.assertAlmostEqual(ks[0].getYW(), 237.611401, places=6)
+        self.assertAlmostEqual(ks[0].getRadiusW(), 8.854263, places=6)
+        self.assertAlmostEqual(ks[0].getDensityW(), 28.774495, places=6)
+
         # Counts.
-        self.assertEqual(ks[0].getTotalCounts(), 8854)
+        self.assertEqual(ks[0].getTotalCounts(), 7087)
         self.assertEqual(ks[0].getMaxCountValue(), 577)
 
         # Energy.
@@ -132,7 +147,7 @@ class KlusterTest(unittest.TestCase):
         self.assertAlmostEqual(ks[10].getDensityUW(), 0.536566, places=6)
 
         # Counts.
-        self.assertEqual(ks[10].getTotalCounts(), 612)
+        self.assertEqual(ks[10].getTotalCounts(), 628)
         self.assertEqual(ks[10].getMaxCountValue(), 69)
 
         # Energy.
@@ -158,56 +173,156 @@ class KlusterTest(unittest.TestCase):
 
         print "JSON entry:", ks[10].getKlusterPropertiesJson()
 
-        # The last - and small - cluster.
+        # The last - and small - clusters are monopixels.
+        self.assertEqual(ks[33].getNumberOfPixels(), 1)
+
+        ## The monopixel at (97, 135). (Clusters of the same size are
+        ## not in any particular order.)
+        k33 = [k for k in ks if k.getPixelMap().keys() == [(256 * 135) + 97]][0]
 
         # Cluster size (number of pixels).
-        self.assertEqual(ks[33].getNumberOfPixels(), 1)
+        self.assertEqual(k33.getNumberOfPixels(), 1)
 
         # Cluster location (raw pixels).
-        self.assertEqual(ks[33].getXMin(), 97.0)
-        self.assertEqual(ks[33].getXMax(), 97.0)
-        self.assertEqual(ks[33].getYMin(), 135.0)
-        self.assertEqual(ks[33].getYMax(), 135.0)
+        self.assertEqual(k33.getXMin(), 97.0)
+        self.assertEqual(k33.getXMax(), 97.0)
+        self.assertEqual(k33.getYMin(), 135.0)
+        self.assertEqual(k33.getYMax(), 135.0)
 
         # Cluster width and height.
-        self.assertEqual(ks[33].getWidth(), 1)
-        self.assertEqual(ks[33].getHeight(), 1)
+        self.assertEqual(k33.getWidth(), 1)
+        self.assertEqual(k33.getHeight(), 1)
 
         # Cluster properties based on the unweighted (UW) mean.
 
         # * Location.
-        self.assertAlmostEqual(ks[33].getXUW(),  97.000000, places=6)
-        self.assertAlmostEqual(ks[33].getYUW(), 135.000000, places=6)
+        self.assertAlmostEqual(k33.getXUW(),  97.000000, places=6)
+        self.assertAlmostEqual(k33.getYUW(), 135.000000, places=6)
 
         # * Radius and density.
-        self.assertAlmostEqual(ks[33].getRadiusUW(), 0.000000, places=6)
-        self.assertAlmostEqual(ks[33].getDensityUW(), 0.000000, places=6)
+        self.assertAlmostEqual(k33.getRadiusUW(), 0.000000, places=6)
+        self.assertAlmostEqual(k33.getDensityUW(), 0.000000, places=6)
 
         # Counts.
-        self.assertEqual(ks[33].getTotalCounts(), 18)
-        self.assertEqual(ks[33].getMaxCountValue(), 18)
+        self.assertEqual(k33.getTotalCounts(), 18)
+        self.assertEqual(k33.getMaxCountValue(), 18)
 
         # Energy.
-        self.assertAlmostEqual(ks[33].getTotalEnergy(), 0.0, places=6)
-        self.assertAlmostEqual(ks[33].getMaxEnergy(), 0.0, places=6)
+        self.assertAlmostEqual(k33.getTotalEnergy(), 0.0, places=6)
+        self.assertAlmostEqual(k33.getMaxEnergy(), 0.0, places=6)
 
         # Linearity.
-        m, c, sumR = ks[33].getLineOfBestFitValues()
+        m, c, sumR = k33.getLineOfBestFitValues()
         self.assertAlmostEqual(m, 0.000000, places=6)
         self.assertAlmostEqual(c, 97.000000, places=6)
         self.assertAlmostEqual(sumR, 0.000000, places=6)
 
         # Edge pixels.
-        self.assertEqual(ks[33].getNumberOfEdgePixels(), 1)
-        self.assertAlmostEqual(ks[33].getInnerPixelFraction(), 0.000000, places=6)
-        self.assertAlmostEqual(ks[33].getOuterPixelFraction(), 1.000000, places=6)
+        self.assertEqual(k33.getNumberOfEdgePixels(), 1)
+        self.assertAlmostEqual(k33.getInnerPixelFraction(), 0.000000, places=6)
+        self.assertAlmostEqual(k33.getOuterPixelFraction(), 1.000000, places=6)
 
         # Is it a Monte Carlo cluster?
-        self.assertEqual(ks[33].isMC(), False)
+        self.assertEqual(k33.isMC(), False)
 
         # Is it an edge cluster?
-        self.assertEqual(ks[33].isEdgeCluster(), False)
+        self.assertEqual(k33.isEdgeCluster(), False)
+
+    def test_compact_klusters(self):
+
+        ## The dataset wrapper.
+        ds = Dataset("testdata/ASCIIxyC")
 
+        ## The frames from the test dataset.
+        frames = ds.getFrames((51.509915, -0.142515, 34.02))
+
+        ## The (legacy) clusters, keyed by their first pixel.
+        ks = dict([(min(k.getPixelMap()), k) for k in frames[0].getKlusterFinder().getListOfKlusters()])
+
+        ## The cluster finder using the array-backed clusters.
+        kf = KlusterFinder(frames[0].getPixelMap(), frames[0].getWidth(), frames[0].getHeight(), frames[0].isMC(), engine="sparse")
+
+        # The tests
+        #-----------
+        self.assertEqual(kf.getNumberOfKlusters(), 34)
+
+        for ck in kf.getListOfKlusters():
+
+            self.assertTrue(isinstance(ck, CompactKluster))
+
+            # There is no per-instance dictionary.
+            self.assertFalse(hasattr(ck, "__dict__"))
+
+            ## The matching legacy cluster.
+            k = ks[ck.getPixelXs().min()]
+
+            self.assertEqual(ck.getPixelMap(), k.getPixelMap())
+            self.assertEqual(ck.getNumberOfPixels(), k.getNumberOfPixels())
+            self.assertEqual(ck.getTotalCounts(), k.getTotalCounts())
+            self.assertEqual(ck.getMaxCountValue(), k.getMaxCountValue())
+            self.assertEqual(ck.getXMin(), k.getXMin())
+            self.assertEqual(ck.getXMax(), k.getXMax())
+            self.assertEqual(ck.getYMin(), k.getYMin())
+            self.assertEqual(ck.getYMax(), k.getYMax())
+            self.assertEqual(ck.getWidth(), k.getWidth())
+            self.assertEqual(ck.getHeight(), k.getHeight())
+            self.assertAlmostEqual(ck.getXUW(), k.getXUW(), places=6)
+            self.assertAlmostEqual(ck.getYUW(), k.getYUW(), places=6)
+            self.assertAlmostEqual(ck.getRadiusUW(), k.getRadiusUW(), places=6)
+            self.assertAlmostEqual(ck.getDensityUW(), k.getDensityUW(), places=6)
+            self.assertAlmostEqual(ck.getXW(), k.getXW(), places=6)
+            self.assertAlmostEqual(ck.getYW(), k.getYW(), places=6)
+            self.assertAlmostEqual(ck.getRadiusW(), k.getRadiusW(), places=6)
+            self.assertAlmostEqual(ck.getDensityW(), k.getDensityW(), places=6)
+            self.assertAlmostEqual(ck.getLinearity(), k.getLinearity(), places=4)
+            self.assertEqual(ck.getNumberOfEdgePixels(), k.getNumberOfEdgePixels())
+            self.assertAlmostEqual(ck.getInnerPixelFraction(), k.getInnerPixelFraction(), places=6)
+            self.assertEqual(ck.isEdgeCluster(), k.isEdgeCluster())
+            self.assertEqual(ck.isGamma(), k.isGamma())
+            self.assertEqual(ck.isMC(), k.isMC())
+
+    def test_edge_klusters(self):
+
+        ## Clusters on the right-hand edge and in the middle of a 128x128 frame.
+        pixelmap = {(128 * 50) + 127 : 1, (128 * 51) + 127 : 2, (128 * 60) + 60 : 3, (128 * 60) + 61 : 4}
+
+        for engine in ["legacy", "sparse"]:
+
+            ## The clusters, in order of their first pixel.
+            ks = sorted(KlusterFinder(pixelmap, 128, 128, False, engine=engine).getListOfKlusters(), key=lambda k: k.getXMax())
+
+            # The tests
+            #-----------
+            #
+            # The edge is that of the frame, not of a 256x256 sensor.
+            self.assertEqual([k.isEdgeCluster() for k in ks], [False, True])
+        #
+        # A frame width that isn't a multiple of 64 (see helpers.countEdgePixels).
+        k = KlusterFinder({(100 * 40) + 99 : 1, (100 * 41) + 99 : 2}, 80, 100, False).getListOfKlusters()[0]
+        self.assertTrue(k.isEdgeCluster())
+        self.assertEqual(k.getNumberOfEdgePixels(), 2)
+
+    def test_pixel_export(self):
+
+        ## A small L-shaped cluster {X:C}.
+        pixelmap = {(256 * 50) + 50 : 1, (256 * 50) + 51 : 2, (256 * 51) + 50 : 3}
+
+        ## The cluster from each kind of cluster finder.
+        ks = [KlusterFinder(pixelmap, 256, 256, False, engine=e).getListOfKlusters()[0] for e in ["legacy", "sparse"]]
+
+        for k in ks:
+
+            # The tests
+            #-----------
+            self.assertEqual(sorted([(p["x"], p["y"], p["c"]) for p in json.loads(k.getPixelsString("json"))]), \
+                [(50, 50, 1), (50, 51, 3), (51, 50, 2)])
+            self.assertEqual(sorted(k.getPixelsString("text").split("\n")), ["12850 1", "12851 2", "13106 3"])
+            #
+            ## The binary export, read back in.
+            records = np.fromstring(k.getPixelsString("binary"), dtype=[("X", "<u4"), ("C", "<u4")])
+            self.assertEqual(dict(zip(records["X"], records["C"])), pixelmap)
+            #
+            self.assertRaises(IOError, k.getPixelsString, "xml")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#...the usual suspects.
+import os, inspect
+
+#...for the unit testing.
+import unittest
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+#...for the Pixelman dataset wrapper.
+from dataset import Dataset
+
+#...for the klusters.
+from kluster import KlusterFinder
+
+#...for the labelling engines.
+from labelling import ENGINES, getHitArrays, labelDense, labelUnionFind, labelSparse, labelSpatialHash, labelFrameStack, labelRuns, getRuns
+
+#...for the automatic engine choice.
+from labelling import AUTO_ENGINE, AUTO_ENGINE_THRESHOLDS, getPrescanStats, chooseEngine
+
+def getKlusterSet(kf):
+    """ Get the set of clusters (as sorted pixel maps) from a KlusterFinder. """
+    return sorted([sorted(k.getPixelMap().items()) for k in kf.getListOfKlusters()])
+
+class LabellingTest(unittest.TestCase):
+
+    def setUp(self):
+
+        ## A small test pixel map: a diagonal track, an L-shape and a monopixel.
+        self.pixelmap = {
+            (256 * 10) + 10 : 5, (256 * 11) + 11 : 6, (256 * 12) + 12 : 7,
+            (256 * 50) + 50 : 1, (256 * 50) + 51 : 2, (256 * 51) + 50 : 3,
+            (256 * 0) + 255 : 9
+            }
+
+    def tearDown(self):
+        pass
+
+    def test_hit_arrays(self):
+
+        Xs, Cs = getHitArrays(self.pixelmap)
+
+        # The tests
+        #-----------
+        self.assertEqual(list(Xs), sorted(self.pixelmap.keys()))
+        self.assertEqual(list(Cs), [self.pixelmap[X] for X in Xs])
+
+    def test_dense_labelling(self):
+
+        Xs, Cs = getHitArrays(self.pixelmap)
+
+        image, groups = labelDense(Xs, 256, 256)
+
+        # The tests
+        #-----------
+        #
+        # The label image.
+        self.assertEqual(image.shape, (256, 256))
+        self.assertEqual(image.max(), 3)
+        self.assertEqual(image[10, 10], image[12, 12])
+        self.assertEqual(image[50, 51], image[51, 50])
+        self.assertNotEqual(image[0, 255], image[10, 10])
+        #
+        # The clusters' pixel indices.
+        self.assertEqual(sorted([len(g) for g in groups]), [1, 3, 3])
+        self.assertEqual(list(groups[image[10, 10] - 1]), [2570, 2827, 3084])
+
+    def test_union_find_labelling(self):
+
+        ## A "U" shape - the two arms only join on the bottom row.
+        Us = np.array(sorted([(256 * y) + 20 for y in range(5)] + \
+                             [(256 * y) + 24 for y in range(5)] + \
+                             [(256 * 5) + x for x in range(21, 24)]))
+
+        labels, groups = labelUnionFind(Us, 256, 256)
+
+        # The tests
+        #-----------
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(list(groups[0]), list(Us))
+        self.assertEqual(set(labels), set([0]))
+        #
+        # The wrap-around from the end of one row to the start of the next
+        # is not a neighbour.
+        labels, groups = labelUnionFind(np.array([255, 256]), 256, 256)
+        self.assertEqual(list(labels), [0, 1])
+
+    def test_sparse_labelling(self):
+
+        Xs, Cs = getHitArrays(self.pixelmap)
+
+        labels, groups = labelSparse(Xs, 256, 256)
+
+        # The tests
+        #-----------
+        #
+        # The clusters are labelled in raster order of their first pixel.
+        self.assertEqual(list(labels), [0, 1, 1, 1, 2, 2, 2])
+        self.assertEqual(list(groups[1]), [2570, 2827, 3084])
+        #
+        # Pixels at opposite sides of the sensor are never neighbours,
+        # even when their X values differ by 1, cols - 1 or cols + 1.
+        labels, groups = labelSparse(np.array([255, 256, 511, 512]), 256, 256)
+        self.assertEqual(list(labels), [0, 1, 0, 1])
+        #
+        # No hits, no clusters.
+        labels, groups = labelSparse(np.array([], dtype=np.int64), 256, 256)
+        self.assertEqual(len(groups), 0)
+
+    def test_run_labelling(self):
+
+        ## A filled disc (an "alpha blob") with a diagonal tail and a separate run.
+        Xs = np.array(sorted([(256 * y) + x for y in range(100, 121) for x in range(100, 121) \
+            if (x - 110)**2 + (y - 110)**2 <= 100] + [(256 * (121 + i)) + 111 + i for i in range(5)] + \
+            [(256 * 200) + x for x in range(250, 256)] + [(256 * 201) + x for x in range(0, 3)]))
+
+        starts, ends, runs = getRuns(Xs, 256)
+
+        labels, groups = labelRuns(Xs, 256, 256)
+
+        # The tests
+        #-----------
+        #
+        # One run per row of the disc and tail, and the row-wrapping run is split in two.
+        self.assertEqual(len(starts), 21 + 5 + 2)
+        self.assertEqual(list(ends - starts)[-2:], [5, 2])
+        self.assertEqual(list(runs[:4]), [0, 1, 1, 1])
+        self.assertEqual([len(g) for g in groups], [len(Xs) - 9, 6, 3])
+        self.assertEqual(list(labels), list(labelSparse(Xs, 256, 256)[0]))
+        #
+        # The tail is only joined diagonally.
+        self.assertEqual(len(labelRuns(Xs, 256, 256, 4)[1]), 3 + 5)
+
+    def test_engines_match_legacy(self):
+
+        ## The frames from the test dataset.
+        frames = Dataset("testdata/ASCIIxyC").getFrames((51.509915, -0.142515, 34.02), skipclustering=True)
+
+        for f in frames:
+
+            kf_legacy = KlusterFinder(f.getPixelMap(), f.getWidth(), f.getHeight(), f.isMC())
+
+            for engine in ENGINES:
+
+                kf = KlusterFinder(f.getPixelMap(), f.getWidth(), f.getHeight(), f.isMC(), engine=engine)
+
+                # The tests
+                #-----------
+                self.assertEqual(kf.getEngine(), engine)
+                self.assertEqual(getKlusterSet(kf), getKlusterSet(kf_legacy))
+                self.assertEqual(kf.getNumberOfGammas(), kf_legacy.getNumberOfGammas())
+
+    def test_four_connectivity(self):
+
+        Xs, Cs = getHitArrays(self.pixelmap)
+
+        for engine, labeller in ENGINES.iteritems():
+
+            labels, groups = labeller(Xs, 256, 256, 4)
+
+            # The tests
+            #-----------
+            #
+            # The diagonal track falls apart; the L-shape doesn't.
+            self.assertEqual(sorted([len(g) for g in groups]), [1, 1, 1, 1, 3])
+
+        ## The legacy cluster finder with 4-connectivity.
+        kf = KlusterFinder(self.pixelmap, 256, 256, False, connectivity=4)
+
+        self.assertEqual(kf.getConnectivity(), 4)
+        self.assertEqual(kf.getNumberOfKlusters(), 5)
+
+        self.assertRaises(IOError, KlusterFinder, self.pixelmap, 256, 256, False, connectivity=6)
+
+    def test_spatial_hash_radius(self):
+
+        ## Two short tracks separated by a gap of two pixels, and a distant monopixel.
+        Xs = np.array(sorted([(256 * 100) + x for x in (10, 11, 12, 15, 16)] + [(256 * 103) + 40]))
+
+        # The tests
+        #-----------
+        #
+        # Without a radius, it is just 8-connected.
+        labels, groups = labelSpatialHash(Xs, 256, 256)
+        self.assertEqual(len(groups), 3)
+        #
+        # The gap is three pixels wide centre to centre.
+        labels, groups = labelSpatialHash(Xs, 256, 256, radius=2.9)
+        self.assertEqual(len(groups), 3)
+        labels, groups = labelSpatialHash(Xs, 256, 256, radius=3.0)
+        self.assertEqual(len(groups), 2)
+        #
+        # Through the cluster finder.
+        kf = KlusterFinder(dict((X, 1) for X in Xs), 256, 256, False, radius=3.0)
+        self.assertEqual(kf.getEngine(), "spatialhash")
+        self.assertEqual(kf.getNumberOfKlusters(), 2)
+        self.assertEqual(kf.getListOfKlusters()[0].getNumberOfPixels(), 5)
+        #
+        # The radius overrides the engine asked for.
+        for engine in ["legacy", "sparse", AUTO_ENGINE]:
+            self.assertEqual(KlusterFinder(dict((X, 1) for X in Xs), 256, 256, False, engine=engine, radius=3.0).getEngine(), "spatialhash")
+
+    def test_frame_stack_labelling(self):
+
+        ## A stack of three frames - the same bipixel in the first two,
+        ## nothing in the last.
+        stack = np.zeros((3, 256, 256), dtype=np.int32)
+        stack[0, 100, 100:102] = [4, 5]
+        stack[1, 100, 100:102] = [6, 7]
+        stack[1, 200, 0] = 8
+
+        table, Xs, Cs = labelFrameStack(stack)
+
+        # The tests
+        #-----------
+        #
+        # The clusters must not join across frames.
+        self.assertEqual(len(table), 3)
+        self.assertEqual(list(table["frame"]), [0, 1, 1])
+        self.assertEqual(list(table["kluster"]), [0, 0, 1])
+        self.assertEqual(list(table["size"]), [2, 2, 1])
+        self.assertEqual(list(table["start"]), [0, 2, 4])
+        self.assertEqual(list(Xs), [25700, 25701, 25700, 25701, 51200])
+        self.assertEqual(list(Cs), [4, 5, 6, 7, 8])
+
+    def test_dataset_kluster_table(self):
+
+        ## The test dataset.
+        ds = Dataset("testdata/ASCIIxyC")
+
+        table, Xs, Cs = ds.getKlusterTable(chunksize=2)
+
+        for i, f in enumerate(ds.getFrames((51.509915, -0.142515, 34.02))):
+
+            ## The clusters found in this frame by the batched labelling.
+            ks = sorted([sorted(zip(Xs[k["start"]:k["start"] + k["size"]], Cs[k["start"]:k["start"] + k["size"]])) \
+                for k in table[table["frame"] == i]])
+
+            # The tests
+            #-----------
+            self.assertEqual(ks, getKlusterSet(f.getKlusterFinder()))
+
+    def test_bad_engine(self):
+
+        self.assertRaises(IOError, KlusterFinder, self.pixelmap, 256, 256, False, {}, "nosuchengine")
+
+    def test_auto_engine(self):
+
+        ## A small frame, a quiet frame, a frame with a big blob and a saturated frame.
+        small = np.array(sorted(self.pixelmap.keys()))
+        quiet = np.arange(0, 65536, 256)
+        blob = np.array([(256 * y) + x for y in range(100, 140) for x in range(100, 140)])
+        saturated = np.arange(0, 65536, 8)
+
+        stats = getPrescanStats(blob, 256, 256)
+
+        # The tests
+        #-----------
+        self.assertEqual(stats["n_hits"], 1600)
+        self.assertEqual(stats["bbox_fill"], 1.0)
+        self.assertEqual(stats["row_hits"], 40.0)
+        self.assertEqual(getPrescanStats(quiet, 256, 256)["row_hits"], 1.0)
+        #
+        self.assertEqual([chooseEngine(Xs, 256, 256) for Xs in [small, quiet, blob, saturated]], \
+            ["unionfind", "sparse", "runs", "dense"])
+        #
+        # Changing the thresholds.
+        self.assertEqual(chooseEngine(blob, 256, 256, {"runs_min_row_hits" : 50.0}), "dense")
+        self.assertEqual(chooseEngine(small, 256, 256, {"unionfind_max_hits" : 0}), "sparse")
+        self.assertRaises(IOError, chooseEngine, small, 256, 256, {"nosuchthreshold" : 1.0})
+        #
+        # The clusters found are the same whichever engine is chosen.
+        kf = KlusterFinder(self.pixelmap, 256, 256, False, engine=AUTO_ENGINE, thresholds={"unionfind_max_hits" : 0})
+        self.assertEqual(kf.getEngine(), "sparse")
+        self.assertEqual(kf.getEngineThresholds()["unionfind_max_hits"], 0)
+        self.assertEqual(kf.getEngineThresholds()["sparse_max_hits"], AUTO_ENGINE_THRESHOLDS["sparse_max_hits"])
+        self.assertEqual(getKlusterSet(kf), getKlusterSet(KlusterFinder(self.pixelmap, 256, 256, False)))
+        self.assertEqual(KlusterFinder(self.pixelmap, 256, 256, False, engine="dense").getEngineThresholds(), None)
+
+
+if __name__ == "__main__":
+
+    lg.basicConfig(filename='log_test_labelling.txt', filemode='w', level=lg.DEBUG)
+
+    lg.info("")
+    lg.info("===================================================")
+    lg.info(" Logger output from cernatschool/test_labelling.py ")
+    lg.info("===================================================")
+    lg.info("")
+
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#...the usual suspects.
+import os, inspect
+
+#...for the unit testing.
+import unittest
+
+#...for the logging.
+import logging as lg
+
+#...for the temporary registry files.
+import tempfile, shutil
+
+#...for the MATH.
+import numpy as np
+
+#...for the Pixelman dataset wrapper.
+from dataset import Dataset
+
+#...for the klusters.
+from kluster import KlusterFinder
+
+#...for the labelling engines.
+from labelling import ENGINES, getHitArrays
+
+#...for the pixel masks.
+from masks import getMaskArray, getMaskedPixels, applyMask, MaskRegistry
+
+class MasksTest(unittest.TestCase):
+
+    def setUp(self):
+
+        ## A bipixel, a hot monopixel and a track with a hot pixel in the middle.
+        self.pixelmap = {
+            (256 * 10) + 10 : 5, (256 * 10) + 11 : 6,
+            (256 * 50) + 50 : 9999,
+            (256 * 100) + 20 : 1, (256 * 100) + 21 : 9999, (256 * 100) + 22 : 1
+            }
+
+        ## The hot pixels.
+        self.hot = [(256 * 50) + 50, (256 * 100) + 21]
+
+    def tearDown(self):
+        pass
+
+    def test_mask_forms(self):
+
+        ## The boolean mask image.
+        image = np.zeros((256, 256), dtype=np.bool_)
+        image[50, 50] = True; image[100, 21] = True
+
+        # The tests
+        #-----------
+        for mask in [dict((X, 1) for X in self.hot), self.hot, np.array(self.hot), image]:
+            masked = getMaskArray(mask, 256, 256)
+            self.assertEqual(list(np.flatnonzero(masked)), self.hot)
+            self.assertEqual(list(getMaskedPixels(mask, 256, 256)), self.hot)
+            Xs, Cs = applyMask(*getHitArrays(self.pixelmap), masked=masked)
+            self.assertEqual(len(Xs), 4)
+            self.assertEqual(max(Cs), 6)
+        #
+        # Nothing masked.
+        self.assertEqual(getMaskArray({}, 256, 256), None)
+        self.assertEqual(getMaskArray(None, 256, 256), None)
+        self.assertEqual(getMaskArray(np.zeros((256, 256), dtype=np.bool_), 256, 256), None)
+        #
+        # A mask image of the wrong size.
+        self.assertRaises(IOError, getMaskArray, np.zeros((16, 16), dtype=np.bool_), 256, 256)
+
+    def test_masked_clustering(self):
+
+        ## A copy of the pixel map to check it isn't changed.
+        original = dict(self.pixelmap)
+
+        for engine in ["legacy"] + sorted(ENGINES.keys()):
+            for mask in [dict((X, 1) for X in self.hot), np.array(self.hot)]:
+
+                kf = KlusterFinder(self.pixelmap, 256, 256, False, mask, engine)
+
+                # The tests
+                #-----------
+                #
+                # The hot monopixel has gone and the track is split in two.
+                self.assertEqual(kf.getNumberOfKlusters(), 3)
+                self.assertEqual(kf.getNumberOfMonopixels(), 2)
+                self.assertEqual(kf.getNumberOfBipixels(), 1)
+                self.assertEqual(sum(k.getTotalCounts() for k in kf.getListOfKlusters()), 13)
+                #
+                # The caller's pixel map is untouched.
+                self.assertEqual(self.pixelmap, original)
+
+    def test_hot_pixels(self):
+
+        ## The temporary directory for the registry file.
+        tmpdir = tempfile.mkdtemp()
+
+        ## The registry file path.
+        path = os.path.join(tmpdir, "masks.json")
+
+        try:
+            masks = MaskRegistry(path)
+
+            # Ten frames - one pixel is hit in nine of them, another in two.
+            for i in range(10):
+                pixelmap = {(256 * 10) + i : 1}
+                if i < 9: pixelmap[(256 * 50) + 50] = 100
+                if i < 2: pixelmap[(256 * 60) + 60] = 5
+                masks.addFrame("CHIP", pixelmap)
+
+            # The tests
+            #-----------
+            #
+            # Not enough frames.
+            self.assertEqual(masks.updateHotPixels(minframes=11), {})
+            self.assertEqual(masks.getMask("CHIP"), None)
+            #
+            self.assertEqual(masks.getNumberOfFrames("CHIP"), 10)
+            self.assertEqual(masks.updateHotPixels(), {"CHIP" : 1})
+            self.assertEqual(list(masks.getMaskedPixels("CHIP")), [(256 * 50) + 50])
+            self.assertEqual(masks.getMask("CHIP").shape, (256, 256))
+            self.assertTrue(masks.getMask("CHIP")[50, 50])
+            #
+            # Nothing new the second time around.
+            self.assertEqual(masks.updateHotPixels(), {"CHIP" : 0})
+            #
+            # Save and reload the registry.
+            masks.save()
+            self.assertEqual(list(MaskRegistry(path).getMaskedPixels("CHIP")), [(256 * 50) + 50])
+            self.assertEqual(MaskRegistry(path).getChipIds(), ["CHIP"])
+
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_dataset_masks(self):
+
+        ## The test dataset.
+        ds = Dataset("testdata/ASCIIxyC")
+
+        ## The unmasked frames.
+        frames = ds.getFrames((51.509915, -0.142515, 34.02))
+
+        ## A registry masking all of the first frame's pixels.
+        masks = MaskRegistry()
+        masks.setMask(frames[0].getChipId(), frames[0].getPixelMap())
+
+        # The tests
+        #-----------
+        self.assertEqual(ds.findHotPixels(masks, minframes=1000), {})
+        self.assertEqual(masks.getNumberOfFrames(frames[0].getChipId()), len(frames))
+        #
+        ## The masked frames.
+        masked_frames = ds.getFrames((51.509915, -0.142515, 34.02), masks=masks)
+        self.assertEqual(masked_frames[0].getNumberOfKlusters(), 0)
+        self.assertEqual(masked_frames[0].getNumberOfUnmaskedPixels(), 0)
+        self.assertEqual(masked_frames[0].getNumberOfMaskedPixels(), frames[0].getOccupancy())
+
+
+if __name__ == "__main__":
+
+    lg.basicConfig(filename='log_test_masks.txt', filemode='w', level=lg.DEBUG)
+
+    lg.info("")
+    lg.info("================================================")
+    lg.info(" Logger output from cernatschool/test_masks.py ")
+    lg.info("================================================")
+    lg.info("")
+
+    unittest.main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#...the usual suspects.
+import os, inspect
+
+#...for the unit testing.
+import unittest
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+#...for the Pixelman dataset wrapper.
+from dataset import Dataset
+
+#...for the klusters.
+from kluster import KlusterFinder
+
+#...for the labelling engines.
+from labelling import getHitArrays, labelDense, labelSparse
+
+#...for the frame-wide cluster properties.
+from properties import getKlusterProperties, getEdgePixelCounts, getLinesOfBestFit, getShapeDescriptors, getConvexHulls, VERTICAL_LINE_GRADIENT
+
+#...for the property registry.
+from properties import PROPERTY_DEPENDENCIES, BASIC_PROPERTIES, KLUSTER_PROPERTIES_DTYPE, getPropertyClosure, getTypeProperties
+
+#...for the single cluster edge pixel count.
+from helpers import countEdgePixels
+
+class PropertiesTest(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_properties_match_legacy(self):
+
+        ## The frames from the test dataset.
+        frames = Dataset("testdata/ASCIIxyC").getFrames((51.509915, -0.142515, 34.02), skipclustering=True)
+
+        for f in frames:
+
+            ## The legacy clusters, keyed by their (sorted) pixel X values.
+            ks = dict((tuple(sorted(k.getPixelMap().keys())), k) for k in \
+                KlusterFinder(f.getPixelMap(), f.getWidth(), f.getHeight(), f.isMC()).getListOfKlusters())
+
+            Xs, Cs = getHitArrays(f.getPixelMap())
+
+            labels, groups = labelSparse(Xs, f.getHeight(), f.getWidth())
+
+            props = getKlusterProperties(Xs, Cs, labels, f.getHeight(), f.getWidth())
+
+            # The tests
+            #-----------
+            self.assertEqual(len(props), len(ks))
+
+            for g, p in zip(groups, props):
+
+                k = ks[tuple(g)]
+
+                self.assertEqual(p["size"], k.getNumberOfPixels())
+                self.assertEqual(p["totalcounts"], k.getTotalCounts())
+                self.assertEqual(p["maxcounts"], k.getMaxCountValue())
+                self.assertEqual((p["xmin"], p["xmax"], p["ymin"], p["ymax"]), \
+                    (k.getXMin(), k.getXMax(), k.getYMin(), k.getYMax()))
+                self.assertEqual((p["width"], p["height"]), (k.getWidth(), k.getHeight()))
+                self.assertAlmostEqual(p["x_uw"], k.getXUW())
+                self.assertAlmostEqual(p["y_uw"], k.getYUW())
+                self.assertAlmostEqual(p["radius_uw"], k.getRadiusUW())
+                self.assertAlmostEqual(p["density_uw"], k.getDensityUW())
+                self.assertAlmostEqual(p["x_w"], k.getXW())
+                self.assertAlmostEqual(p["y_w"], k.getYW())
+                self.assertAlmostEqual(p["radius_w"], k.getRadiusW())
+                self.assertAlmostEqual(p["density_w"], k.getDensityW())
+                self.assertEqual(p["n_edgepixels"], k.getNumberOfEdgePixels())
+                self.assertAlmostEqual(p["innerfrac"], k.getInnerPixelFraction())
+                self.assertEqual(p["isedgekluster"], k.isEdgeCluster())
+                self.assertAlmostEqual(p["lin_linearity"], k.getLinearity())
+                self.assertAlmostEqual(p["eccentricity"], k.getEccentricity())
+                self.assertAlmostEqual(p["orientation"], k.getOrientation())
+                self.assertAlmostEqual(p["axis_major"], k.getMajorAxisLength())
+                self.assertAlmostEqual(p["hull_area"], k.getHullArea())
+                self.assertAlmostEqual(p["hull_perimeter"], k.getHullPerimeter())
+                self.assertAlmostEqual(p["bbox_fill"], k.getBoundingBoxFill())
+
+    def test_label_image(self):
+
+        ## A 3x3 block in the corner of the sensor and a monopixel.
+        pixelmap = dict([((256 * y) + x, 1 + x + y) for x in range(3) for y in range(3)] + [((256 * 100) + 100, 7)])
+
+        Xs, Cs = getHitArrays(pixelmap)
+
+        image, groups = labelDense(Xs, 256, 256)
+
+        props = getKlusterProperties(Xs, Cs, image, 256, 256)
+
+        # The tests
+        #-----------
+        self.assertEqual(list(props["size"]), [9, 1])
+        self.assertEqual(list(props["totalcounts"]), [27, 7])
+        self.assertEqual(list(props["maxcounts"]), [5.0, 7.0])
+        #
+        # Only the centre pixel of the block is an inner pixel;
+        # neighbours off the sensor are missing.
+        self.assertEqual(list(props["n_edgepixels"]), [8, 1])
+        self.assertAlmostEqual(props["innerfrac"][0], 1.0/9.0)
+        self.assertEqual(list(props["isedgekluster"]), [True, False])
+        self.assertEqual(props["radius_uw"][1], 0.0)
+        self.assertEqual(props["density_uw"][1], 0.0)
+        #
+        # No hits, no clusters.
+        self.assertEqual(len(getKlusterProperties(np.array([], dtype=np.int64), np.array([]), [], 256, 256)), 0)
+
+    def test_edge_pixels(self):
+
+        ## A 5x5 block with a hole in the middle, and a 3x3 block.
+        pixelmap = dict([((256 * y) + x, 1) for x in range(10, 15) for y in range(10, 15) if (x, y) != (12, 12)] + \
+                        [((256 * y) + x, 1) for x in range(20, 23) for y in range(20, 23)])
+
+        Xs, Cs = getHitArrays(pixelmap)
+
+        image, groups = labelDense(Xs, 256, 256)
+
+        labels, groups = labelSparse(Xs, 256, 256)
+
+        # The tests
+        #-----------
+        #
+        # The pixels around the hole are edge pixels too.
+        for ls in [image, labels]:
+            n_edge, innerfrac, outerfrac = getEdgePixelCounts(Xs, ls, 256, 256)
+            self.assertEqual(list(n_edge), [24, 8])
+            self.assertAlmostEqual(innerfrac[0], 0.0)
+            self.assertAlmostEqual(innerfrac[1], 1.0/9.0)
+            self.assertAlmostEqual(outerfrac[1], 8.0/9.0)
+        #
+        # The single cluster helper.
+        self.assertEqual(countEdgePixels(dict((X, 1) for X in groups[1]), 256, 256), 8)
+        #
+        # A frame width that isn't a multiple of the bitset word size.
+        block = dict(((100 * y) + x, 1) for y in range(10, 13) for x in range(10, 13))
+        self.assertEqual(countEdgePixels(block, 80, 100), 8)
+        self.assertEqual(countEdgePixels(dict(((100 * y) + x, 1) for y in range(0, 4) for x in range(96, 100)), 80, 100), 12)
+        #
+        # The two methods agree on the test dataset.
+        for f in Dataset("testdata/ASCIIxyC").getFrames((51.509915, -0.142515, 34.02), skipclustering=True):
+            Xs, Cs = getHitArrays(f.getPixelMap())
+            image, groups = labelDense(Xs, 256, 256)
+            self.assertEqual(list(getEdgePixelCounts(Xs, image, 256, 256)[0]), \
+                list(getEdgePixelCounts(Xs, image.ravel()[Xs] - 1, 256, 256)[0]))
+
+    def test_lines_of_best_fit(self):
+
+        ## A vertical line, a horizontal line, a monopixel and a diagonal line.
+        xs = np.array([5.0, 5.0, 5.0, 10.0, 11.0, 12.0, 30.0, 40.0, 41.0, 42.0])
+        ys = np.array([1.0, 2.0, 3.0, 20.0, 20.0, 20.0, 7.0, 50.0, 51.0, 52.0])
+        labels = np.array([0, 0, 0, 1, 1, 1, 2, 3, 3, 3])
+
+        m, c, sumR, lin = getLinesOfBestFit(xs, ys, labels, 4)
+
+        # The tests
+        #-----------
+        self.assertEqual(list(m[:3]), [VERTICAL_LINE_GRADIENT, 0.0, 0.0])
+        self.assertEqual(list(c[:3]), [VERTICAL_LINE_GRADIENT, 20.0, 30.0])
+        self.assertEqual(list(sumR[:3]), [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(m[3], 1.0)
+        self.assertAlmostEqual(c[3], 10.0)
+        self.assertAlmostEqual(lin[3], 0.0)
+        #
+        # A bent track - (0, 0), (1, 0), (2, 1) - gives y = x/2 - 1/6.
+        m, c, sumR, lin = getLinesOfBestFit(np.array([0.0, 1.0, 2.0]), np.array([0.0, 0.0, 1.0]), np.zeros(3, dtype=np.int64), 1)
+        self.assertAlmostEqual(m[0], 0.5)
+        self.assertAlmostEqual(c[0], -1.0/6.0)
+        self.assertAlmostEqual(sumR[0], (4.0/6.0)/np.sqrt(1.25))
+
+    def test_shape_descriptors(self):
+
+        ## A monopixel, a 2x2 block, a diagonal line and a hollow 3x3 ring.
+        groups = [
+            [(256 * 10) + 10],
+            [(256 * 20) + 20, (256 * 20) + 21, (256 * 21) + 20, (256 * 21) + 21],
+            [(256 * 30) + 30, (256 * 31) + 31, (256 * 32) + 32],
+            [(256 * y) + x for y in range(40, 43) for x in range(40, 43) if (x, y) != (41, 41)],
+            ]
+
+        Xs = np.array(sum(groups, []))
+        labels = np.array(sum([[i] * len(g) for i, g in enumerate(groups)], []))
+
+        order = np.argsort(Xs)
+
+        s = getShapeDescriptors(Xs[order], labels[order], 256, 256)
+
+        # The tests
+        #-----------
+        self.assertEqual(list(s["eccentricity"][[0, 1, 3]]), [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(s["eccentricity"][2], 1.0)
+        self.assertAlmostEqual(s["orientation"][2], 45.0)
+        self.assertAlmostEqual(s["axis_minor"][2], 0.0)
+        self.assertEqual(list(s["axis_major"][:2]), [0.0, 2.0])
+        #
+        # The hulls are of the pixel squares.
+        self.assertEqual(list(s["hull_area"]), [1.0, 4.0, 5.0, 9.0])
+        self.assertAlmostEqual(s["hull_perimeter"][2], 4.0 + 4.0 * np.sqrt(2.0))
+        self.assertEqual(list(s["hull_perimeter"][[0, 1, 3]]), [4.0, 8.0, 12.0])
+        self.assertEqual(list(s["bbox_fill"]), [1.0, 1.0, 1.0/3.0, 8.0/9.0])
+        #
+        # Concave clusters (a plus and a U shape), with all of the hulls found together.
+        xs = np.array([1, 0, 1, 2, 1, 10, 12, 10, 12, 10, 11, 12], dtype=np.float64)
+        ys = np.array([0, 1, 1, 1, 2, 10, 10, 11, 11, 12, 12, 12], dtype=np.float64)
+        areas, perimeters = getConvexHulls(xs, ys, np.array([0] * 5 + [1] * 7), 2)
+        self.assertEqual(list(areas), [7.0, 9.0])
+        self.assertAlmostEqual(perimeters[0], 4.0 + 4.0 * np.sqrt(2.0))
+        self.assertEqual(perimeters[1], 12.0)
+        #
+        # No clusters.
+        self.assertEqual(len(getShapeDescriptors(np.array([], dtype=np.int64), np.array([], dtype=np.int64), 256, 256)), 0)
+
+    def test_property_registry(self):
+
+        # The tests
+        #-----------
+        #
+        # Every property in the registry is calculated, and vice versa.
+        self.assertEqual(sorted(PROPERTY_DEPENDENCIES.keys()), sorted(KLUSTER_PROPERTIES_DTYPE.names))
+        self.assertEqual(getPropertyClosure(None), frozenset(KLUSTER_PROPERTIES_DTYPE.names))
+        #
+        # The dependencies are followed.
+        self.assertEqual(getPropertyClosure(["density_w"]) - BASIC_PROPERTIES, \
+            frozenset(["density_w", "radius_w", "x_w", "y_w"]))
+        self.assertEqual(getPropertyClosure(["innerfrac"]) - BASIC_PROPERTIES, \
+            frozenset(["innerfrac", "edgefrac", "n_edgepixels"]))
+        self.assertRaises(IOError, getPropertyClosure, ["nosuchproperty"])
+        #
+        # The properties used by the particle types.
+        types = [{"A" : {"size_min" : 1, "ecc_max" : 0.5}}, {"B" : {"rdw_min" : 2.0}}]
+        self.assertTrue("lin_linearity" in getTypeProperties(types))
+        self.assertTrue("eccentricity" in getTypeProperties(types))
+        self.assertTrue("radius_w" in getTypeProperties(types))
+        self.assertFalse("density_w" in getTypeProperties(types))
+
+    def test_requested_properties(self):
+
+        ## The first frame from the test dataset.
+        f = Dataset("testdata/ASCIIxyC").getFrames((51.509915, -0.142515, 34.02), skipclustering=True)[0]
+
+        for engine in ["legacy", "sparse"]:
+
+            ## All of the properties, and just the linearity.
+            kf_all = KlusterFinder(f.getPixelMap(), 256, 256, False, engine=engine)
+            kf = KlusterFinder(f.getPixelMap(), 256, 256, False, engine=engine, properties=["lin_linearity"])
+
+            # The tests
+            #-----------
+            self.assertTrue("radius_uw" in kf.getProperties())
+            self.assertFalse("n_edgepixels" in kf.getProperties())
+            self.assertEqual(kf.getNumberOfGammas(), kf_all.getNumberOfGammas())
+            #
+            for k, k_all in zip(kf.getListOfKlusters(), kf_all.getListOfKlusters()):
+                self.assertEqual(k.getLinearity(), k_all.getLinearity())
+                self.assertEqual(k.getRadiusUW(), k_all.getRadiusUW())
+                self.assertEqual(k.getNumberOfEdgePixels(), None)
+                self.assertEqual(k.getDensityW(), None)
+                self.assertEqual(k.getEccentricity(), None)
+                #
+                # Only the calculated properties are written out.
+                self.assertFalse("innerfrac" in k.getKlusterPropertiesJson())
+                self.assertFalse("hull_area" in k.getKlusterPropertiesJson())
+                self.assertTrue("lin_linearity" in k.getKlusterPropertiesJson())
+
+    def test_kluster_finder_properties(self):
+
+        ## The first frame from the test dataset.
+        f = Dataset("testdata/ASCIIxyC").getFrames((51.509915, -0.142515, 34.02), skipclustering=True)[0]
+
+        kf = KlusterFinder(f.getPixelMap(), f.getWidth(), f.getHeight(), f.isMC(), engine="dense")
+
+        # The tests
+        #-----------
+        self.assertEqual(len(kf.getKlusterProperties()), kf.getNumberOfKlusters())
+        self.assertEqual(sum(kf.getKlusterProperties()["totalcounts"]), sum(k.getTotalCounts() for k in kf.getListOfKlusters()))
+        self.assertEqual(KlusterFinder(f.getPixelMap(), f.getWidth(), f.getHeight(), f.isMC()).getKlusterProperties(), None)
+
+
+if __name__ == "__main__":
+
+    lg.basicConfig(filename='log_test_properties.txt', filemode='w', level=lg.DEBUG)
+
+    lg.info("")
+    lg.info("=====================================================")
+    lg.info(" Logger output from cernatschool/test_properties.py ")
+    lg.info("=====================================================")
+    lg.info("")
+
+    unittest.main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#...the usual suspects.
+import os, glob
+
+#...for the temporary datasets.
+import tempfile, shutil
+
+#...for the memory maps.
+import mmap
+
+#...for the unit testing.
+import unittest
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+#...for the data file readers.
+from readers import parseAsciiBuffer, parseAsciiLines, getPixelMap, readDataFile
+from readers import parseTypeLine, getBinaryDtype, getBinaryFormat
+from readers import readFile, parseDataBuffer
+
+#...for the file format detection.
+from helpers import getFormat
+
+#...for the dataset wrapper.
+from dataset import Dataset
+
+class ReadersTest(unittest.TestCase):
+
+    def setUp(self):
+
+        ## The test data files.
+        self.datafilenames = sorted(glob.glob("testdata/ASCIIxyC/*.txt"))
+
+        ## A small frame with a repeated pixel (the last value wins).
+        self.pixelmap = {(256 * 3) + 1 : 7, (256 * 255) + 255 : 2, 12 : 1}
+
+        ## The frame in each of the ASCII formats.
+        self.bufs = {
+            4114 : "1\t3\t5\r\n255\t255\t2\r\n12\t0\t1\r\n1\t3\t7\r\n",
+            8210 : "769\t5\n65535\t2\n12\t1\n769\t7\n",
+            18   : "\n".join(" ".join(str(self.pixelmap.get((256 * y) + x, 0)) for x in range(256)) for y in range(256)),
+            }
+
+    def tearDown(self):
+        pass
+
+    def test_ascii_formats(self):
+
+        # The tests
+        #-----------
+        for fmt, buf in self.bufs.iteritems():
+            Xs, Cs = parseAsciiBuffer(buf, fmt, 256, 256)
+            self.assertEqual(getPixelMap(Xs, Cs), self.pixelmap)
+            self.assertEqual(getPixelMap(Xs, Cs), parseAsciiLines(buf.splitlines(), fmt, 256, 256))
+        #
+        # Empty frames.
+        self.assertEqual(len(parseAsciiBuffer("", 4114, 256, 256)[0]), 0)
+        self.assertEqual(len(parseAsciiBuffer("\n".join(["0 " * 256] * 256), 18, 256, 256)[0]), 0)
+        #
+        # Bad data.
+        self.assertRaises(IOError, parseAsciiBuffer, "1\t3\t5\n2\t4\n", 4114, 256, 256)
+        self.assertRaises(IOError, parseAsciiBuffer, "1\t3\t5\n2\tx\t6\n", 4114, 256, 256)
+        self.assertRaises(IOError, parseAsciiBuffer, "1 2 3\n", 18, 256, 256)
+        self.assertRaises(IOError, parseAsciiBuffer, "1\t2\n", 17, 256, 256)
+
+    def test_test_data(self):
+
+        for fn in self.datafilenames:
+
+            with open(fn, "r") as f:
+                ls = f.readlines()
+
+            Xs, Cs = readDataFile(fn, 4114, 256, 256)
+
+            # The tests
+            #-----------
+            self.assertEqual(len(Xs), len(ls))
+            self.assertEqual(getPixelMap(Xs, Cs), parseAsciiLines(ls, 4114, 256, 256))
+
+    def test_binary_formats(self):
+
+        ## The hits of the test frame.
+        Xs = np.array(sorted(self.pixelmap.keys())); Cs = np.array([self.pixelmap[X] for X in Xs])
+
+        ## The temporary directory for the binary files.
+        tmpdir = tempfile.mkdtemp()
+
+        try:
+            for fmt, layout in [(17, "matrix"), (8209, "[X,C]"), (4113, "[X,Y,C]")]:
+                for datatype in ["i16", "u32", "double"]:
+
+                    ## The records for the file.
+                    records = np.zeros(256 * 256 if fmt == 17 else len(Xs), dtype=getBinaryDtype(fmt, datatype))
+                    if fmt == 17:
+                        records[Xs] = Cs
+                    elif fmt == 8209:
+                        records["X"] = Xs; records["C"] = Cs
+                    else:
+                        records["x"] = Xs % 256; records["y"] = Xs // 256; records["C"] = Cs
+
+                    fn = os.path.join(tmpdir, "data.bin")
+                    records.tofile(fn)
+
+                    ## The DSC type line.
+                    typeline = "Type=%s %s width=256 height=256" % (datatype, layout)
+
+                    with open(fn + ".dsc", "w") as f:
+                        f.write("A000000001\r\n[F0]\r\n%s\r\n" % (typeline))
+
+                    # The tests
+                    #-----------
+                    self.assertEqual(getBinaryFormat(os.path.getsize(fn), typeline), fmt)
+                    self.assertEqual(getFormat(fn), fmt)
+                    self.assertEqual(getPixelMap(*readDataFile(fn, fmt, 256, 256, datatype)), self.pixelmap)
+                    #
+                    # The same, through the memory map used by the datasets.
+                    buf, st = readFile(fn, mapped=True)
+                    self.assertTrue(isinstance(buf, mmap.mmap))
+                    self.assertEqual(getPixelMap(*parseDataBuffer(buf, fmt, 256, 256, datatype)), self.pixelmap)
+                    buf.close()
+            #
+            # A truncated matrix, and an unknown data type.
+            self.assertEqual(getBinaryFormat(1000, "Type=i16 matrix width=256 height=256"), 0)
+            self.assertEqual(getBinaryFormat(1000, "Type=u8 [X,C] width=256 height=256"), 0)
+            self.assertRaises(IOError, parseTypeLine, "[F0]")
+            self.assertEqual(parseTypeLine("Type=i16 [X,Y,C] width=256 height=256"), ("i16", "[X,Y,C]", 256, 256))
+            #
+            # An empty sparse frame.
+            open(fn, "w").close()
+            self.assertEqual(len(readDataFile(fn, 4113, 256, 256, "i16")[0]), 0)
+
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_binary_dataset(self):
+
+        ## The temporary directory for the binary dataset.
+        tmpdir = tempfile.mkdtemp()
+
+        try:
+            # Write the test data as binary [x, y, C] files (the DSC files are unchanged).
+            for fn in self.datafilenames:
+
+                Xs, Cs = readDataFile(fn, 4114, 256, 256)
+
+                records = np.zeros(len(Xs), dtype=getBinaryDtype(4113, "i16"))
+                records["x"] = Xs % 256; records["y"] = Xs // 256; records["C"] = Cs
+                records.tofile(os.path.join(tmpdir, os.path.basename(fn)))
+
+                shutil.copy(fn + ".dsc", tmpdir)
+
+            ## The binary and ASCII datasets.
+            bds = Dataset(tmpdir)
+            ads = Dataset("testdata/ASCIIxyC")
+
+            # The tests
+            #-----------
+            self.assertEqual(bds.getNumberOfDataFiles(), len(self.datafilenames))
+            self.assertEqual(sorted(set(bds.datfileformats.values())), [4113])
+            for bdf, adf in zip(bds.dscfiles, ads.dscfiles):
+                self.assertEqual(bdf.getPixelMap(), adf.getPixelMap())
+            #
+            # A dataset mixing binary and ASCII files is rejected.
+            shutil.copy(self.datafilenames[0], os.path.join(tmpdir, "ascii.txt"))
+            shutil.copy(self.datafilenames[0] + ".dsc", os.path.join(tmpdir, "ascii.txt.dsc"))
+            self.assertRaises(IOError, Dataset, tmpdir)
+
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+
+    lg.basicConfig(filename='log_test_readers.txt', filemode='w', level=lg.DEBUG)
+
+    lg.info("")
+    lg.info("=================================================")
+    lg.info(" Logger output from cernatschool/test_readers.py ")
+    lg.info("=================================================")
+    lg.info("")
+
+    unittest.main()
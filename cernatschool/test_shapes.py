@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#...the usual suspects.
+import os, inspect
+
+#...for the unit testing.
+import unittest
+
+#...for the logging.
+import logging as lg
+
+#...for the MATH.
+import numpy as np
+
+#...for the Pixelman dataset wrapper.
+from dataset import Dataset
+
+#...for the klusters.
+from kluster import KlusterFinder
+
+#...for the labelling engines.
+from labelling import ENGINES, getHitArrays, labelSparse
+
+#...for the small cluster shapes.
+from shapes import SMALL_SHAPES, SHAPE_TABLE, NO_SHAPE, getShapeCode, getShapeCodes
+
+class ShapesTest(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_small_shapes(self):
+
+        ## The number of shapes of each size.
+        ns = [len([code for code, v in SMALL_SHAPES.iteritems() if v[0] == npix]) for npix in range(1, 5)]
+
+        ## The number of gamma candidate shapes of each size.
+        gs = [len([code for code, v in SMALL_SHAPES.iteritems() if v[0] == npix and v[2]]) for npix in range(1, 5)]
+
+        # The tests
+        #-----------
+        #
+        # The number of (fixed) 8-connected shapes with 1-4 pixels.
+        self.assertEqual(ns, [1, 4, 20, 110])
+        #
+        # All mono- and bipixels; the L-shaped tripixels; the square tetrapixel.
+        self.assertEqual(gs, [1, 4, 4, 1])
+        self.assertEqual(SHAPE_TABLE[getShapeCode([0, 1, 256, 257], 256)], 1)
+        self.assertEqual(SHAPE_TABLE[getShapeCode([0, 1, 2], 256)], 0)
+        #
+        # Too big, or too far apart, to have a shape code.
+        self.assertEqual(getShapeCode(range(5), 256), NO_SHAPE)
+        self.assertEqual(getShapeCode([0, 4], 256), NO_SHAPE)
+        self.assertEqual(SHAPE_TABLE[NO_SHAPE], -1)
+
+    def test_shape_codes(self):
+
+        ## The frames from the test dataset.
+        frames = Dataset("testdata/ASCIIxyC").getFrames((51.509915, -0.142515, 34.02), skipclustering=True)
+
+        for f in frames:
+
+            Xs, Cs = getHitArrays(f.getPixelMap())
+
+            labels, groups = labelSparse(Xs, 256, 256)
+
+            # The tests
+            #-----------
+            self.assertEqual(list(getShapeCodes(Xs, labels, 256, len(groups))), [getShapeCode(g, 256) for g in groups])
+
+    def test_skip_gammas(self):
+
+        ## The first frame from the test dataset.
+        f = Dataset("testdata/ASCIIxyC").getFrames((51.509915, -0.142515, 34.02), skipclustering=True)[0]
+
+        for engine in ["legacy"] + sorted(ENGINES.keys()):
+
+            kf_all = KlusterFinder(f.getPixelMap(), 256, 256, False, engine=engine)
+
+            kf = KlusterFinder(f.getPixelMap(), 256, 256, False, engine=engine, gammas=False)
+
+            # The tests
+            #-----------
+            self.assertFalse(kf.keepsGammas())
+            self.assertEqual(kf.getNumberOfKlusters(), kf_all.getNumberOfKlusters())
+            self.assertEqual(kf.getNumberOfGammas(), kf_all.getNumberOfGammas())
+            self.assertEqual(kf.getNumberOfTripixelGammas(), kf_all.getNumberOfTripixelGammas())
+            self.assertEqual(kf.getNumberOfTetrapixelGammas(), kf_all.getNumberOfTetrapixelGammas())
+            #
+            # Only the non-gamma clusters have been built.
+            self.assertEqual(len(kf.getListOfKlusters()), kf.getNumberOfKlusters() - kf.getNumberOfGammas())
+            self.assertEqual(len([k for k in kf.getListOfKlusters() if k.isGamma()]), 0)
+            self.assertEqual(len([k for k in kf_all.getListOfKlusters() if k.isGamma()]), kf_all.getNumberOfGammas())
+
+    def test_gap_tolerant_gammas(self):
+
+        ## A "bipixel" with a gap - not an 8-connected shape.
+        pixelmap = {(256 * 100) + 100 : 1, (256 * 100) + 102 : 1}
+
+        kf = KlusterFinder(pixelmap, 256, 256, False, radius=2.0)
+
+        # The tests
+        #-----------
+        self.assertEqual(kf.getNumberOfKlusters(), 1)
+        self.assertEqual(kf.getNumberOfBipixels(), 1)
+
+
+if __name__ == "__main__":
+
+    lg.basicConfig(filename='log_test_shapes.txt', filemode='w', level=lg.DEBUG)
+
+    lg.info("")
+    lg.info("=================================================")
+    lg.info(" Logger output from cernatschool/test_shapes.py ")
+    lg.info("=================================================")
+    lg.info("")
+
+    unittest.main()
@@ -24,12 +24,23 @@ def getKlusterPropertiesJson(klusterid, k):
         "y_uw"          : k.getYUW(),                 \
         "radius_uw"     : k.getRadiusUW(),            \
         "density_uw"    : k.getDensityUW(),           \
+        "x_w"           : k.getXW(),                  \
+        "y_w"           : k.getYW(),                  \
+        "radius_w"      : k.getRadiusW(),             \
+        "density_w"     : k.getDensityW(),            \
         "totalcounts"   : k.getTotalCounts(),         \
         "maxcounts"     : k.getMaxCountValue(),       \
         "lin_m"         : m,                          \
         "lin_c"         : c,                          \
         "lin_sumofres"  : sumR,                       \
         "lin_linearity" : k.getLinearity(),           \
+        "eccentricity"  : k.getEccentricity(),        \
+        "orientation"   : k.getOrientation(),         \
+        "axis_major"    : k.getMajorAxisLength(),     \
+        "axis_minor"    : k.getMinorAxisLength(),     \
+        "hull_area"     : k.getHullArea(),            \
+        "hull_perimeter": k.getHullPerimeter(),       \
+        "bbox_fill"     : k.getBoundingBoxFill(),     \
         "n_edgepixels"  : k.getNumberOfEdgePixels(),  \
         "edgefrac"      : k.getOuterPixelFraction(),  \
         "innerfrac"     : k.getInnerPixelFraction(),  \
@@ -40,4 +51,5 @@ def getKlusterPropertiesJson(klusterid, k):
         #"frameid"       :\
         }
 
-    return p
+    # Leave out the properties that weren't calculated.
+    return dict((key, value) for key, value in p.iteritems() if value is not None)
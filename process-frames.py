@@ -27,6 +27,21 @@ import json
 #...for processing the datasets.
 from cernatschool.dataset import Dataset
 
+#...for the clustering engines.
+from cernatschool.labelling import ENGINES, AUTO_ENGINE, getEngineThresholds
+
+#...for the (optional) compiled kernels.
+from cernatschool import kernels
+
+#...for the pixel masks.
+from cernatschool.masks import MaskRegistry
+
+#...for the DSC header cache.
+from cernatschool.dscheader import DscHeaderCache
+
+#...for choosing the cluster properties to calculate.
+from cernatschool.properties import getPropertyClosure, getTypeProperties
+
 #...for the histograms.
 #from plotting import Hist, Hist2D
 
@@ -50,8 +65,41 @@ if __name__ == "__main__":
     parser.add_argument("outputPath",      help="The path for the output files.")
     parser.add_argument("-v", "--verbose", help="Increase output verbosity", action="store_true")
     parser.add_argument("-g", "--gamma",   help="Process gamma candidates too", action="store_true")
+    parser.add_argument("-e", "--engine",  help="The clustering engine", default="legacy", choices=["legacy", AUTO_ENGINE] + sorted(ENGINES.keys()))
+    parser.add_argument("-c", "--connectivity", help="The pixel connectivity", type=int, default=8, choices=[4, 8])
+    parser.add_argument("-r", "--radius",  help="Join hits within this distance [pixels] (always uses the spatialhash engine, whatever -e says)", type=float, default=None)
+    parser.add_argument("-t", "--threshold", help="Set an engine choice threshold for '-e auto' (NAME=VALUE)", action="append", default=[])
+    parser.add_argument("-b", "--backend", help="The kernel backend (default: numba if installed)", default=None, choices=kernels.BACKENDS)
+    parser.add_argument("-p", "--properties", help="Only calculate these cluster properties (comma-separated names)", default=None)
+    parser.add_argument("--types",         help="Only calculate the cluster properties used by this particle type JSON", default=None)
+    parser.add_argument("-m", "--masks",   help="Path to the pixel mask registry JSON (updated with any hot pixels found)", default=None)
+    parser.add_argument("--headers",       help="Path to the DSC header cache JSON (created or updated)", default=None)
     args = parser.parse_args()
 
+    ## The engine choice thresholds to change {name:value}.
+    thresholds = {}
+    for t in args.threshold:
+        name, value = t.split("=")
+        thresholds[name] = float(value)
+
+    # Check the threshold names before we start.
+    getEngineThresholds(thresholds)
+
+    ## The names of the cluster properties to calculate (None for all of them).
+    properties = None
+    if args.properties is not None:
+        properties = args.properties.split(",")
+    if args.types is not None:
+        with open(args.types, "r") as tf:
+            properties = (properties or []) + getTypeProperties(json.load(tf))
+
+    # Check the property names before we start.
+    getPropertyClosure(properties)
+
+    # Choose the kernel backend (if asked to).
+    if args.backend is not None:
+        kernels.setBackend(args.backend)
+
     ## The path to the data file.
     datapath = args.inputPath
 
@@ -74,6 +122,20 @@ if __name__ == "__main__":
         print("* Gamma candidate clusters WILL be processed.")
     else:
         print("* Gamma candidate clusters WILL NOT be processed.")
+    print("* Clustering engine   : '%s'" % (args.engine))
+    if args.engine == AUTO_ENGINE:
+        for name, value in sorted(getEngineThresholds(thresholds).iteritems()):
+            print("*--> %-19s: %g" % (name, value))
+    print("* Kernel backend      : '%s'" % (kernels.getBackend()))
+    if properties is not None:
+        print("* Cluster properties  : %s" % (", ".join(sorted(getPropertyClosure(properties)))))
+    print("* Connectivity        : %d" % (args.connectivity))
+    if args.radius is not None:
+        print("* Joining radius      : %f [pixels]" % (args.radius))
+    if args.masks is not None:
+        print("* Mask registry       : '%s'" % (args.masks))
+    if args.headers is not None:
+        print("* DSC header cache    : '%s'" % (args.headers))
     print("*")
 
 
@@ -106,8 +168,30 @@ if __name__ == "__main__":
     lg.info(" * Creating directory '%s'..." % (klpath))
     lg.info("")
 
-    ## The dataset to process.
-    ds = Dataset(datapath)
+    ## The DSC header cache.
+    headers = None
+    #
+    if args.headers is not None:
+        headers = DscHeaderCache(args.headers)
+
+    ## The dataset to process (each data file is only read when its frame is reached).
+    ds = Dataset(datapath, headers, lazy=True)
+
+    if headers is not None:
+        lg.info(" * %d DSC header(s) from the cache, %d parsed." % (headers.getNumberOfHits(), headers.getNumberOfUpdates()))
+        if headers.getNumberOfUpdates() > 0:
+            headers.save()
+
+    ## The pixel mask registry.
+    masks = None
+    #
+    if args.masks is not None:
+        masks = MaskRegistry(args.masks)
+
+        # Find the hot pixels and remember them for next time.
+        for chipid, n_new in ds.findHotPixels(masks).iteritems():
+            print("* Chip '%s': %d new hot pixel(s) masked." % (chipid, n_new))
+        masks.save()
 
     ## Latitude of the test dataset [deg.].
     lat = 51.509915
@@ -119,9 +203,13 @@ if __name__ == "__main__":
     alt = 34.02
 
     ## The frames from the dataset.
-    frames = ds.getFrames((lat, lon, alt))
+    #
+    # (Objects are only built for the gamma candidates if they are wanted;
+    # they are counted either way.) The frames are read and clustered one
+    # at a time as the loop below reaches them.
+    frames = ds.iterFrames((lat, lon, alt), engine=args.engine, connectivity=args.connectivity, radius=args.radius, gammas=args.gamma, masks=masks, thresholds=thresholds, properties=properties)
 
-    lg.info("* Found %d datafiles:" % (len(frames)))
+    lg.info("* Found %d datafiles:" % (ds.getNumberOfDataFiles()))
 
     ## A list of frames.
     mds = []
@@ -158,12 +246,18 @@ if __name__ == "__main__":
             "acqtime"     : f.getAcqTime(),
             #
             "n_pixel"     : f.getNumberOfUnmaskedPixels(),
+            "n_masked"    : f.getNumberOfMaskedPixels(),
             "occ"         : f.getOccupancy(),
             "occ_pc"      : f.getOccupancyPc(),
             #
             "n_kluster"   : f.getNumberOfKlusters(),
             "n_gamma"     : f.getNumberOfGammas(),
             "n_non_gamma" : f.getNumberOfNonGammas(),
+            "engine"      : f.getKlusterFinder().getEngine(),
+            "engine_thresholds" : f.getKlusterFinder().getEngineThresholds(),
+            "connectivity": f.getConnectivity(),
+            "radius"      : f.getRadius(),
+            "backend"     : f.getKlusterFinder().getBackend(),
             #
             "ismc"        : int(f.isMC())
             }
@@ -23,6 +23,9 @@ import json
 # Import the plotting libraries.
 import pylab as plt
 
+#...for the optional cuts a type can define, and the properties they need.
+from cernatschool.properties import OPTIONAL_TYPE_CUTS, getTypeProperties
+
 #from matplotlib import rc
 
 # Uncomment to use LaTeX for the plot text.
@@ -87,6 +90,27 @@ if __name__=="__main__":
     with open(typepath, "r") as tf:
         types = json.load(tf)
 
+    # Check that the clusters have all of the properties the types use -
+    # properties that weren't calculated (see process-frames.py -p) are
+    # left out of the cluster JSON.
+
+    ## The properties the types use.
+    typeprops = getTypeProperties(types)
+
+    ## The properties missing from the clusters { property:number of clusters }.
+    missing = {}
+    #
+    for k in kd:
+        for prop in typeprops:
+            if prop not in k:
+                missing[prop] = missing.get(prop, 0) + 1
+    #
+    if len(missing) > 0:
+        for prop, n in sorted(missing.iteritems()):
+            lg.error(" * '%s' is missing from %d cluster(s)." % (prop, n))
+        raise IOError("* ERROR! The clusters in '%s' are missing properties used by the types: %s (re-run process-frames.py with --types '%s')." \
+            % (kluster_properties_path, ", ".join(sorted(missing.keys())), typepath))
+
     # Create the sorting directories.
 
     ## The path to the sorted cluster directory.
@@ -152,6 +176,15 @@ if __name__=="__main__":
         lg.info(" *--> Radius        : %8.2f [pixels]" % (k["radius_uw"]))
         lg.info(" *--> Density       : %8.2f [pixels^-1]" % (k["density_uw"]))
         lg.info(" *--> Linearity     : %8.2f" % (k["lin_linearity"]))
+        if "radius_w" in k:
+            lg.info(" *--> Radius (w)    : %8.2f [pixels]" % (k["radius_w"]))
+        if "density_w" in k:
+            lg.info(" *--> Count density : %8.2f [counts pixels^-2]" % (k["density_w"]))
+        if "eccentricity" in k:
+            lg.info(" *--> Eccentricity  : %8.2f" % (k["eccentricity"]))
+            lg.info(" *--> Orientation   : %8.2f [deg.]" % (k["orientation"]))
+            lg.info(" *--> Hull area     : %8.2f [pixels^2]" % (k["hull_area"]))
+            lg.info(" *--> Box fill      : %8.2f" % (k["bbox_fill"]))
         lg.info(" *")
 
         # Check if the cluster is on the edge of the frame.
@@ -185,6 +218,16 @@ if __name__=="__main__":
                 mxc_min = vals["mxc_min"]
                 mxc_max = vals["mxc_max"]
 
+                # Does the cluster pass the optional cuts the type defines?
+                passes_optional = True
+                for cut, prop in OPTIONAL_TYPE_CUTS.iteritems():
+                    if cut + "_min" not in vals and cut + "_max" not in vals:
+                        continue
+                    value = k[prop]
+                    if value < vals.get(cut + "_min", float("-inf")) or value > vals.get(cut + "_max", float("inf")):
+                        passes_optional = False
+                        break
+
                 #
                 # If it isn't, check if it matches the current type.
                 if (k["size"] >= size_min) and (k["size"] <= size_max) and \
@@ -193,7 +236,8 @@ if __name__=="__main__":
                    (k["density_uw"] >= rho_min) and (k["density_uw"] <= rho_max) and \
                    (k["innerfrac"] >= inr_min) and (k["innerfrac"] <= inr_max) and \
                    (k["totalcounts"] >= ttc_min) and (k["totalcounts"] <= ttc_max) and \
-                   (k["maxcounts"] >= mxc_min) and (k["maxcounts"] <= mxc_max):
+                   (k["maxcounts"] >= mxc_min) and (k["maxcounts"] <= mxc_max) and \
+                   passes_optional:
                     lg.info(" *==> Cluster ID '%s' is of type: '%s'." % (k["id"], typename))
                     lg.info(" *")
 